@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# end-to-end benchmark of collection, grouping and scheduling on synthetic archives of several sizes, with results
+# written as JSON to track throughput across versions
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import PathListIO
+import SyntheticArchive
+
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser(description="Benchmark the ensemble scripts on synthetic archives of several sizes")
+parser.add_argument(
+    "--files",
+    nargs="+",
+    type=int,
+    default=[1000, 10000],
+    help="Archive sizes in files to benchmark, rounded up to whole models (default: 1000 10000)",
+)
+parser.add_argument(
+    "--convention",
+    nargs="+",
+    type=str,
+    default=["isimip3b", "cmip6"],
+    choices=sorted(SyntheticArchive.FILENAMES),
+    help="Naming conventions of the archives (default: isimip3b cmip6)",
+)
+parser.add_argument("--depth", type=int, default=2, help="Directory levels of the archives (default: 2)")
+parser.add_argument("--repeat", type=int, default=3, help="Repetitions per benchmark, best is reported (default: 3)")
+parser.add_argument(
+    "--submit-workers", type=int, default=8, help="Concurrent sbatch calls of the submission benchmark (default: 8)"
+)
+parser.add_argument(
+    "--sbatch-latency", type=float, default=0.0, help="Seconds each stub sbatch call takes (default: 0)"
+)
+parser.add_argument(
+    "--dir",
+    type=str,
+    help="Directory to create the archives in, e.g. on the parallel filesystem (default: temporary directory)",
+)
+parser.add_argument(
+    "--output",
+    type=str,
+    default="benchmark.json",
+    help="JSON file the results are written to (default: benchmark.json)",
+)
+parser.add_argument("--keep", action="store_true", help="keep archives and generated files after benchmark")
+args = parser.parse_args()
+
+
+def version():
+    """Commit of this checkout, None outside of a git repository."""
+    try:
+        p = subprocess.run(
+            ["git", "-C", SCRIPTDIR, "describe", "--always", "--dirty"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+    except OSError:
+        return None
+    return p.stdout.strip() or None
+
+
+def span_seconds(trace):
+    """{span name: total seconds} of a trace written with --profile, see Instrumentation.py."""
+    with open(trace, "r") as f:
+        events = json.load(f)["traceEvents"]
+    seconds = {}
+    for event in events:
+        if event["ph"] == "X":
+            seconds[event["name"]] = seconds.get(event["name"], 0.0) + event["dur"] / 1e6
+    return seconds
+
+
+def clean_runs(settingsdir):
+    # run directories and state of previous scheduling benchmarks, runs with existing directories are skipped
+    for path in glob.glob(os.path.join(settingsdir, "*_run_*")):
+        shutil.rmtree(path)
+    for path in glob.glob(os.path.join(settingsdir, "runs.sqlite*")):
+        os.remove(path)
+
+
+def run_script(script, script_args, workdir, env, answer=None):
+    """Run one of the scripts with --profile, return (seconds, {span: seconds})."""
+    trace = os.path.join(workdir, "trace.json")
+    cmd = [sys.executable, os.path.join(SCRIPTDIR, script)] + script_args + ["--profile", trace]
+    start = time.perf_counter()
+    p = subprocess.run(
+        cmd, input=answer, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, env=env
+    )
+    seconds = time.perf_counter() - start
+    if p.returncode != 0:
+        print(p.stdout)
+        exit("{} failed".format(" ".join(cmd)))
+    return seconds, span_seconds(trace)
+
+
+def best_of(repeat, benchmark, prepare=None):
+    """Best (seconds, spans) of repeat runs of benchmark, prepare is called before each run."""
+    best = None
+    for _ in range(repeat):
+        if prepare is not None:
+            prepare()
+        result = benchmark()
+        if best is None or result[0] < best[0]:
+            best = result
+    return best
+
+
+root = tempfile.mkdtemp(prefix="benchmarksuite_", dir=args.dir)
+results = []
+try:
+    # stub sbatch records submissions below root
+    env = os.environ.copy()
+    env["PATH"] = os.path.join(SCRIPTDIR, "fake-slurm") + os.pathsep + env.get("PATH", "")
+    env["FAKE_SLURM_DIR"] = os.path.join(root, "fake-slurm")
+    env["FAKE_SBATCH_LATENCY"] = str(args.sbatch_latency)
+    model = os.path.join(root, "model")
+    with open(model, "w") as f:
+        f.write("#!/bin/sh\n")
+    os.chmod(model, 0o755)
+
+    print("{:>10} {:>8} {:>10} {:>8} {:>10} {:>12}".format(
+        "convention", "files", "benchmark", "items", "seconds", "items/s"
+    ))
+    for i_convention in args.convention:
+        for i_files in args.files:
+            archive = os.path.join(root, "{}_{}".format(i_convention, i_files))
+            workdir = archive + "_work"
+            os.makedirs(workdir)
+            models = SyntheticArchive.models_for(i_files)
+            created = SyntheticArchive.generate(archive, i_convention, models=models, depth=args.depth)
+            settingsdir = os.path.join(workdir, "settings")
+            list_of_settings = os.path.join(settingsdir, "list_of_settings.yml")
+            list_of_outputs = os.path.join(workdir, "output", "list_of_outputfiles.yml")
+
+            collect_args = [
+                "--root", archive,
+                "--blueprint", os.path.join(SCRIPTDIR, "blueprint.yml"),
+                "--convention", i_convention,
+                "--searchterms", *SyntheticArchive.VARIABLES,
+                "--scenarios", *SyntheticArchive.SCENARIOS,
+                "--settingsdir", workdir,
+            ]
+            schedule_args = ["--settings", list_of_settings, "--model", model, "--time", "01:00:00"]
+            benchmarks = [
+                ("collect", "PathnameCollectionHelper.py", collect_args, None, None),
+                ("group", "FileListFiltering.py", ["--data", list_of_outputs, "--settings", list_of_settings], None,
+                 None),
+                ("schedule", "SimpleEnsembleSimulation.py", schedule_args + ["--dry"], "y\n",
+                 lambda: clean_runs(settingsdir)),
+                ("submit", "SimpleEnsembleSimulation.py",
+                 schedule_args + ["--submit-workers", str(args.submit_workers)], "y\n",
+                 lambda: clean_runs(settingsdir)),
+            ]
+            members = None
+            for name, script, script_args, answer, prepare in benchmarks:
+                seconds, spans = best_of(
+                    args.repeat, lambda: run_script(script, script_args, workdir, env, answer), prepare
+                )
+                if members is None:
+                    members = sum(1 for _ in PathListIO.read_list(list_of_settings))
+                # files are the items of collection, ensemble members the items of the other benchmarks
+                items = created if name == "collect" else members
+                results.append({
+                    "benchmark": name,
+                    "convention": i_convention,
+                    "files": created,
+                    "members": members,
+                    "items": items,
+                    "seconds": seconds,
+                    "items_per_second": items / seconds,
+                    "spans": spans,
+                })
+                print("{:>10} {:>8} {:>10} {:>8} {:>10.3f} {:>12.0f}".format(
+                    i_convention, created, name, items, seconds, items / seconds
+                ))
+finally:
+    if not args.keep:
+        shutil.rmtree(root)
+
+with open(args.output, "w") as f:
+    json.dump(
+        {
+            "version": version(),
+            "timestamp": datetime.datetime.now().replace(microsecond=0).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+            "results": results,
+        },
+        f,
+        indent=2,
+    )
+print("Results written to {}".format(args.output))
@@ -0,0 +1,104 @@
+# completeness of the scan index over scenario x variable x model x period, as bitmask of variables per combination
+#  imports
+import collections
+
+
+class CompletenessMatrix:
+    """Which variables of a ScanIndex are present for each (scenario, model, period).
+
+    The variables of a combination are stored as bits of an integer, so a combination is complete if its mask
+    covers the mask of the required variables. Only combinations with files are stored, counts of gaps over the
+    dense matrix follow from the counts of present files. The matrix is dense over the models and periods occurring
+    with each scenario, e.g. CMIP6 model identifiers include the experiment and historical periods differ from
+    those of the projections.
+    """
+
+    def __init__(self, index, scenarios=None, variables=None):
+        self.scenarios = list(scenarios if scenarios is not None else index.scenarios)
+        self.variables = list(variables if variables is not None else index.variables)
+        self.models = sorted(index.models)
+        self.periods = sorted(index.timeperiods)
+        self.bits = {variable: 1 << position for position, variable in enumerate(self.variables)}
+        self.masks = collections.defaultdict(int)
+        # models and periods of each scenario, axes of its part of the matrix
+        self.scenario_models = {scenario: set() for scenario in self.scenarios}
+        self.scenario_periods = {scenario: set() for scenario in self.scenarios}
+        for scenario, variable, model, start_year, end_year in index.entries:
+            if scenario not in self.scenario_models:
+                continue
+            self.scenario_models[scenario].add(model)
+            self.scenario_periods[scenario].add((start_year, end_year))
+            bit = self.bits.get(variable)
+            if bit is not None:
+                self.masks[scenario, model, (start_year, end_year)] |= bit
+
+    def mask(self, variables=None):
+        """Bitmask of variables, all variables if None."""
+        if variables is None:
+            variables = self.variables
+        mask = 0
+        for variable in variables:
+            mask |= self.bits[variable]
+        return mask
+
+    def is_complete(self, scenario, model, period, required=None):
+        required_mask = self.mask(required)
+        return self.masks.get((scenario, model, period), 0) & required_mask == required_mask
+
+    def missing(self, scenario, model, period):
+        mask = self.masks.get((scenario, model, period), 0)
+        return [variable for variable in self.variables if not mask & self.bits[variable]]
+
+    def combinations(self, required=None):
+        """Combinations (model, scenario, period) with all required variables, in the order settings are written.
+
+        With required None all variables are required, an empty list of required variables accepts any
+        combination with at least one file.
+        """
+        required_mask = self.mask(required)
+        scenarios = {scenario: position for position, scenario in enumerate(self.scenarios)}
+        return sorted(
+            (
+                (model, scenario, period) for (scenario, model, period), mask in self.masks.items()
+                if mask & required_mask == required_mask
+            ),
+            key=lambda combination: (combination[0], scenarios[combination[1]], combination[2]),
+        )
+
+    def report(self, required=None, limit=20):
+        """Text report of present and missing files per axis and the first limit incomplete combinations."""
+        required_mask = self.mask(required)
+        cells = sum(
+            len(self.scenario_models[scenario]) * len(self.scenario_periods[scenario]) for scenario in self.scenarios
+        )
+        present = collections.Counter()
+        complete = 0
+        for mask in self.masks.values():
+            for variable, bit in self.bits.items():
+                if mask & bit:
+                    present[variable] += 1
+            if mask & required_mask == required_mask:
+                complete += 1
+        lines = [
+            "{} scenarios x {} variables x {} models x {} periods, models and periods per scenario: "
+            "{} of {} files present".format(
+                len(self.scenarios), len(self.variables), len(self.models), len(self.periods),
+                sum(present.values()), cells * len(self.variables),
+            ),
+            "{} of {} combinations complete, {} partial, {} empty".format(
+                complete, cells, len(self.masks) - complete, cells - len(self.masks)
+            ),
+        ]
+        for variable in self.variables:
+            lines.append("    {}: missing for {} combinations".format(variable, cells - present[variable]))
+        incomplete = [
+            (scenario, model, period) for (scenario, model, period), mask in sorted(self.masks.items())
+            if mask & required_mask != required_mask
+        ]
+        for scenario, model, period in incomplete[:limit]:
+            lines.append("    {} {} {}-{}: missing {}".format(
+                scenario, model, period[0], period[1], ", ".join(self.missing(scenario, model, period))
+            ))
+        if len(incomplete) > limit:
+            lines.append("    ... {} more partial combinations".format(len(incomplete) - limit))
+        return "\n".join(lines)
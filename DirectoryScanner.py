@@ -0,0 +1,181 @@
+# single pass directory scanning and indexing of climate data files
+#  imports
+import collections
+import concurrent.futures
+import os
+import time
+
+import Instrumentation
+import NamingConventions
+
+
+def traverse(items, visit, workers=1):
+    """Traverse a tree by calling visit(item) -> (children, result) for every item, return list of results.
+
+    With more than one worker, visits run in a thread pool, which helps on filesystems where listing a directory is
+    dominated by metadata latency. At most two visits per worker are in flight at any time, remaining items wait in a
+    queue owned by the calling thread, so all results are also handled there. Order of results is not defined.
+    """
+    results = []
+    pending = collections.deque(items)
+    if workers <= 1:
+        while pending:
+            children, result = visit(pending.pop())
+            pending.extend(children)
+            results.append(result)
+        return results
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        running = set()
+        while pending or running:
+            while pending and len(running) < 2 * workers:
+                running.add(executor.submit(visit, pending.pop()))
+            done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                children, result = future.result()
+                pending.extend(children)
+                results.append(result)
+    return results
+
+
+def list_directory(directory, suffixes):
+    """Return (subdirectories, files) of directory, files filtered by suffixes."""
+    subdirectories = []
+    files = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                # do not descend into symlinked directories, same as Path.rglob
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.name.endswith(suffixes) and entry.is_file():
+                    files.append(entry)
+    except (PermissionError, FileNotFoundError, NotADirectoryError):
+        pass
+    return subdirectories, files
+
+
+def walk(roots, extensions, workers=1):
+    """Walk directory trees below roots once and return all files with one of the given extensions."""
+    if isinstance(roots, str):
+        roots = [roots]
+    suffixes = tuple("." + extension for extension in extensions)
+
+    def visit(directory):
+        subdirectories, files = list_directory(directory, suffixes)
+        Instrumentation.count("directories listed")
+        return subdirectories, [entry.path for entry in files]
+
+    found = set()
+    for files in traverse(roots, visit, workers=workers):
+        found.update(files)
+    # deterministic order independent of directory listing order and number of workers
+    return sorted(found)
+
+
+class ScanIndex:
+    """Index of files keyed by (scenario, variable, model, start_year, end_year)."""
+
+    def __init__(self, scenarios, variables, convention="cmip6"):
+        self.scenarios = list(scenarios)
+        self.variables = list(variables)
+        self.convention = NamingConventions.get(convention)
+        self.entries = {}
+        self.models = set()
+        self.timeperiods = set()
+        self.unparsed = []
+        self._scenarios = set(self.scenarios)
+        self._variables = set(self.variables)
+
+    def parse(self, filepath):
+        """Return index key for filepath, None if filename cannot be identified or is not searched for."""
+        filename = self.convention.parse(filepath)
+        if filename is None or filename.start_year is None:
+            return None
+        if filename.scenario not in self._scenarios or filename.variable not in self._variables:
+            return None
+        return filename.scenario, filename.variable, filename.model, filename.start_year, filename.end_year
+
+    def insert(self, key, filepath):
+        self.entries[key] = filepath
+        self.models.add(key[2])
+        self.timeperiods.add((key[3], key[4]))
+
+    def add(self, filepath):
+        key = self.parse(filepath)
+        if key is None:
+            self.unparsed.append(filepath)
+        else:
+            self.insert(key, filepath)
+        return key
+
+    def get(self, scenario, variable, model, start_year, end_year):
+        return self.entries.get((scenario, variable, model, start_year, end_year))
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ScanReport:
+    """Timings of a directory scan."""
+
+    def __init__(self):
+        self.files = 0
+        self.indexed = 0
+        self.walk_seconds = 0.0
+        self.index_seconds = 0.0
+        self.workers = 1
+        self.catalog = None
+
+    @property
+    def files_per_second(self):
+        if self.walk_seconds <= 0:
+            return float("inf")
+        return self.files / self.walk_seconds
+
+    def __str__(self):
+        report = (
+            "walked {} files in {:.3f} s ({:.0f} files/s, {} workers)\n"
+            "built index of {} entries in {:.3f} s".format(
+                self.files, self.walk_seconds, self.files_per_second, self.workers, self.indexed, self.index_seconds
+            )
+        )
+        if self.catalog is not None:
+            report += "\nlisted {} directories, reused {} unchanged directories from catalog {}".format(
+                self.catalog.listed_directories, self.catalog.reused_directories, self.catalog.path
+            )
+        return report
+
+
+def scan(roots, extensions, scenarios, variables, convention="cmip6", catalog=None, workers=1):
+    """Walk roots once, parse every filename once and return (ScanIndex, ScanReport).
+
+    If a FileCatalog is given, unchanged directories and already parsed filenames are taken from it.
+    """
+    report = ScanReport()
+    report.catalog = catalog
+    report.workers = workers
+    start = time.perf_counter()
+    with Instrumentation.span("walk", workers=workers):
+        if catalog is None:
+            filepaths = walk(roots, extensions, workers=workers)
+        else:
+            filepaths = catalog.walk(roots, extensions, workers=workers)
+    report.walk_seconds = time.perf_counter() - start
+    report.files = len(filepaths)
+    Instrumentation.count("files scanned", report.files)
+
+    start = time.perf_counter()
+    with Instrumentation.span("index", convention=convention):
+        if catalog is None:
+            index = ScanIndex(scenarios, variables, convention=convention)
+            for filepath in filepaths:
+                index.add(filepath)
+        else:
+            index = catalog.index(filepaths, scenarios, variables, convention=convention)
+    report.index_seconds = time.perf_counter() - start
+    report.indexed = len(index)
+    Instrumentation.count("files indexed", report.indexed)
+    return index, report
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# packing of short ensemble members into node sized bundles and execution of a bundle within its core budget
+
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+
+import LocalExecutor
+import RunTelemetry
+
+
+def member(run_label, settings, cpus, memory, seconds):
+    """Ensemble member with estimated cpus, memory in MB and runtime in seconds."""
+    return {"run_label": run_label, "settings": settings, "cpus": cpus, "memory": memory, "seconds": seconds}
+
+
+def _bundle(cpus, memory):
+    return {"members": [], "area": 0, "now": 0, "end": 0, "cpus": cpus, "memory": memory, "running": []}
+
+
+def _start(bundle, member):
+    """Start time of member appended to the schedule of bundle and (free cpus, free memory, running) at that time.
+
+    Members of a bundle start in order, each as soon as cores and memory are free but not before the one before it.
+    running is the heap of bundle if member starts right away, a copy with the members finished until then otherwise.
+    """
+    now, free_cpus, free_memory, running = bundle["now"], bundle["cpus"], bundle["memory"], bundle["running"]
+    fits = member["cpus"] <= free_cpus and member["memory"] <= free_memory
+    if not fits and running:
+        running = list(running)
+        # oversized members still run, alone
+        while running and not (member["cpus"] <= free_cpus and member["memory"] <= free_memory):
+            finish, finished_cpus, finished_memory = heapq.heappop(running)
+            now = finish
+            free_cpus += finished_cpus
+            free_memory += finished_memory
+    return now, free_cpus, free_memory, running
+
+
+def _add(bundle, member, start):
+    bundle["now"], free_cpus, free_memory, bundle["running"] = start
+    finish = bundle["now"] + member["seconds"]
+    heapq.heappush(bundle["running"], (finish, member["cpus"], member["memory"]))
+    bundle["cpus"] = free_cpus - member["cpus"]
+    bundle["memory"] = free_memory - member["memory"]
+    bundle["area"] += member["cpus"] * member["seconds"]
+    bundle["end"] = max(bundle["end"], finish)
+    bundle["members"].append(member)
+
+
+def makespan(members, cpus, memory):
+    """Simulated runtime of members started in order as soon as cores and memory are free, see run_bundle."""
+    bundle = _bundle(cpus, memory)
+    for i_member in members:
+        _add(bundle, i_member, _start(bundle, i_member))
+    return bundle["end"]
+
+
+def pack(members, cpus, memory, seconds):
+    """Bin members into bundles fitting on nodes with cpus cores and memory MB within seconds of wall time.
+
+    First fit decreasing on core seconds, a member is only added to a bundle if it finishes within the wall time when
+    started after the members added before, the order run_bundle starts them in. Each bundle keeps its core seconds
+    and the finish times of its running members, so adding a member does not simulate the bundle again. Returns list
+    of bundles, each a list of members.
+    """
+    bundles = []
+    for i_member in sorted(members, key=lambda m: m["cpus"] * m["seconds"], reverse=True):
+        for bundle in bundles:
+            if (bundle["area"] + i_member["cpus"] * i_member["seconds"] > cpus * seconds
+                    or bundle["now"] + i_member["seconds"] > seconds):
+                continue
+            start = _start(bundle, i_member)
+            if start[0] + i_member["seconds"] <= seconds:
+                break
+        else:
+            bundle = _bundle(cpus, memory)
+            bundles.append(bundle)
+            start = _start(bundle, i_member)
+        _add(bundle, i_member, start)
+    return [bundle["members"] for bundle in bundles]
+
+
+def run_bundle(
+        members,
+        cpus,
+        memory,
+        model,
+        python=False,
+        logname="local",
+        verbose=False,
+        telemetry=False,
+        stage=None,
+        stage_capacity=50000,
+):
+    """Run members via local-model concurrently within cpus cores and memory MB, return {run_label: exit code}.
+
+    Members start in the given order, see pack. Each member gets OMP_NUM_THREADS set to its cpus and logs to
+    <run_label>/<logname>.txt, with telemetry its resource usage is recorded in <run_label>/telemetry.json. With stage
+    the members share a node-local staging cache in this directory.
+    """
+    tasks = [
+        LocalExecutor.task(
+            i_member["run_label"],
+            LocalExecutor.local_model_command(
+                model,
+                i_member["run_label"],
+                i_member["settings"],
+                python=python,
+                telemetry=os.path.join(i_member["run_label"], RunTelemetry.TELEMETRY_FILE) if telemetry else None,
+                stage=stage,
+                stage_capacity=stage_capacity,
+            ),
+            i_member["run_label"],
+            os.path.join(i_member["run_label"], logname + ".txt"),
+            cpus=i_member["cpus"],
+            memory=i_member["memory"],
+        )
+        for i_member in members
+    ]
+    return LocalExecutor.LocalExecutor(cpus, memory=memory, verbose=verbose, in_order=True).run(tasks)
+
+
+def write_bundle(
+        filepath, members, cpus, memory, model, python=False, telemetry=False, stage=None, stage_capacity=50000
+):
+    with open(filepath, "w") as stream:
+        json.dump(
+            {"model": model, "python": python, "telemetry": telemetry, "stage": stage, "stage_capacity": stage_capacity,
+             "cpus": cpus, "memory": memory, "members": members},
+            stream,
+            indent=1,
+        )
+
+
+def read_bundle(filepath):
+    with open(filepath, "r") as stream:
+        return json.load(stream)
+
+
+if __name__ == "__main__":
+    # run a bundle written by SimpleEnsembleSimulation.py --pack, e.g. within its Slurm allocation
+    parser = argparse.ArgumentParser(description="Run a bundle of ensemble members within a core and memory budget")
+    parser.add_argument("bundle", type=str, help="Bundle file written by SimpleEnsembleSimulation.py --pack")
+    parser.add_argument("--verbose", action="store_true", help="be verbose")
+    args = parser.parse_args()
+
+    bundle = read_bundle(args.bundle)
+    start = time.time()
+    exitcodes = run_bundle(
+        bundle["members"],
+        bundle["cpus"],
+        bundle["memory"],
+        bundle["model"],
+        python=bundle["python"],
+        logname=os.environ.get("SLURM_JOB_ID", "local"),
+        verbose=args.verbose,
+        telemetry=bundle.get("telemetry", False),
+        stage=bundle.get("stage"),
+        stage_capacity=bundle.get("stage_capacity", 50000),
+    )
+    failed = [run_label for run_label, exitcode in exitcodes.items() if exitcode != 0]
+    print("{} members finished in {:.0f} s, {} failed".format(len(exitcodes), time.time() - start, len(failed)))
+    for run_label in failed:
+        print("FAILED({}) {}".format(exitcodes[run_label], run_label))
+    sys.exit(1 if failed else 0)
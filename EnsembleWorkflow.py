@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# workflow of an ensemble as DAG of stages: collect settings, run the members of each model, aggregate the outputs of
+# each model as soon as its members finished and finally analyse the outputs of the whole ensemble
+
+import argparse
+import os
+import re
+import shlex
+import subprocess
+import sys
+
+import FileCatalog
+import NamingConventions
+import PathListIO
+import SlurmJobs
+
+
+def model_groups(settings, outputs):
+    """{model: (indices of settings files in settings, output files)} of the members of each model and scenario,
+    keyed by the model identifier of their outputs, see NamingConventions.output_model."""
+    groups = {}
+    for convention, items, position in (
+            ("settings", list(enumerate(settings)), 0), ("output", [(path, path) for path in outputs], 1)):
+        for item, path in items:
+            filename = NamingConventions.parse(path, convention)
+            if filename is None:
+                print("{} not following {} naming conventions, skipped".format(path, convention))
+                continue
+            model = filename.model
+            if convention == "settings":
+                model = NamingConventions.output_model(filename.model, filename.scenario)
+            groups.setdefault(model, ([], []))[position].append(item)
+    return groups
+
+
+def substitute(command, **values):
+    """command with each {name} replaced by its shell-quoted value, other braces are left as they are."""
+    for name, value in values.items():
+        command = command.replace("{" + name + "}", shlex.quote(value))
+    return command
+
+
+def dag(models, final=False):
+    """Stages of the workflow as {stage: [stages it depends on]}, in an order respecting the dependencies."""
+    stages = {"collect": []}
+    for i_model in models:
+        stages["members_" + i_model] = ["collect"]
+        stages["aggregate_" + i_model] = ["members_" + i_model]
+    if final:
+        stages["final"] = ["aggregate_" + i_model for i_model in models]
+    return stages
+
+
+def members_command(catalog, indices, run_args, local=False, jobs=1):
+    # whole list of the catalog with the members of a model selected, so run labels are those of a run without workflow
+    cmd = [
+        sys.executable,
+        os.path.join(SlurmJobs.SCRIPTDIR, "SimpleEnsembleSimulation.py"),
+        "--catalog",
+        catalog,
+        "--members",
+        SlurmJobs.array_spec(indices),
+    ]
+    cmd += run_args
+    if local:
+        cmd += ["--local", "--jobs", str(jobs)]
+    else:
+        cmd += ["--array"]
+    return cmd
+
+
+def aggregate_script(datafile, analysis=None, model=None):
+    """Shell commands grouping the outputs of datafile by model and running analysis on them."""
+    script = '"{}" "{}" --data "{}"\n'.format(
+        sys.executable, os.path.join(SlurmJobs.SCRIPTDIR, "FileListFiltering.py"), datafile
+    )
+    if analysis:
+        script += substitute(analysis, model=model, data=datafile) + "\n"
+    return script
+
+
+def run_members(cmd, dry=False):
+    """Run SimpleEnsembleSimulation.py confirming its question, return (exit code, job ids of its arrays)."""
+    print(" ".join(shlex.quote(part) for part in cmd))
+    if dry:
+        return 0, []
+    p = subprocess.run(cmd, input="y\n", stdout=subprocess.PIPE, universal_newlines=True)
+    print(p.stdout, end="")
+    # members beyond the maximum array size are submitted as several arrays
+    return p.returncode, re.findall(r"Job ID: (\d+) with", p.stdout)
+
+
+def submit_stage(name, script, workflowdir, dependency, args):
+    """Submit shell commands of a stage as job starting after dependency, return job id or None."""
+    header = SlurmJobs.slurm_header(
+        jobname=name,
+        queue=args.queue,
+        partition=args.partition,
+        output=f"{workflowdir}/{name}_%j.txt",
+        time=args.aggregate_time,
+        cpus=1,
+        memory=args.aggregate_memory,
+        dependency=dependency,
+    )
+    batch = f"""#!/usr/bin/env bash
+{header}set -e
+{script}"""
+    if args.verbose or args.dry:
+        print(batch)
+    if args.dry:
+        return None
+    jobid = SlurmJobs.submit(batch)
+    print(f"{name}: Job ID: {jobid}")
+    return jobid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run collection, members and aggregation of an ensemble as workflow")
+    parser.add_argument(
+        "--catalog",
+        type=str,
+        required=True,
+        help="File catalog with the lists of settings and output files written by PathnameCollectionHelper.py",
+    )
+    parser.add_argument(
+        "--collect",
+        type=str,
+        help="Arguments of PathnameCollectionHelper.py, run first to (re)generate settings (default: use catalog)",
+    )
+    parser.add_argument(
+        "--run",
+        type=str,
+        default="",
+        help="Arguments of SimpleEnsembleSimulation.py for the members, e.g. \"--time 4:00:00 --model ./model\"",
+    )
+    parser.add_argument(
+        "--analysis",
+        type=str,
+        help="Shell command run per model after its outputs are grouped, {model} and {data} (list of outputs) are "
+             "replaced shell-quoted",
+    )
+    parser.add_argument(
+        "--final",
+        type=str,
+        help="Shell command run after all models are aggregated, {data} (list of all outputs) is replaced shell-quoted",
+    )
+    parser.add_argument("--local", action="store_true", help="run locally, not on cluster")
+    parser.add_argument("--jobs", type=int, default=1, help="with --local, number of members run concurrently")
+    parser.add_argument("--queue", type=str, default="short", help="queue of aggregation jobs on the cluster")
+    parser.add_argument("--partition", type=str, default="standard", help="partition of aggregation jobs")
+    parser.add_argument(
+        "--aggregate-time", type=str, default="01:00:00", help="Max runtime of aggregation jobs (default: 01:00:00)"
+    )
+    parser.add_argument(
+        "--aggregate-memory", type=int, default=4000, help="RAM of aggregation jobs in MB (default: 4000)"
+    )
+    parser.add_argument("--dry", action="store_true", help="print stages and jobs without running them")
+    parser.add_argument("--verbose", action="store_true", help="be verbose")
+    args = parser.parse_args()
+    args.catalog = os.path.abspath(args.catalog)
+
+    # collection runs before everything else, its lists determine the members of the workflow
+    if args.collect is not None:
+        cmd = [sys.executable, os.path.join(SlurmJobs.SCRIPTDIR, "PathnameCollectionHelper.py")]
+        cmd += shlex.split(args.collect) + ["--catalog", args.catalog]
+        print(" ".join(shlex.quote(part) for part in cmd))
+        if not args.dry and subprocess.call(cmd) != 0:
+            exit("Collection failed")
+    if not os.path.exists(args.catalog):
+        exit("File catalog '{}' not found".format(args.catalog))
+    with FileCatalog.FileCatalog(args.catalog) as catalog:
+        settingsdir, settings = catalog.load_list("settings")
+        outputdir, outputs = catalog.load_list("outputfiles")
+
+    groups = model_groups(settings, outputs)
+    models = sorted(groups)
+    stages = dag(models, final=bool(args.final))
+    for stage, after in stages.items():
+        print("{}{}".format(stage, " after " + ", ".join(after) if after else ""))
+
+    # lists of outputs per model, members are selected from the list of settings by index
+    workflowdir = os.path.join(settingsdir, "workflow")
+    os.makedirs(workflowdir, exist_ok=True)
+    datafile = os.path.join(workflowdir, "outputs.txt")
+    PathListIO.write_list(datafile, outputs)
+    for i_model in models:
+        PathListIO.write_list(os.path.join(workflowdir, f"outputs_{i_model}.txt"), groups[i_model][1])
+
+    run_args = shlex.split(args.run)
+    failed = []
+    if args.local:
+        # members of one model after the other, each model aggregated in the background while the next one runs
+        aggregations = {}
+        for i_model in models:
+            exitcode, _ = run_members(
+                members_command(args.catalog, groups[i_model][0], run_args, local=True, jobs=args.jobs), args.dry
+            )
+            if exitcode != 0:
+                failed.append("members_" + i_model)
+                continue
+            script = aggregate_script(os.path.join(workflowdir, f"outputs_{i_model}.txt"), args.analysis, i_model)
+            if args.verbose or args.dry:
+                print(script, end="")
+            if args.dry:
+                continue
+            with open(os.path.join(workflowdir, f"aggregate_{i_model}.txt"), "a") as log:
+                aggregations[i_model] = subprocess.Popen(
+                    ["bash", "-e", "-c", script], stdout=log, stderr=subprocess.STDOUT
+                )
+        for i_model, process in aggregations.items():
+            if process.wait() != 0:
+                failed.append("aggregate_" + i_model)
+        if args.final and not failed:
+            final = substitute(args.final, data=datafile)
+            print(final)
+            if not args.dry and subprocess.call(final, shell=True) != 0:
+                failed.append("final")
+    else:
+        # stages submitted in order of the DAG, each starting after the jobs of the stages it depends on, members of
+        # each model as job arrays
+        jobids = {"collect": []}  # stage -> job ids, none for stages run before
+        for stage, after in stages.items():
+            if stage in jobids:
+                continue
+            if any(i_after not in jobids for i_after in after):
+                # stages after failed stages are not submitted
+                continue
+            dependency = [jobid for i_after in after for jobid in jobids[i_after]]
+            kind, _, i_model = stage.partition("_")
+            if kind == "members":
+                exitcode, stage_jobids = run_members(
+                    members_command(args.catalog, groups[i_model][0], run_args), args.dry
+                )
+                if exitcode != 0:
+                    failed.append(stage)
+                    continue
+                jobids[stage] = stage_jobids
+                continue
+            if kind == "aggregate":
+                script = aggregate_script(os.path.join(workflowdir, f"outputs_{i_model}.txt"), args.analysis, i_model)
+            else:
+                script = substitute(args.final, data=datafile) + "\n"
+            jobid = submit_stage(stage, script, workflowdir, dependency, args)
+            if jobid is None and not args.dry:
+                failed.append(stage)
+                continue
+            jobids[stage] = [jobid] if jobid is not None else []
+    if failed:
+        exit("Failed stages: " + ", ".join(failed))
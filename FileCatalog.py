@@ -0,0 +1,218 @@
+# persistent catalog of scanned files and generated path lists, stored as SQLite database
+#  imports
+import collections
+import os
+import sqlite3
+
+import DirectoryScanner
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subdirectories (
+    parent TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (parent, path)
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    root TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    parsed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory);
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    scenario TEXT,
+    variable TEXT,
+    model TEXT,
+    start_year INTEGER,
+    end_year INTEGER
+);
+CREATE INDEX IF NOT EXISTS entries_directory ON entries (directory);
+CREATE TABLE IF NOT EXISTS lists (
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (name, position)
+);
+CREATE TABLE IF NOT EXISTS list_directories (
+    name TEXT PRIMARY KEY,
+    directory TEXT NOT NULL
+);
+"""
+
+
+class FileCatalog:
+    """On-disk catalog of files below one or more roots.
+
+    Directories are only listed again if their mtime changed since the last scan, files of unchanged
+    directories are taken from the catalog including size, mtime and parsed filename fields.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+        self.listed_directories = 0
+        self.reused_directories = 0
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _get_meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _forget_directory(self, directory):
+        self.connection.execute("DELETE FROM files WHERE directory = ?", (directory,))
+        self.connection.execute("DELETE FROM entries WHERE directory = ?", (directory,))
+        self.connection.execute("DELETE FROM subdirectories WHERE parent = ?", (directory,))
+
+    def clear(self):
+        for table in ("directories", "subdirectories", "files", "entries"):
+            self.connection.execute("DELETE FROM " + table)
+
+    def walk(self, roots, extensions, workers=1):
+        """Return sorted list of files below roots, only listing directories which changed since the last scan."""
+        if isinstance(roots, str):
+            roots = [roots]
+        roots = [os.path.abspath(root) for root in roots]
+        # cached files are only valid for the same set of file extensions
+        extensionkey = ",".join(sorted(extensions))
+        if self._get_meta("extensions") != extensionkey:
+            self.clear()
+            self._set_meta("extensions", extensionkey)
+        suffixes = tuple("." + extension for extension in extensions)
+        self.listed_directories = 0
+        self.reused_directories = 0
+        cached = {}
+        cached_subdirectories = collections.defaultdict(list)
+        for root in roots:
+            cached.update(self.connection.execute("SELECT path, mtime_ns FROM directories WHERE root = ?", (root,)))
+        for parent, path in self.connection.execute("SELECT parent, path FROM subdirectories"):
+            if parent in cached:
+                cached_subdirectories[parent].append(path)
+
+        # visits only read the cached state and may run in worker threads, catalog is updated afterwards
+        def visit(item):
+            root, directory = item
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                return [], None
+            if cached.get(directory) == mtime_ns:
+                # entries of directory unchanged, but subdirectories might have changed themselves
+                return [(root, path) for path in cached_subdirectories[directory]], (root, directory, None, None, None)
+            subdirectories, entries = DirectoryScanner.list_directory(directory, suffixes)
+            files = []
+            for entry in entries:
+                stat = entry.stat()
+                files.append((entry.path, directory, root, stat.st_size, stat.st_mtime_ns))
+            return [(root, path) for path in subdirectories], (root, directory, mtime_ns, subdirectories, files)
+
+        seen = set()
+        for result in DirectoryScanner.traverse([(root, root) for root in roots], visit, workers=workers):
+            if result is None:
+                continue
+            root, directory, mtime_ns, subdirectories, files = result
+            seen.add(directory)
+            if mtime_ns is None:
+                self.reused_directories += 1
+                continue
+            self.listed_directories += 1
+            self._forget_directory(directory)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files (path, directory, root, size, mtime_ns) VALUES (?, ?, ?, ?, ?)",
+                files,
+            )
+            self.connection.executemany(
+                "INSERT INTO subdirectories (parent, path) VALUES (?, ?)",
+                [(directory, subdirectory) for subdirectory in subdirectories],
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO directories (path, root, mtime_ns) VALUES (?, ?, ?)",
+                (directory, root, mtime_ns),
+            )
+        # drop directories which vanished since the last scan
+        for directory in set(cached) - seen:
+            self._forget_directory(directory)
+            self.connection.execute("DELETE FROM directories WHERE path = ?", (directory,))
+        self.connection.commit()
+        found = set()
+        for root in roots:
+            found.update(row[0] for row in self.connection.execute("SELECT path FROM files WHERE root = ?", (root,)))
+        return sorted(found)
+
+    def index(self, filepaths, scenarios, variables, convention="cmip6"):
+        """Return ScanIndex of filepaths, only parsing filenames not yet parsed with the same settings."""
+        index = DirectoryScanner.ScanIndex(scenarios, variables, convention=convention)
+        parserkey = "{}|{}|{}|{}|{}".format(
+            ",".join(scenarios), ",".join(variables), convention, index.convention.regex.pattern, index.convention.model
+        )
+        if self._get_meta("parser") != parserkey:
+            self.connection.execute("DELETE FROM entries")
+            self.connection.execute("UPDATE files SET parsed = 0")
+            self._set_meta("parser", parserkey)
+        unparsed = self.connection.execute("SELECT path, directory FROM files WHERE parsed = 0").fetchall()
+        rows = []
+        for filepath, directory in unparsed:
+            key = index.parse(filepath)
+            if key is not None:
+                rows.append((filepath, directory) + key)
+            else:
+                rows.append((filepath, directory, None, None, None, None, None))
+        self.connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.connection.execute("UPDATE files SET parsed = 1 WHERE parsed = 0")
+        self.connection.commit()
+
+        wanted = set(filepaths)
+        for filepath, scenario, variable, model, start_year, end_year in self.connection.execute(
+                "SELECT path, scenario, variable, model, start_year, end_year FROM entries ORDER BY path"
+        ):
+            if filepath not in wanted:
+                continue
+            if scenario is None:
+                index.unparsed.append(filepath)
+            else:
+                index.insert((scenario, variable, model, start_year, end_year), filepath)
+        return index
+
+    def store_list(self, name, directory, paths):
+        """Store a list of paths, e.g. of generated settings files, together with the directory it belongs to."""
+        self.connection.execute("DELETE FROM lists WHERE name = ?", (name,))
+        self.connection.executemany(
+            "INSERT INTO lists (name, position, path) VALUES (?, ?, ?)",
+            [(name, position, path) for position, path in enumerate(paths)],
+        )
+        self.connection.execute(
+            "INSERT OR REPLACE INTO list_directories (name, directory) VALUES (?, ?)", (name, directory)
+        )
+        self.connection.commit()
+
+    def load_list(self, name):
+        """Return (directory, paths) of a stored list."""
+        row = self.connection.execute("SELECT directory FROM list_directories WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError("List '{}' not found in catalog {}".format(name, self.path))
+        paths = [r[0] for r in self.connection.execute("SELECT path FROM lists WHERE name = ? ORDER BY position", (name,))]
+        return row[0], paths
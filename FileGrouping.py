@@ -0,0 +1,54 @@
+# single pass grouping of file lists by model, used by FileListFiltering.py
+#  imports
+import os
+
+import NamingConventions
+import PathListIO
+
+# key of the group a parsed filename belongs to, per naming convention
+GROUP_KEYS = {
+    "output": lambda filename: filename.model,
+    "settings": lambda filename: filename.scenario + "_" + filename.model,
+}
+
+
+def group_paths(paths, convention):
+    """Group paths by model in one pass, return ({model: [paths]}, [unidentified paths]).
+
+    paths may be any iterable, e.g. a stream of list entries; order within each group is kept.
+    """
+    parse = NamingConventions.get(convention).parse
+    key = GROUP_KEYS.get(convention, lambda filename: filename.model)
+    groups = {}
+    unidentified = []
+    for path in paths:
+        filename = parse(path)
+        if filename is None:
+            unidentified.append(path)
+            continue
+        model = key(filename)
+        group = groups.get(model)
+        if group is None:
+            groups[model] = [path]
+        else:
+            group.append(path)
+    return groups, unidentified
+
+
+def write_groups(groups, outputdir, prefix, extension=".yml"):
+    """Write one prefix<model>.yml list per group into outputdir, return list of written files."""
+    written = []
+    for model in sorted(groups):
+        filepath = os.path.join(outputdir, prefix + model + extension)
+        PathListIO.write_list(filepath, groups[model])
+        written.append(filepath)
+    return written
+
+
+def export(paths, convention, outputdir, prefix, extension=".yml"):
+    """Group paths by model and write one list per model, return {model: [paths]}."""
+    groups, unidentified = group_paths(paths, convention)
+    if unidentified:
+        print("{} files not following {} naming conventions, e.g. {}".format(len(unidentified), convention, unidentified[0]))
+    write_groups(groups, outputdir, prefix, extension=extension)
+    return groups
@@ -6,9 +6,12 @@
 
 import argparse
 import os
-import re
 
-from ruamel.yaml import ruamel
+import FileCatalog
+import FileGrouping
+import Instrumentation
+import OutputMerge
+import PathListIO
 
 # argument parser definition
 parser = argparse.ArgumentParser(description="Calculate some analysis metrics on specified files")
@@ -19,102 +22,110 @@ parser.add_argument(
     "--data"
     , type=str,
 
-    help="YML list of datafile(s)"
+    help="YML list of datafile(s), or TXT list with one path per line"
 )
 
 parser.add_argument(
     "--settings"
     , type=str,
 
-    help="YML list of settingsfile(s)"
+    help="YML list of settingsfile(s), or TXT list with one path per line"
+)
+
+parser.add_argument(
+    "--catalog"
+    , type=str,
+
+    help="File catalog written by PathnameCollectionHelper.py, used instead of YML lists not given explicitly"
+)
+
+parser.add_argument(
+    "--merge",
+    type=str,
+    help="concatenate the outputs of each model along time into merged_<model>_<YYYYYYYY>.nc in this directory",
+)
+
+parser.add_argument(
+    "--merge-workers",
+    type=int,
+    default=4,
+    help="with --merge, models merged in parallel by worker processes (default: 4)",
+)
+
+parser.add_argument(
+    "--merge-chunk",
+    type=int,
+    default=64,
+    help="with --merge, MB copied at once per worker, bounding memory to workers times chunk (default: 64)",
+)
+
+parser.add_argument(
+    "--profile",
+    nargs="?",
+    const="profile.json",
+    type=str,
+    help="time hot paths and write them as Chrome trace to this file (default: profile.json) plus a summary table",
+)
+
+parser.add_argument(
+    "--cprofile",
+    action="store_true",
+    help="with --profile, also profile the whole run with cProfile, written next to the trace as *.prof",
 )
 
 args = parser.parse_args()
+if args.cprofile and not args.profile:
+    exit("--cprofile requires --profile")
+if (args.profile):
+    Instrumentation.enable(args.profile, profile=args.cprofile)
+if args.merge and not (args.data or args.catalog):
+    exit("--merge requires --data or --catalog")
+
+catalog = None
+if (args.catalog):
+    catalog = FileCatalog.FileCatalog(args.catalog)
 
 # load file with data filepaths
-if (args.data):
-    yaml = ruamel.yaml.YAML()
-    with open(args.data, 'r') as stream:
-        try:
-            data = yaml.load(stream)
-        except yaml.YAMLError as exc:
-            print(exc)
-
-    list_of_models = []
-
-    for i_data in data:
-        model = re.search('(.*/)(output_)(.*)(_\d{4}\d{4})(.nc)$', i_data)
-        if (model):
-            model_string = model.group(3)
-        else:
-            model_string = "model_not_identified"
-        list_of_models.append(model_string)
-
-    set_of_models = set(list_of_models)
-
-    sorted_models = {}
-    for i_model in set_of_models:
-        files_from_model = []
-        for i_data in data:
-            model = re.search('(.*/)(output_' + i_model + '_\d{4}\d{4})(.nc)$', i_data)
-            if (model):
-                model_string = model.string
-                files_from_model.append(model_string)
-            else:
-                model_string = "model_not_identified"
-        sorted_models[i_model] = files_from_model
-
-    # export as yml files
-    # get dir of data
-    outputdir = os.path.dirname(args.data)
-
-    for i_model in set_of_models:
-        os.chdir(outputdir)
-        yaml = ruamel.yaml.YAML()
-        yaml.default_flow_style = None
-        with open("data_" + i_model + ".yml", "w") as output:
-            yaml.dump(sorted_models[i_model], output)
+if (args.data or catalog):
+    if (args.data):
+        # stream entries of list, *.yml or *.txt
+        data = PathListIO.read_list(args.data)
+        # get dir of data
+        outputdir = os.path.dirname(args.data)
+        extension = os.path.splitext(args.data)[1]
+    else:
+        outputdir, data = catalog.load_list("outputfiles")
+        extension = ".yml"
+
+    # group by model and export as lists of same format
+    with Instrumentation.span("group outputs"):
+        groups = FileGrouping.export(data, "output", outputdir, "data_", extension=extension)
+
+    # merge outputs of each model in time order, checking for gaps and overlaps
+    if (args.merge):
+        with Instrumentation.span("merge outputs", models=len(groups)):
+            results = OutputMerge.merge_groups(
+                groups, args.merge, workers=args.merge_workers, chunk_bytes=args.merge_chunk * 1024 * 1024
+            )
+        for line in OutputMerge.report(results):
+            print(line)
+        failed = sum(1 for _, _, error in results.values() if error is not None)
+        print("{} models merged, {} failed".format(len(results) - failed, failed))
+        if failed:
+            exit(1)
 
 # load file with setttings filepaths
-if (args.settings):
-    yaml = ruamel.yaml.YAML()
-    with open(args.settings, 'r') as stream:
-        try:
-            settings = yaml.load(stream)
-        except yaml.YAMLError as exc:
-            print(exc)
-
-    list_of_models = []
-
-    for i_settings in settings:
-        model = re.search('(.*/)(settings_)(.*)(_\d{8})(.yml)$', i_settings)
-        if (model):
-            model_string = model.group(3)
-        else:
-            model_string = "model_not_identified"
-        list_of_models.append(model_string)
-
-    set_of_models = set(list_of_models)
-
-    sorted_models = {}
-    for i_model in set_of_models:
-        files_from_model = []
-        for i_settings in settings:
-            model = re.search('(.*/)(settings_' + i_model + '_\d{8})(.yml)$', i_settings)
-            if (model):
-                model_string = model.string
-                files_from_model.append(model_string)
-            else:
-                model_string = "model_not_identified"
-        sorted_models[i_model] = files_from_model
-
-    # export as yml files
-    # get dir of data
-    outputdir = os.path.dirname(args.settings)
-
-    for i_model in set_of_models:
-        os.chdir(outputdir)
-        yaml = ruamel.yaml.YAML()
-        yaml.default_flow_style = None
-        with open("settings_" + i_model + ".yml", "w") as output:
-            yaml.dump(sorted_models[i_model], output)
+if (args.settings or catalog):
+    if (args.settings):
+        # stream entries of list, *.yml or *.txt
+        settings = PathListIO.read_list(args.settings)
+        # get dir of settings
+        outputdir = os.path.dirname(args.settings)
+        extension = os.path.splitext(args.settings)[1]
+    else:
+        outputdir, settings = catalog.load_list("settings")
+        extension = ".yml"
+
+    # group by model and export as lists of same format
+    with Instrumentation.span("group settings"):
+        FileGrouping.export(settings, "settings", outputdir, "settings_", extension=extension)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# benchmark showing that grouping file lists by model scales linearly in the number of paths
+
+import argparse
+import time
+
+import FileGrouping
+
+parser = argparse.ArgumentParser(description="Measure grouping time of output and settings lists of growing size")
+parser.add_argument(
+    "--paths",
+    nargs="+",
+    type=int,
+    default=[10000, 100000, 1000000],
+    help="List sizes to benchmark (default: 10000 100000 1000000)",
+)
+parser.add_argument("--models", type=int, default=500, help="Number of distinct models (default: 500)")
+parser.add_argument("--repeat", type=int, default=3, help="Repetitions per size, best is reported (default: 3)")
+args = parser.parse_args()
+
+scenarios = ["historical", "ssp126", "ssp370", "ssp585"]
+
+
+def synthetic_paths(convention, count, models):
+    for number in range(count):
+        model = "MODEL-{}".format(number % models)
+        scenario = scenarios[number % len(scenarios)]
+        start_year = 1850 + number // models % 250
+        if convention == "output":
+            yield "/data/output/output_{}_{}_{}{}.nc".format(model, scenario, start_year, start_year + 9)
+        else:
+            yield "/data/settings/settings/settings_{}_{}_{}{}.yml".format(scenario, model, start_year, start_year + 9)
+
+
+print("{:>10} {:>10} {:>8} {:>10} {:>12}".format("convention", "paths", "groups", "seconds", "us/path"))
+for i_convention in ("output", "settings"):
+    for i_paths in args.paths:
+        paths = list(synthetic_paths(i_convention, i_paths, args.models))
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            groups, unidentified = FileGrouping.group_paths(paths, i_convention)
+            best = min(best, time.perf_counter() - start)
+        if unidentified or sum(len(group) for group in groups.values()) != i_paths:
+            exit("grouping of {} {} paths lost entries".format(i_paths, i_convention))
+        # constant time per path means linear scaling
+        print("{:>10} {:>10} {:>8} {:>10.3f} {:>12.2f}".format(
+            i_convention, i_paths, len(groups), best, 1e6 * best / i_paths
+        ))
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# validation of the input files referenced by settings files, checking their NetCDF headers in parallel
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from ruamel.yaml import ruamel
+
+import FileCatalog
+import NetCDFHeader
+import PathListIO
+
+CACHE_DB = "validation.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS headers (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    error TEXT,
+    variables TEXT,
+    first_year INTEGER,
+    last_year INTEGER
+);
+"""
+
+
+def inspect(filepath):
+    """Return (size, mtime_ns, error, variables, first year, last year) of a NetCDF file."""
+    try:
+        stat = os.stat(filepath)
+    except OSError as e:
+        return None, None, e.strerror, None, None, None
+    try:
+        header = NetCDFHeader.read(filepath)
+        first_year = last_year = None
+        if header["time"] is not None:
+            first_year = NetCDFHeader.year(header["time"][0], header["units"], header["calendar"])
+            last_year = NetCDFHeader.year(header["time"][1], header["units"], header["calendar"])
+    except (NetCDFHeader.HeaderError, OSError, ValueError, OverflowError) as e:
+        return stat.st_size, stat.st_mtime_ns, str(e), None, None, None
+    return stat.st_size, stat.st_mtime_ns, None, header["variables"], first_year, last_year
+
+
+class HeaderCache:
+    """Header summaries of NetCDF files keyed on path, size and mtime, inspected in parallel if not cached."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.inspected = 0
+        self.cached = 0
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def headers(self, filepaths, workers=8):
+        """Return {path: (error, variables, first year, last year)} of filepaths."""
+        cached = {
+            path: (size, mtime_ns, error, json.loads(variables) if variables else None, first_year, last_year)
+            for path, size, mtime_ns, error, variables, first_year, last_year
+            in self.connection.execute("SELECT * FROM headers")
+        }
+        headers = {}
+        outdated = []
+        for filepath in set(filepaths):
+            entry = cached.get(filepath)
+            if entry is not None:
+                # stat is all a recheck costs
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    outdated.append(filepath)
+                    continue
+                if (stat.st_size, stat.st_mtime_ns) == entry[:2]:
+                    headers[filepath] = entry[2:]
+                    self.cached += 1
+                    continue
+            outdated.append(filepath)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            inspected = list(zip(outdated, executor.map(inspect, outdated)))
+        self.inspected += len(inspected)
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (filepath, size, mtime_ns, error, json.dumps(variables), first_year, last_year)
+                    for filepath, (size, mtime_ns, error, variables, first_year, last_year) in inspected
+                    if size is not None
+                ],
+            )
+        for filepath, (_, _, error, variables, first_year, last_year) in inspected:
+            headers[filepath] = (error, variables, first_year, last_year)
+        return headers
+
+
+def read_settings(settings_file):
+    """Return ({variable: input file}, first year, last year) of a settings file."""
+    with open(settings_file, "r") as stream:
+        settings = ruamel.yaml.YAML(typ="safe").load(stream) or {}
+    inputs = {
+        variable: filepath for variable, filepath in (settings.get("input") or {}).items()
+        if variable != "model" and filepath
+    }
+    years = settings.get("years") or {}
+    return inputs, years.get("from"), years.get("to")
+
+
+def validate(list_of_settings, cache, workers=8):
+    """Return {settings file: [problems]} of settings files with invalid inputs."""
+    settings = {settings_file: read_settings(settings_file) for settings_file in list_of_settings}
+    headers = cache.headers(
+        [filepath for inputs, _, _ in settings.values() for filepath in inputs.values()], workers=workers
+    )
+    problems = {}
+    for settings_file, (inputs, first_year, last_year) in settings.items():
+        for variable, filepath in inputs.items():
+            error, variables, file_first_year, file_last_year = headers[filepath]
+            if error is not None:
+                problems.setdefault(settings_file, []).append(f"{filepath}: {error}")
+                continue
+            if variable not in variables:
+                problems.setdefault(settings_file, []).append(f"{filepath}: variable {variable} missing")
+            if file_first_year is None:
+                problems.setdefault(settings_file, []).append(f"{filepath}: no time values")
+            elif (first_year is not None and file_first_year > int(first_year)) or (
+                    last_year is not None and file_last_year < int(last_year)):
+                problems.setdefault(settings_file, []).append(
+                    f"{filepath}: covers {file_first_year}-{file_last_year}, not {first_year}-{last_year}"
+                )
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check NetCDF headers of the inputs of settings files")
+    parser.add_argument(
+        "--settings", type=str, help="File containing paths to individual settings files (*.yml or *.txt)"
+    )
+    parser.add_argument(
+        "--catalog", type=str, help="File catalog written by PathnameCollectionHelper.py, used instead of --settings"
+    )
+    parser.add_argument(
+        "--cache", type=str, help="Cache of checked headers (default: validation.sqlite next to the settings)"
+    )
+    parser.add_argument("--workers", type=int, default=8, help="Number of files checked concurrently (default: 8)")
+    parser.add_argument(
+        "--valid", type=str, help="Write list of settings files with valid inputs to this *.yml or *.txt file"
+    )
+    args = parser.parse_args()
+
+    if args.catalog:
+        with FileCatalog.FileCatalog(args.catalog) as catalog:
+            settingsdir, list_of_settings = catalog.load_list("settings")
+    else:
+        if not args.settings:
+            args.settings = os.path.join(os.getcwd(), "list_of_settings.yml")
+        if not os.path.exists(args.settings):
+            exit("List of settings '{}' not found".format(args.settings))
+        settingsdir = os.path.dirname(os.path.abspath(args.settings))
+        list_of_settings = list(PathListIO.read_list(args.settings))
+    if not args.cache:
+        args.cache = os.path.join(settingsdir, CACHE_DB)
+
+    start = time.time()
+    with HeaderCache(args.cache) as cache:
+        problems = validate(list_of_settings, cache, workers=args.workers)
+        print("{} input files checked in {:.2f} s, {} from cache".format(
+            cache.inspected + cache.cached, time.time() - start, cache.cached
+        ))
+    for settings_file in sorted(problems):
+        print(settings_file)
+        for problem in problems[settings_file]:
+            print("    " + problem)
+    print("{} of {} settings files with invalid inputs".format(len(problems), len(list_of_settings)))
+    if args.valid:
+        PathListIO.write_list(args.valid, [i_settings for i_settings in list_of_settings if i_settings not in problems])
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,135 @@
+# named timing spans and counters of hot paths, exported as Chrome trace, near-zero cost unless enabled
+#  imports
+import atexit
+import collections
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+
+_enabled = False
+_lock = threading.Lock()
+_events = []  # complete events of the Chrome trace format
+_totals = collections.defaultdict(lambda: [0, 0.0])  # span name -> [calls, seconds]
+_counters = collections.Counter()
+_origin = time.perf_counter()
+_profiler = None
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        event = {
+            "name": self.name,
+            "ph": "X",
+            "ts": (self.start - _origin) * 1e6,
+            "dur": (end - self.start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if self.args:
+            event["args"] = self.args
+        with _lock:
+            _events.append(event)
+            total = _totals[self.name]
+            total[0] += 1
+            total[1] += end - self.start
+        return False
+
+
+def span(name, **args):
+    """Context manager timing a named span, args are shown with the span in the trace."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def count(name, value=1):
+    """Add value to a named counter."""
+    if _enabled:
+        with _lock:
+            _counters[name] += value
+
+
+def enabled():
+    return _enabled
+
+
+def enable(trace, profile=False):
+    """Record spans and counters from now on and write them to trace at exit, with profile also a cProfile of the
+    whole run to trace with extension .prof."""
+    global _enabled, _profiler
+    _enabled = True
+    # scripts may change their working directory
+    trace = os.path.abspath(trace)
+    if profile:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(_finish, trace)
+
+
+def summary():
+    """Table of spans by total time and of counters."""
+    with _lock:
+        totals = sorted(_totals.items(), key=lambda item: item[1][1], reverse=True)
+        counters = sorted(_counters.items())
+    width = max([len(name) for name, _ in totals] + [len(name) for name, _ in counters] + [4])
+    lines = ["{:<{}} {:>8} {:>10} {:>10}".format("span", width, "calls", "total s", "mean ms")]
+    for name, (calls, seconds) in totals:
+        lines.append("{:<{}} {:>8} {:>10.3f} {:>10.3f}".format(name, width, calls, seconds, 1000 * seconds / calls))
+    if counters:
+        lines.append("{:<{}} {:>8}".format("counter", width, "value"))
+        for name, value in counters:
+            lines.append("{:<{}} {:>8}".format(name, width, value))
+    return "\n".join(lines)
+
+
+def write(trace):
+    """Write spans and final counter values as Chrome trace JSON, viewable in chrome://tracing or Perfetto."""
+    end = (time.perf_counter() - _origin) * 1e6
+    with _lock:
+        events = list(_events)
+        events += [
+            {"name": name, "ph": "C", "ts": end, "pid": os.getpid(), "tid": 0, "args": {name: value}}
+            for name, value in sorted(_counters.items())
+        ]
+    with open(trace, "w") as output:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, output)
+
+
+def _finish(trace):
+    os.makedirs(os.path.dirname(trace), exist_ok=True)
+    if _profiler is not None:
+        _profiler.disable()
+        path_profile = os.path.splitext(trace)[0] + ".prof"
+        _profiler.dump_stats(path_profile)
+        print("cProfile of run written to {}, top functions by cumulative time:".format(path_profile))
+        pstats.Stats(_profiler).sort_stats("cumulative").print_stats(10)
+    write(trace)
+    print(summary())
+    print("Trace written to {}".format(trace))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# status of the jobs of an ensemble, queried from Slurm in bulk and cached in the state databases of the runs
+
+import argparse
+import collections
+import getpass
+import math
+import os
+import subprocess
+import sys
+import time
+
+import FileCatalog
+import Instrumentation
+import PathListIO
+import RunState
+import SlurmJobs
+
+# Slurm states not changing anymore, jobs in these states are never queried again
+TERMINAL_STATES = (
+    "BOOT_FAIL", "CANCELLED", "COMPLETED", "DEADLINE", "FAILED", "NODE_FAIL", "OUT_OF_MEMORY", "TIMEOUT",
+)
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def parse_limit(limit):
+    """Seconds of a sacct time limit, None if unlimited or unknown."""
+    try:
+        return SlurmJobs.parse_time(limit)
+    except ValueError:
+        return None
+
+
+def query_squeue(user=None):
+    """{job id: state} of all queued jobs of user with one squeue call, array tasks listed individually."""
+    with Instrumentation.span("squeue"):
+        p = subprocess.run(
+            ["squeue", "--noheader", "--array", "--user", user or getpass.getuser(), "--format", "%i %T"],
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+    if p.returncode != 0:
+        raise RuntimeError("squeue failed")
+    states = {}
+    for line in p.stdout.splitlines():
+        fields = line.split()
+        if len(fields) == 2:
+            states[fields[0]] = fields[1]
+    return states
+
+
+def parse_memory(memory):
+    """MB of a sacct memory value, e.g. 1234K or 2.5G, None if empty."""
+    if not memory:
+        return None
+    units = {"K": 1 / 1024, "M": 1, "G": 1024, "T": 1024 * 1024}
+    if memory[-1] in units:
+        return int(float(memory[:-1]) * units[memory[-1]])
+    return int(float(memory) / 1024 / 1024)
+
+
+def query_sacct(jobids, chunksize=500):
+    """{job id: job info} of jobs from sacct, one call per chunksize job ids.
+
+    Memory is the maximum MaxRSS of all steps of a job.
+    """
+    jobs = {}
+    for chunk in chunks(list(jobids), chunksize):
+        with Instrumentation.span("sacct", jobs=len(chunk)):
+            p = subprocess.run(
+                ["sacct", "--noheader", "--parsable2", "--jobs", ",".join(chunk),
+                 "--format", "JobID,State,Elapsed,Timelimit,ExitCode,MaxRSS"],
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            )
+        if p.returncode != 0:
+            raise RuntimeError("sacct failed")
+        maxrss = collections.defaultdict(int)
+        for line in p.stdout.splitlines():
+            fields = line.split("|")
+            if len(fields) != 6:
+                continue
+            jobid, state, elapsed, timelimit, exitcode, rss = fields
+            if "." in jobid:
+                # step, e.g. 1234.batch
+                maxrss[jobid.split(".")[0]] = max(maxrss[jobid.split(".")[0]], parse_memory(rss) or 0)
+                continue
+            jobs[jobid] = {
+                # e.g. "CANCELLED by 1234"
+                "state": state.split()[0] if state else "UNKNOWN",
+                "elapsed": parse_limit(elapsed),
+                "timelimit": parse_limit(timelimit),
+                "exitcode": exitcode,
+                "maxrss": parse_memory(rss),
+            }
+        for jobid, rss in maxrss.items():
+            if jobid in jobs:
+                jobs[jobid]["maxrss"] = max(jobs[jobid]["maxrss"] or 0, rss) or None
+    return jobs
+
+
+def poll(state, ttl=60, chunksize=500, user=None):
+    """Return {job id: job info} of all jobs of state database, querying Slurm only for jobs not cached.
+
+    Jobs in a terminal state are cached forever, others for ttl seconds. Queued jobs are taken from one squeue
+    call, the remaining ones from sacct in chunks of chunksize job ids.
+    """
+    jobids = state.jobs()
+    cached = state.cached_jobs()
+    now = time.time()
+    outdated = [
+        jobid for jobid in jobids
+        if jobid not in cached
+        or (cached[jobid]["state"] not in TERMINAL_STATES and now - cached[jobid]["queried"] > ttl)
+    ]
+    if outdated:
+        queried = {}
+        queued = query_squeue(user)
+        for jobid in outdated:
+            if jobid in queued:
+                queried[jobid] = {"state": queued[jobid]}
+        queried.update(query_sacct([jobid for jobid in outdated if jobid not in queried], chunksize=chunksize))
+        state.store_jobs({jobid: info for jobid, info in queried.items() if jobid in jobids}, now)
+        cached = state.cached_jobs()
+    return {jobid: cached[jobid] for jobid in jobids if jobid in cached}
+
+
+def percentile(values, q):
+    """Nearest rank percentile q of sorted values."""
+    if not values:
+        return None
+    return values[min(len(values), max(1, math.ceil(q / 100 * len(values)))) - 1]
+
+
+def report(jobs, counts, requested=None):
+    """Text report of job infos and run counts per state, efficiency relative to the job time limit or requested."""
+    lines = ["Runs: {}, jobs: {}".format(sum(counts.values()), len(jobs))]
+    for run_state, count in sorted(counts.items()):
+        lines.append("{}: {}".format(run_state, count))
+    elapsed = sorted(info["elapsed"] for info in jobs.values() if info["state"] == "COMPLETED" and info["elapsed"])
+    if elapsed:
+        lines.append("Runtime of {} completed jobs: p50 {}, p90 {}, p99 {}, max {}".format(
+            len(elapsed), *(SlurmJobs.format_time(percentile(elapsed, q)) for q in (50, 90, 99, 100))
+        ))
+    efficiency = sorted(
+        info["elapsed"] / (info["timelimit"] or requested)
+        for info in jobs.values()
+        if info["state"] == "COMPLETED" and info["elapsed"] and (info["timelimit"] or requested)
+    )
+    if efficiency:
+        lines.append("Runtime / time limit: mean {:.2f}, p10 {:.2f}, p50 {:.2f}, p90 {:.2f}".format(
+            sum(efficiency) / len(efficiency), *(percentile(efficiency, q) for q in (10, 50, 90))
+        ))
+    return "\n".join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="SimpleEnsembleSimulation.py status", description="Report status of the jobs of an ensemble"
+    )
+    parser.add_argument(
+        "--settings", type=str, help="File containing paths to individual settings files (*.yml or *.txt)"
+    )
+    parser.add_argument(
+        "--catalog", type=str, help="File catalog written by PathnameCollectionHelper.py, used instead of --settings"
+    )
+    parser.add_argument("--ttl", type=float, default=60, help="Seconds job states are cached (default: 60)")
+    parser.add_argument("--chunk", type=int, default=500, help="Job ids per sacct call (default: 500)")
+    parser.add_argument("--time", type=str, help="Requested runtime of jobs without time limit in sacct")
+    args = parser.parse_args(argv)
+
+    if args.catalog:
+        with FileCatalog.FileCatalog(args.catalog) as catalog:
+            _, list_of_settings = catalog.load_list("settings")
+    else:
+        if not args.settings:
+            args.settings = os.path.join(os.getcwd(), "list_of_settings.yml")
+        if not os.path.exists(args.settings):
+            exit("List of settings '{}' not found".format(args.settings))
+        list_of_settings = PathListIO.read_list(args.settings)
+
+    jobs = {}
+    counts = collections.Counter()
+    for settings_dir in sorted(set(os.path.dirname(i_settings) for i_settings in list_of_settings)):
+        if not os.path.exists(os.path.join(settings_dir, RunState.STATE_DB)):
+            continue
+        with RunState.RunState(settings_dir) as state:
+            jobs.update(poll(state, ttl=args.ttl, chunksize=args.chunk))
+            counts.update(state.counts())
+    print(report(jobs, counts, SlurmJobs.parse_time(args.time) if args.time else None))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,128 @@
+# concurrent local execution of ensemble members as subprocesses within a core and memory budget
+#  imports
+import os
+import subprocess
+import sys
+import time
+
+# directory of this script, containing local-model
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def local_model_command(model, run_label, settings, python=False, telemetry=None, stage=None, stage_capacity=50000):
+    cmd = [os.path.join(SCRIPTDIR, "local-model"), "--model", model]
+    if python:
+        cmd += ["--python", "1"]
+    if telemetry:
+        cmd += ["--telemetry", telemetry]
+    if stage:
+        cmd += ["--stage", stage, "--stage-capacity", str(stage_capacity)]
+    cmd += ["--logdir", run_label, "--workdir", run_label, settings]
+    return cmd
+
+
+def task(name, cmd, cwd, log, cpus=1, memory=0):
+    """Subprocess cmd run in cwd with stdout and stderr appended to log, using cpus cores and memory MB."""
+    return {"name": name, "cmd": cmd, "cwd": cwd, "log": log, "cpus": cpus, "memory": memory}
+
+
+def omp_threads():
+    try:
+        return max(1, int(os.environ.get("OMP_NUM_THREADS", "1")))
+    except ValueError:
+        return 1
+
+
+def jobs_budget(jobs):
+    """Number of cores for jobs concurrent runs with OMP_NUM_THREADS threads each, limited by available cores."""
+    threads = omp_threads()
+    cores = os.cpu_count() or 1
+    limited = max(1, min(jobs, cores // threads))
+    if limited < jobs:
+        print("Running {} instead of {} jobs concurrently, {} cores with OMP_NUM_THREADS={}".format(
+            limited, jobs, cores, threads))
+    return limited * threads
+
+
+class LocalExecutor:
+    """Run tasks concurrently as long as their cpus and memory fit into the budget.
+
+    A task larger than the budget runs alone. Each task gets OMP_NUM_THREADS set to its cpus. Progress and
+    throughput are printed after every finished task if progress is set. With in_order a task not fitting waits for
+    the tasks before it instead of being overtaken by smaller tasks after it, e.g. to follow a planned schedule.
+    """
+
+    def __init__(self, cpus, memory=None, progress=True, verbose=False, in_order=False):
+        self.cpus = cpus
+        self.memory = memory
+        self.progress = progress
+        self.verbose = verbose
+        self.in_order = in_order
+
+    def _fits(self, i_task, free_cpus, free_memory):
+        if i_task["cpus"] > free_cpus:
+            return False
+        return free_memory is None or i_task["memory"] <= free_memory
+
+    def _report(self, done, failed, total, running, start):
+        elapsed = time.time() - start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 else float("inf")
+        line = "[{}/{}] {} failed, {} running, {:.2f} runs/min, ETA {}".format(
+            done, total, failed, running, 60 * rate,
+            "{:.0f} s".format(eta) if eta != float("inf") else "unknown",
+        )
+        if sys.stdout.isatty():
+            sys.stdout.write("\r" + line + ("\n" if done == total else ""))
+        else:
+            sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    def run(self, tasks):
+        """Run tasks in given order as resources allow, return {name: exit code}."""
+        pending = list(tasks)
+        total = len(pending)
+        running = {}  # pid -> (task, process, log)
+        exitcodes = {}
+        failed = 0
+        free_cpus = self.cpus
+        free_memory = self.memory
+        start = time.time()
+        while pending or running:
+            for i_task in list(pending):
+                if not self._fits(i_task, free_cpus, free_memory) and running:
+                    if self.in_order:
+                        break
+                    continue
+                env = os.environ.copy()
+                env["OMP_NUM_THREADS"] = str(i_task["cpus"])
+                log = open(i_task["log"], "a")
+                if self.verbose:
+                    print(" ".join(i_task["cmd"]))
+                process = subprocess.Popen(
+                    i_task["cmd"], cwd=i_task["cwd"], env=env, stdout=log, stderr=subprocess.STDOUT
+                )
+                running[process.pid] = (i_task, process, log)
+                free_cpus -= i_task["cpus"]
+                if free_memory is not None:
+                    free_memory -= i_task["memory"]
+                pending.remove(i_task)
+            pid, status = os.wait()
+            if pid not in running:
+                continue
+            i_task, process, log = running.pop(pid)
+            log.close()
+            # process is reaped already, exit code from wait status
+            if os.WIFEXITED(status):
+                process.returncode = os.WEXITSTATUS(status)
+            else:
+                process.returncode = -os.WTERMSIG(status)
+            exitcodes[i_task["name"]] = process.returncode
+            if process.returncode != 0:
+                failed += 1
+            free_cpus += i_task["cpus"]
+            if free_memory is not None:
+                free_memory += i_task["memory"]
+            if self.progress:
+                self._report(len(exitcodes), failed, total, len(running), start)
+        return exitcodes
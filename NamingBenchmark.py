@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# micro-benchmark of filename parsing throughput for all registered naming conventions
+
+import argparse
+import re
+import time
+
+import NamingConventions
+
+parser = argparse.ArgumentParser(description="Measure parse throughput of registered filename conventions")
+parser.add_argument("--names", type=int, default=1000000, help="Number of synthetic names per convention (default: 1000000)")
+parser.add_argument(
+    "--conventions",
+    nargs="+",
+    type=str,
+    default=["isimip3b", "cmip6", "output", "settings"],
+    help="Conventions to benchmark (default: isimip3b cmip6 output settings)",
+)
+args = parser.parse_args()
+
+scenarios = ["historical", "ssp126", "ssp370", "ssp585"]
+variables = ["pr", "prsn", "tas"]
+
+# synthetic filename of number under each convention
+templates = {
+    "isimip3b": lambda number: "/data/isimip3b/model{}_r1i1p1f1_w5e5_{}_{}_global_daily_{}_{}.nc".format(
+        number % 100, scenarios[number % 4], variables[number % 3], 1850 + number % 250, 1859 + number % 250
+    ),
+    "cmip6": lambda number: "/data/cmip6/{}_day_MODEL-{}_{}_r1i1p1f1_gr1_{}0101-{}1231.nc".format(
+        variables[number % 3], number % 100, scenarios[number % 4], 1850 + number % 250, 1859 + number % 250
+    ),
+    "output": lambda number: "/data/output/output_MODEL-{}_{}_{}{}.nc".format(
+        number % 100, scenarios[number % 4], 1850 + number % 250, 1859 + number % 250
+    ),
+    "settings": lambda number: "/data/settings/settings_{}_MODEL-{}_{}_{}{}.yml".format(
+        scenarios[number % 4], number % 100, scenarios[number % 4], 1850 + number % 250, 1859 + number % 250
+    ),
+}
+
+# ad-hoc regular expressions as previously built per file for comparison
+legacy = {
+    "isimip3b": lambda name: (
+        re.search(r"(\d{4})(_)(\d{4})(.nc)$", name), re.search(r"(.*/)(.*)(_r)(.*_)(\d{4}.\d{4}.nc)$", name)
+    ),
+    "cmip6": lambda name: (
+        re.search(r"(\d{4})(\d{4})(.)(\d{4})(\d{4})(.nc)$", name),
+        re.search(r"(.*/)(\w*_\w*_)(.*" + scenarios[0] + r")(_\w*_\w*_)(\d{4}\d{4}-\d{4}\d{4}.nc)$", name),
+    ),
+    "output": lambda name: re.search(r"(.*/)(output_)(.*)(_\d{4}\d{4})(.nc)$", name),
+    "settings": lambda name: re.search(r"(.*/)(settings_)(.*)(_\d{8})(.yml)$", name),
+}
+
+print("{:>10} {:>12} {:>14} {:>14} {:>8}".format("convention", "names", "names/s", "legacy/s", "speedup"))
+for i_convention in args.conventions:
+    convention = NamingConventions.get(i_convention)
+    names = [templates[i_convention](number) for number in range(args.names)]
+
+    start = time.perf_counter()
+    parsed = 0
+    for name in names:
+        if convention.parse(name) is not None:
+            parsed += 1
+    seconds = time.perf_counter() - start
+    if parsed != len(names):
+        exit("only {} of {} names parsed with convention {}".format(parsed, len(names), i_convention))
+
+    start = time.perf_counter()
+    for name in names:
+        legacy[i_convention](name)
+    legacy_seconds = time.perf_counter() - start
+
+    print("{:>10} {:>12} {:>14.0f} {:>14.0f} {:>8.2f}".format(
+        i_convention, len(names), len(names) / seconds, len(names) / legacy_seconds, legacy_seconds / seconds
+    ))
@@ -0,0 +1,107 @@
+# registry of precompiled filename conventions, parsing a filename with one regular expression match
+#  imports
+import re
+from typing import NamedTuple, Optional
+
+
+class FileName(NamedTuple):
+    """Fields identified in a filename, empty if not part of the convention."""
+    convention: str
+    model: str
+    scenario: str
+    variable: str
+    start_year: Optional[int]
+    end_year: Optional[int]
+
+
+class Convention:
+    """Filename convention given by a regular expression with named groups.
+
+    Groups named scenario, variable, start_year and end_year are taken over directly, the model identifier is
+    formatted from all named groups with the model template, e.g. "{source}_{scenario}".
+    """
+
+    __slots__ = ("name", "regex", "model", "_match", "_model_group", "_groups")
+
+    def __init__(self, name, pattern, model="{model}"):
+        self.name = name
+        self.regex = re.compile(pattern)
+        self.model = model
+        self._match = self.regex.match
+        # plain model group can be taken directly without formatting
+        plain = re.fullmatch(r"\{(\w+)\}", model)
+        self._model_group = plain.group(1) if plain else None
+        groups = self.regex.groupindex
+        # group numbers of record fields, 0 (whole match) as placeholder for fields not part of the convention
+        self._groups = tuple(groups.get(field, 0) for field in ("scenario", "variable", "start_year", "end_year"))
+
+    def parse(self, filepath):
+        """Return FileName record of filepath or None if the filename does not follow the convention."""
+        match = self._match(filepath.rpartition("/")[2])
+        if match is None:
+            return None
+        scenario, variable, start_year, end_year = self._groups
+        if self._model_group is None:
+            model = self.model.format(**match.groupdict())
+        else:
+            model = match.group(self._model_group)
+        return FileName(
+            self.name,
+            model,
+            match.group(scenario) if scenario else "",
+            match.group(variable) if variable else "",
+            int(match.group(start_year)) if start_year and end_year else None,
+            int(match.group(end_year)) if start_year and end_year else None,
+        )
+
+
+CONVENTIONS = {}
+
+
+def register(name, pattern, model="{model}"):
+    """Register a new filename convention, replacing one of the same name."""
+    convention = Convention(name, pattern, model=model)
+    CONVENTIONS[name] = convention
+    return convention
+
+
+def get(name):
+    try:
+        return CONVENTIONS[name]
+    except KeyError:
+        raise KeyError("Unknown filename convention '{}', known: {}".format(name, ", ".join(sorted(CONVENTIONS))))
+
+
+def parse(filepath, name):
+    return get(name).parse(filepath)
+
+
+def output_model(model, scenario):
+    """Model identifier of outputs of model in scenario, the model with the scenario appended unless it ends with it
+    already as identifiers of CMIP6 do."""
+    if model.endswith("_" + scenario):
+        return model
+    return model + "_" + scenario
+
+
+# ISIMIP3b climate input, e.g. gfdl-esm4_r1i1p1f1_w5e5_ssp126_pr_global_daily_2015_2020.nc
+register(
+    "isimip3b",
+    r"(?P<model>.+)_(?P<member>r\d+i\d+p\d+f\d+)_(?P<bias>[^_]+)_(?P<scenario>[^_]+)_(?P<variable>[^_]+)"
+    r"_(?P<region>[^_]+)_(?P<timestep>[^_]+)_(?P<start_year>\d{4})_(?P<end_year>\d{4})\.nc$",
+)
+# CMIP6, e.g. pr_day_GFDL-ESM4_ssp126_r1i1p1f1_gr1_20150101-21001231.nc, model identifier includes the experiment
+register(
+    "cmip6",
+    r"(?P<variable>[^_]+)_(?P<table>[^_]+)_(?P<source>[^_]+)_(?P<scenario>[^_]+)_(?P<member>[^_]+)_(?P<grid>[^_]+)"
+    r"_(?P<start_year>\d{4})\d{2,4}-(?P<end_year>\d{4})\d{2,4}\.nc$",
+    model="{source}_{scenario}",
+)
+# model output written by runs of settings files generated with PathnameCollectionHelper.py, model is the identifier of
+# output_model, outputs written before it was introduced name ISIMIP3b models without their scenario
+register("output", r"output_(?P<model>.+)_(?P<start_year>\d{4})(?P<end_year>\d{4})\.nc$")
+# settings files generated with PathnameCollectionHelper.py
+register(
+    "settings",
+    r"settings_(?P<scenario>[^_]+)_(?P<model>.+)_(?P<start_year>\d{4})(?P<end_year>\d{4})\.yml$",
+)
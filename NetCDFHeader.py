@@ -0,0 +1,279 @@
+# reading of NetCDF headers without loading data, classic formats parsed from a memory map, NetCDF-4 via netCDF4
+#  imports
+import datetime
+import mmap
+import re
+import struct
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+
+# struct format and size of NetCDF types
+TYPES = {
+    1: ("b", 1),
+    2: ("c", 1),
+    3: ("h", 2),
+    4: ("i", 4),
+    5: ("f", 4),
+    6: ("d", 8),
+    7: ("B", 1),
+    8: ("H", 2),
+    9: ("I", 4),
+    10: ("q", 8),
+    11: ("Q", 8),
+}
+
+HDF5_SIGNATURE = b"\x89HDF\r\n\x1a\n"
+
+
+class HeaderError(Exception):
+    pass
+
+
+class _Reader:
+    """Sequential big endian reader of a classic header, version 5 with 64 bit sizes."""
+
+    def __init__(self, buffer, version):
+        self.buffer = buffer
+        self.position = 4
+        self.version = version
+
+    def unpack(self, fmt, size):
+        if self.position + size > len(self.buffer):
+            raise HeaderError("header truncated")
+        value = struct.unpack_from(">" + fmt, self.buffer, self.position)
+        self.position += size
+        return value
+
+    def int(self):
+        return self.unpack("i", 4)[0]
+
+    def size(self):
+        if self.version == 5:
+            return self.unpack("q", 8)[0]
+        return self.unpack("i", 4)[0]
+
+    def offset(self):
+        if self.version == 1:
+            return self.unpack("i", 4)[0]
+        return self.unpack("q", 8)[0]
+
+    def padded(self, size):
+        end = self.position + size
+        if end > len(self.buffer):
+            raise HeaderError("header truncated")
+        data = self.buffer[self.position:end]
+        self.position = end + (-size % 4)
+        return data
+
+    def name(self):
+        return self.padded(self.size()).decode("utf8", "replace")
+
+    def values(self, nc_type, count):
+        if nc_type not in TYPES:
+            raise HeaderError(f"unknown type {nc_type}")
+        fmt, size = TYPES[nc_type]
+        data = self.padded(count * size)
+        if nc_type == 2:
+            return data.decode("utf8", "replace").rstrip("\x00")
+        return struct.unpack(f">{count}{fmt}", data)
+
+    def attributes(self):
+        tag, count = self.int(), self.size()
+        if tag not in (NC_ATTRIBUTE, 0):
+            raise HeaderError("attribute list expected")
+        attributes = {}
+        for _ in range(count):
+            name = self.name()
+            nc_type = self.int()
+            attributes[name] = self.values(nc_type, self.size())
+        return attributes
+
+
+def _classic(buffer):
+    """Dimensions, variables and time values of a classic NetCDF file in buffer, see read."""
+    if len(buffer) < 4 or buffer[:3] != b"CDF" or buffer[3] not in (1, 2, 5):
+        raise HeaderError("not a classic NetCDF file")
+    reader = _Reader(buffer, buffer[3])
+    numrecs = reader.size()
+    tag, count = reader.int(), reader.size()
+    if tag not in (NC_DIMENSION, 0):
+        raise HeaderError("dimension list expected")
+    dimensions = []
+    for _ in range(count):
+        dimensions.append((reader.name(), reader.size()))
+    reader.attributes()
+    tag, count = reader.int(), reader.size()
+    if tag not in (NC_VARIABLE, 0):
+        raise HeaderError("variable list expected")
+    variables = {}
+    for _ in range(count):
+        name = reader.name()
+        dimids = [reader.size() for _ in range(reader.size())]
+        attributes = reader.attributes()
+        nc_type = reader.int()
+        vsize = reader.size()
+        begin = reader.offset()
+        # unlimited dimension has length 0
+        record = bool(dimids) and dimensions[dimids[0]][1] == 0
+        variables[name] = {
+            "dimensions": [dimensions[dimid][0] for dimid in dimids],
+            "attributes": attributes,
+            "type": nc_type,
+            "vsize": vsize,
+            "begin": begin,
+            "record": record,
+        }
+    if numrecs == (1 << 32) - 1 or numrecs < 0:
+        raise HeaderError("numrecs of streamed file not written")
+    records = [variable for variable in variables.values() if variable["record"]]
+    # record size is not padded if there is a single record variable
+    if len(records) == 1:
+        recsize = TYPES[records[0]["type"]][1] * _elements(records[0], dimensions)
+    else:
+        recsize = sum(variable["vsize"] for variable in records)
+    end = reader.position
+    for variable in variables.values():
+        if variable["record"]:
+            if numrecs:
+                # last record of a single record variable is not padded
+                size = recsize if len(records) == 1 else variable["vsize"]
+                end = max(end, variable["begin"] + (numrecs - 1) * recsize + size)
+        else:
+            end = max(end, variable["begin"] + variable["vsize"])
+    return dimensions, variables, numrecs, recsize, end
+
+
+def _elements(variable, dimensions):
+    lengths = dict(dimensions)
+    count = 1
+    for name in variable["dimensions"][1:]:
+        count *= lengths[name]
+    return count
+
+
+def _value(buffer, variable, index, recsize):
+    fmt, size = TYPES[variable["type"]]
+    if variable["record"]:
+        position = variable["begin"] + index * recsize
+    else:
+        position = variable["begin"] + index * size
+    if position + size > len(buffer):
+        raise HeaderError("data truncated")
+    return struct.unpack_from(">" + fmt, buffer, position)[0]
+
+
+def read(filepath):
+    """Return header summary {"variables": [names], "time": (first, last) or None, "steps", "units", "calendar"}.
+
+    Classic files are read via a memory map, only the header and the first and last value of the time variable are
+    touched. Raises HeaderError if the file is truncated or not readable as NetCDF.
+    """
+    with open(filepath, "rb") as stream:
+        signature = stream.read(8)
+        if signature == HDF5_SIGNATURE:
+            return _netcdf4(filepath)
+        stream.seek(0, 2)
+        filesize = stream.tell()
+        if filesize == 0:
+            raise HeaderError("empty file")
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            dimensions, variables, numrecs, recsize, end = _classic(buffer)
+            if end > filesize:
+                raise HeaderError(f"truncated, {filesize} of {end} bytes")
+            summary = {"variables": sorted(variables), "time": None, "steps": 0, "units": None, "calendar": None}
+            time = variables.get("time")
+            if time is not None:
+                lengths = dict(dimensions)
+                steps = numrecs if time["record"] else lengths[time["dimensions"][0]]
+                summary["steps"] = steps
+                if steps > 0:
+                    summary["time"] = (_value(buffer, time, 0, recsize), _value(buffer, time, steps - 1, recsize))
+                summary["units"] = time["attributes"].get("units")
+                summary["calendar"] = time["attributes"].get("calendar")
+    return summary
+
+
+def layout(filepath):
+    """Return layout of a classic file {"version", "dimension", "numrecs", "recsize", "data", "records", "end"}.
+
+    dimension is the name of the record (unlimited) dimension or None, data the offset of the first variable, i.e. the
+    header is the bytes before it, records the offset of the record section with numrecs records of recsize bytes, end
+    the expected file size. Raises HeaderError for NetCDF-4, empty or truncated files.
+    """
+    with open(filepath, "rb") as stream:
+        stream.seek(0, 2)
+        filesize = stream.tell()
+        if filesize == 0:
+            raise HeaderError("empty file")
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            dimensions, variables, numrecs, recsize, end = _classic(buffer)
+            version = buffer[3]
+    if end > filesize:
+        raise HeaderError(f"truncated, {filesize} of {end} bytes")
+    begins = [variable["begin"] for variable in variables.values()]
+    records = [variable["begin"] for variable in variables.values() if variable["record"]]
+    return {
+        "version": version,
+        # unlimited dimension has length 0
+        "dimension": next((name for name, length in dimensions if length == 0), None),
+        "numrecs": numrecs,
+        "recsize": recsize,
+        "data": min(begins, default=end),
+        "records": min(records, default=end),
+        "end": end,
+    }
+
+
+def _netcdf4(filepath):
+    if netCDF4 is None:
+        raise HeaderError("NetCDF-4 file, netCDF4 not installed")
+    try:
+        with netCDF4.Dataset(filepath) as dataset:
+            summary = {
+                "variables": sorted(dataset.variables), "time": None, "steps": 0, "units": None, "calendar": None
+            }
+            time = dataset.variables.get("time")
+            if time is not None:
+                summary["steps"] = len(time)
+                if len(time) > 0:
+                    summary["time"] = (float(time[0]), float(time[-1]))
+                summary["units"] = getattr(time, "units", None)
+                summary["calendar"] = getattr(time, "calendar", None)
+    except (OSError, RuntimeError) as e:
+        raise HeaderError(str(e))
+    return summary
+
+
+# seconds per unit of CF time units
+UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+MONTHS_365 = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+MONTHS_366 = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def year(value, units, calendar=None):
+    """Year of a time value in CF units, e.g. "days since 1850-01-01", for the usual CF calendars."""
+    match = re.match(r"\s*(\w+?)s?\s+since\s+(-?\d+)-(\d+)-(\d+)", units or "")
+    if match is None or match.group(1) not in UNITS:
+        raise HeaderError(f"unsupported time units '{units}'")
+    days = value * UNITS[match.group(1)] / 86400
+    base_year, base_month, base_day = (int(match.group(i)) for i in (2, 3, 4))
+    calendar = (calendar or "standard").lower()
+    if calendar in ("standard", "gregorian", "proleptic_gregorian", "julian"):
+        return (datetime.datetime(base_year, base_month, base_day) + datetime.timedelta(days=days)).year
+    if calendar in ("noleap", "365_day"):
+        months, length = MONTHS_365, 365
+    elif calendar in ("all_leap", "366_day"):
+        months, length = MONTHS_366, 366
+    elif calendar == "360_day":
+        months, length = (30,) * 12, 360
+    else:
+        raise HeaderError(f"unsupported calendar '{calendar}'")
+    day_of_year = sum(months[:base_month - 1]) + base_day - 1
+    return base_year + int((day_of_year + days) // length)
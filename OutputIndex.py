@@ -0,0 +1,71 @@
+# index of existing output files, each output directory listed once, to skip runs whose output was computed before
+#  imports
+import concurrent.futures
+import os
+
+from ruamel.yaml import ruamel
+
+import NetCDFHeader
+
+
+def output_file(settings_file):
+    """Absolute path of the output file of a settings file, relative paths taken from its directory, None if unset."""
+    with open(settings_file, "r") as stream:
+        settings = ruamel.yaml.YAML(typ="safe").load(stream) or {}
+    filepath = (settings.get("output") or {}).get("file")
+    if not filepath:
+        return None
+    return os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(settings_file)), filepath))
+
+
+def _valid(filepath):
+    try:
+        NetCDFHeader.read(filepath)
+    except (NetCDFHeader.HeaderError, OSError, ValueError):
+        return False
+    return True
+
+
+class OutputIndex:
+    """Names of the files in output directories, each directory listed by a single os.scandir on first use.
+
+    A file exists if it is listed and has at least min_size bytes, with verify its NetCDF header must also be
+    readable and not truncated, see NetCDFHeader.read. Only listed files are stat'ed or verified.
+    """
+
+    def __init__(self, min_size=1, verify=False):
+        self.min_size = min_size
+        self.verify = verify
+        self.directories = {}  # directory -> set of file names
+        self.listings = 0
+
+    def names(self, directory):
+        names = self.directories.get(directory)
+        if names is None:
+            names = set()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        names.add(entry.name)
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+            self.directories[directory] = names
+            self.listings += 1
+        return names
+
+    def _exists(self, filepath):
+        try:
+            if os.stat(filepath).st_size < self.min_size:
+                return False
+        except OSError:
+            return False
+        return not self.verify or _valid(filepath)
+
+    def existing(self, filepaths, workers=8):
+        """Return set of filepaths that exist, checked concurrently by workers threads."""
+        listed = [
+            filepath for filepath in set(filepaths)
+            if os.path.basename(filepath) in self.names(os.path.dirname(filepath))
+        ]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return {filepath for filepath, exists in zip(listed, executor.map(self._exists, listed)) if exists}
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# concatenation of the per-period outputs of each model along time into one NetCDF file, streamed in chunks of bounded
+# size, models merged in parallel by a process pool
+
+import argparse
+import concurrent.futures
+import os
+import struct
+import time
+
+import FileGrouping
+import NetCDFHeader
+import PathListIO
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+# bytes read and written at once per merge, i.e. the memory of each worker
+CHUNK_BYTES = 64 * 1024 * 1024
+
+
+class MergeError(Exception):
+    pass
+
+
+def merged_file(outputdir, model, summaries):
+    """Path of the merged output of model, named after the first and last year of its ordered summaries, see
+    ordered."""
+    first, last = summaries[0][1], summaries[-1][1]
+    start_year = NetCDFHeader.year(first["time"][0], first["units"], first["calendar"])
+    end_year = NetCDFHeader.year(last["time"][1], last["units"], last["calendar"])
+    return os.path.join(outputdir, "merged_{}_{}{}.nc".format(model, start_year, end_year))
+
+
+def ordered(paths):
+    """[(path, header summary)] of paths in time order, see NetCDFHeader.read.
+
+    Raises MergeError if a file is not readable, has no time values or differs in time units or calendar.
+    """
+    summaries = []
+    for path in paths:
+        try:
+            summary = NetCDFHeader.read(path)
+        except (NetCDFHeader.HeaderError, OSError, ValueError) as e:
+            raise MergeError("{}: {}".format(path, e))
+        if summary["time"] is None:
+            raise MergeError("{}: no time values".format(path))
+        summaries.append((path, summary))
+    summaries.sort(key=lambda item: item[1]["time"][0])
+    for path, summary in summaries[1:]:
+        if (summary["units"], summary["calendar"]) != (summaries[0][1]["units"], summaries[0][1]["calendar"]):
+            raise MergeError("{}: time units '{}' or calendar '{}' differ from {}".format(
+                path, summary["units"], summary["calendar"], summaries[0][0]
+            ))
+    return summaries
+
+
+def check_continuity(summaries):
+    """Raise MergeError if consecutive files of ordered summaries overlap in time or leave a gap.
+
+    The expected step is the mean time step of the earlier file, gaps are more than 1.5 steps to allow for months of
+    different length; files of a single step take the step of the other files.
+    """
+    steps = [
+        (summary["time"][1] - summary["time"][0]) / (summary["steps"] - 1)
+        for _, summary in summaries if summary["steps"] > 1
+    ]
+    default_step = min(steps) if steps else None
+    for (previous_path, previous), (path, summary) in zip(summaries, summaries[1:]):
+        delta = summary["time"][0] - previous["time"][1]
+        if delta <= 0:
+            raise MergeError("{} starting at {} overlaps {} ending at {} {}".format(
+                path, summary["time"][0], previous_path, previous["time"][1], previous["units"]
+            ))
+        if previous["steps"] > 1:
+            step = (previous["time"][1] - previous["time"][0]) / (previous["steps"] - 1)
+        else:
+            step = default_step
+        if step is not None and delta > 1.5 * step:
+            raise MergeError("gap of {:g} time steps between {} and {}".format(
+                delta / step - 1, previous_path, path
+            ))
+
+
+def _copy(source, destination, start, length, chunk_bytes):
+    source.seek(start)
+    while length > 0:
+        data = source.read(min(chunk_bytes, length))
+        if not data:
+            raise MergeError("{} truncated while copying".format(source.name))
+        destination.write(data)
+        length -= len(data)
+
+
+def _header(path, layout):
+    with open(path, "rb") as stream:
+        header = stream.read(layout["data"])
+    # numrecs follows the 4 byte magic, 64 bit in version 5
+    width = 8 if layout["version"] == 5 else 4
+    return header[:4], header[4 + width:]
+
+
+def _merge_classic(paths, output, chunk_bytes):
+    """Concatenate the record sections of classic files with identical headers apart from numrecs, the header and
+    fixed size variables are taken from the first file. Returns None if the files cannot be merged this way, also if
+    time is a fixed dimension, whose values would be taken from the first file only."""
+    layouts = []
+    for path in paths:
+        try:
+            layouts.append(NetCDFHeader.layout(path))
+        except NetCDFHeader.HeaderError:
+            return None
+        if layouts[-1]["dimension"] != "time":
+            return None
+    header = _header(paths[0], layouts[0])
+    for path, layout in zip(paths[1:], layouts[1:]):
+        if (layout["version"], layout["recsize"], layout["records"]) != (
+                layouts[0]["version"], layouts[0]["recsize"], layouts[0]["records"]) or _header(path, layout) != header:
+            return None
+    numrecs = sum(layout["numrecs"] for layout in layouts)
+    version = layouts[0]["version"]
+    if version != 5 and numrecs > 2 ** 31 - 1:
+        return None
+    with open(output, "wb") as destination:
+        destination.write(header[0] + struct.pack(">q" if version == 5 else ">i", numrecs) + header[1])
+        with open(paths[0], "rb") as source:
+            _copy(source, destination, layouts[0]["data"], layouts[0]["records"] - layouts[0]["data"], chunk_bytes)
+        for path, layout in zip(paths, layouts):
+            with open(path, "rb") as source:
+                _copy(source, destination, layout["records"], layout["numrecs"] * layout["recsize"], chunk_bytes)
+    return numrecs
+
+
+def _merge_netcdf4(paths, output, chunk_bytes):
+    """Copy variables of the first file and append the time slices of all files in chunks of at most chunk_bytes,
+    values are copied unscaled and unmasked."""
+    if netCDF4 is None:
+        raise MergeError("files differ in layout or are NetCDF-4, netCDF4 not installed")
+    with netCDF4.Dataset(paths[0]) as first, netCDF4.Dataset(output, "w", format=first.data_model) as merged:
+        first.set_auto_maskandscale(False)
+        merged.set_auto_maskandscale(False)
+        merged.setncatts({name: first.getncattr(name) for name in first.ncattrs()})
+        for name, dimension in first.dimensions.items():
+            merged.createDimension(name, None if name == "time" or dimension.isunlimited() else len(dimension))
+        for name, variable in first.variables.items():
+            if "time" in variable.dimensions and variable.dimensions[0] != "time":
+                raise MergeError("{}: time is not the first dimension of {}".format(paths[0], name))
+            attributes = {attribute: variable.getncattr(attribute) for attribute in variable.ncattrs()}
+            filters = variable.filters() or {}
+            copy = merged.createVariable(
+                name,
+                variable.datatype,
+                variable.dimensions,
+                zlib=filters.get("zlib", False),
+                complevel=filters.get("complevel", 4),
+                shuffle=filters.get("shuffle", True),
+                fill_value=attributes.pop("_FillValue", None),
+            )
+            copy.setncatts(attributes)
+            if "time" not in variable.dimensions:
+                copy[...] = variable[...]
+        offset = 0
+        for path in paths:
+            with netCDF4.Dataset(path) as dataset:
+                dataset.set_auto_maskandscale(False)
+                if "time" not in dataset.dimensions:
+                    raise MergeError("{}: no time dimension".format(path))
+                steps = len(dataset.dimensions["time"])
+                for name, variable in dataset.variables.items():
+                    if "time" not in variable.dimensions:
+                        continue
+                    if name not in merged.variables:
+                        raise MergeError("{}: variable {} not in {}".format(path, name, paths[0]))
+                    step_bytes = variable.dtype.itemsize
+                    for length in variable.shape[1:]:
+                        step_bytes *= length
+                    chunk = max(1, chunk_bytes // max(1, step_bytes))
+                    for start in range(0, steps, chunk):
+                        stop = min(start + chunk, steps)
+                        merged.variables[name][offset + start:offset + stop] = variable[start:stop]
+                offset += steps
+    return offset
+
+
+def merge(paths, output, chunk_bytes=CHUNK_BYTES):
+    """Concatenate paths along time into output, return {"files", "steps", "method", "seconds"}.
+
+    Files are ordered by their first time value and checked for overlaps and gaps. Classic files of the same layout are
+    merged by copying their bytes, others via netCDF4. At most chunk_bytes are held in memory at once. output is
+    written as *.partial first, raises MergeError with output unchanged if the files cannot be merged.
+    """
+    return _merge_ordered(ordered(paths), output, chunk_bytes)
+
+
+def _merge_ordered(summaries, output, chunk_bytes):
+    start = time.perf_counter()
+    check_continuity(summaries)
+    paths = [path for path, _ in summaries]
+    expected = sum(summary["steps"] for _, summary in summaries)
+    partial = output + ".partial"
+    try:
+        steps = _merge_classic(paths, partial, chunk_bytes)
+        method = "classic"
+        if steps is None:
+            steps = _merge_netcdf4(paths, partial, chunk_bytes)
+            method = "netCDF4"
+        if steps != expected:
+            raise MergeError("merged {} time steps, inputs have {}".format(steps, expected))
+        os.replace(partial, output)
+    except (OSError, RuntimeError) as e:
+        raise MergeError(str(e))
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return {"files": len(paths), "steps": steps, "method": method, "seconds": time.perf_counter() - start}
+
+
+def _merge_group(model, paths, outputdir, chunk_bytes):
+    try:
+        summaries = ordered(paths)
+        output = merged_file(outputdir, model, summaries)
+        return output, _merge_ordered(summaries, output, chunk_bytes), None
+    except (MergeError, NetCDFHeader.HeaderError) as e:
+        return None, None, str(e)
+
+
+def merge_groups(groups, outputdir, workers=4, chunk_bytes=CHUNK_BYTES):
+    """Merge {model: [paths]} into one file per model in outputdir by a pool of worker processes.
+
+    Returns {model: (merged file, merge result, error)}, error is None for merged models. Peak memory is about
+    workers * chunk_bytes.
+    """
+    os.makedirs(outputdir, exist_ok=True)
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_merge_group, model, paths, outputdir, chunk_bytes): model
+            for model, paths in groups.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+
+def report(results):
+    """Lines of merged and failed models of merge_groups results."""
+    lines = []
+    for model in sorted(results):
+        output, result, error = results[model]
+        if error is None:
+            lines.append("{}: {} files, {} time steps merged into {} ({}, {:.1f} s)".format(
+                model, result["files"], result["steps"], output, result["method"], result["seconds"]
+            ))
+        else:
+            lines.append("FAILED {}: {}".format(model, error))
+    return lines
+
+
+if __name__ == "__main__":
+    # merge lists data_<model>.yml written by FileListFiltering.py
+    parser = argparse.ArgumentParser(description="Concatenate the per-period outputs of models along time")
+    parser.add_argument("lists", nargs="+", type=str, help="YML or TXT lists of output files to merge, one per model")
+    parser.add_argument("--outputdir", type=str, required=True, help="Directory the merged files are written to")
+    parser.add_argument("--workers", type=int, default=4, help="Models merged in parallel (default: 4)")
+    parser.add_argument(
+        "--chunk", type=int, default=CHUNK_BYTES // 1024 // 1024, help="MB copied at once per worker (default: 64)"
+    )
+    args = parser.parse_args()
+
+    groups = {}
+    for i_list in args.lists:
+        groups.update(FileGrouping.group_paths(PathListIO.read_list(i_list), "output")[0])
+    results = merge_groups(groups, args.outputdir, workers=args.workers, chunk_bytes=args.chunk * 1024 * 1024)
+    for line in report(results):
+        print(line)
+    if any(error is not None for _, _, error in results.values()):
+        exit(1)
@@ -0,0 +1,169 @@
+# streaming reading and writing of path lists stored as YAML sequence (*.yml) or one path per line (*.txt)
+#  imports
+import itertools
+import json
+import os
+import re
+import sys
+
+# plain YAML scalars which can be written without quotes and read back as the same string
+PLAIN_SCALAR = re.compile(r"[A-Za-z0-9_./~+-][A-Za-z0-9_./~+=@%,()-]*")
+# plain scalars which would be read back as something else than a string
+NON_STRING = re.compile(r"(null|Null|NULL|~|true|True|TRUE|false|False|FALSE|yes|Yes|no|No|on|On|off|Off"
+                        r"|[-+]?(\d[\d_]*)?\.?\d+([eE][-+]?\d+)?|0x[0-9a-fA-F]+|0o[0-7]+|[-+]?\.(inf|Inf|INF)|\.(nan|NaN|NAN))")
+
+
+def is_text(path):
+    """Whether path is a newline-delimited list instead of a YAML sequence."""
+    return os.path.splitext(path)[1] in (".txt", ".lst")
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _load_yaml(path):
+    from ruamel.yaml import ruamel
+    yaml = ruamel.yaml.YAML(typ="safe")
+    with open(path, "r") as stream:
+        return yaml.load(stream) or []
+
+
+def _scalar(text):
+    # decode a single-line YAML scalar as written for list entries
+    if text.startswith("'"):
+        if len(text) < 2 or not text.endswith("'"):
+            raise _Unsupported(text)
+        return text[1:-1].replace("''", "'")
+    if text.startswith('"'):
+        try:
+            return json.loads(text)
+        except ValueError:
+            raise _Unsupported(text)
+    if text.startswith(("[", "{", "&", "*", "!", "|", ">", "- ")) or " #" in text or ": " in text or text.endswith(":"):
+        raise _Unsupported(text)
+    return text
+
+
+def _read_yaml(path):
+    count = 0
+    try:
+        with open(path, "r") as stream:
+            item = None
+            for line in stream:
+                line = line.rstrip("\n")
+                stripped = line.strip()
+                if not stripped or stripped.startswith("#") or stripped == "---":
+                    continue
+                if stripped == "[]" and count == 0 and item is None:
+                    return
+                if line.startswith("- "):
+                    if item is not None:
+                        yield _scalar(item)
+                        count += 1
+                    item = line[2:].strip()
+                elif line.startswith(" ") and item is not None and not item.startswith(("'", '"')):
+                    # folded continuation of a long plain scalar
+                    item += " " + stripped
+                elif stripped == "...":
+                    break
+                else:
+                    raise _Unsupported(line)
+            if item is not None:
+                yield _scalar(item)
+    except _Unsupported:
+        # anything but a block sequence of single-line scalars is left to the full YAML parser
+        for entry in _load_yaml(path)[count:]:
+            yield str(entry)
+
+
+def read_list(path):
+    """Iterate over the entries of a path list without loading the whole document."""
+    if is_text(path):
+        with open(path, "r") as stream:
+            for line in stream:
+                line = line.rstrip("\n")
+                if line:
+                    yield line
+    else:
+        yield from _read_yaml(path)
+
+
+def quote(entry):
+    """Return entry as YAML scalar."""
+    entry = str(entry)
+    if PLAIN_SCALAR.fullmatch(entry) and not NON_STRING.fullmatch(entry):
+        return entry
+    if "\n" in entry or not entry.isprintable():
+        return json.dumps(entry)
+    return "'" + entry.replace("'", "''") + "'"
+
+
+class ListWriter:
+    """Write a path list entry by entry, as YAML block sequence or one path per line depending on extension."""
+
+    def __init__(self, path):
+        self.path = path
+        self.text = is_text(path)
+        self.count = 0
+        self.stream = open(path, "w")
+
+    def append(self, entry):
+        if self.text:
+            self.stream.write(str(entry) + "\n")
+        else:
+            self.stream.write("- " + quote(entry) + "\n")
+        self.count += 1
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def close(self):
+        # empty YAML list has to be written explicitly
+        if self.count == 0 and not self.text:
+            self.stream.write("[]\n")
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_list(path, entries):
+    with ListWriter(path) as writer:
+        writer.extend(entries)
+    return writer.count
+
+
+def replace_list(path, entries):
+    """Write a path list unless it has these entries already, via a temporary file replacing it at once, so readers
+    never see a partly written list. Returns whether the list was written."""
+    entries = [str(entry) for entry in entries]
+    if os.path.exists(path) and list(read_list(path)) == entries:
+        return False
+    root, extension = os.path.splitext(path)
+    partial = "{}.{}.partial{}".format(root, os.getpid(), extension)
+    try:
+        write_list(partial, entries)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return True
+
+
+def read_item(path, index):
+    """Return entry number index of a path list, reading only up to that entry."""
+    for entry in itertools.islice(read_list(path), index, None):
+        return entry
+    raise IndexError("List '{}' has no entry {}".format(path, index))
+
+
+if __name__ == "__main__":
+    # print one entry of a list, e.g. the settings file of a Slurm array task
+    if len(sys.argv) != 3:
+        exit("Usage: {} LIST INDEX".format(sys.argv[0]))
+    print(read_item(sys.argv[1], int(sys.argv[2])))
@@ -2,18 +2,26 @@
 #  imports
 import argparse
 import os
-import re
-from pathlib import Path
 
-from ruamel.yaml import ruamel
+import CompletenessMatrix
+import DirectoryScanner
+import FileCatalog
+import InputValidation
+import Instrumentation
+import NamingConventions
+import OutputIndex
+import PathListIO
+import SettingsManifest
+import SettingsTemplate
 
 # Define parser
 parser = argparse.ArgumentParser(description="Scrape a directory for specified files")
 # Define root directory
 parser.add_argument(
     "--root",
+    nargs="+",
     type=str,
-    help="Path to root directory, which shall be scraped including subdirectories (default: CURRENT)",
+    help="Path(s) to root directories, which shall be scraped including subdirectories (default: CURRENT)",
 )
 
 # Define  yaml settings blueprint to be amended with pathname
@@ -62,27 +70,119 @@ parser.add_argument(
     help="Path and name to create output directory (default: settingsdir)"
 )
 
+parser.add_argument(
+    "--catalog",
+    nargs="?",
+    const="",
+    type=str,
+    help="Path to file catalog to speed up repeated scans and to store generated lists "
+         "(default if given without path: settingsdir/catalog.sqlite)"
+)
+
+parser.add_argument(
+    "--scan-workers",
+    type=int,
+    default=1,
+    help="Number of threads listing directories in parallel, useful on parallel filesystems (default: 1)"
+)
+
+parser.add_argument(
+    "--convention",
+    type=str,
+    default="cmip6",
+    choices=sorted(NamingConventions.CONVENTIONS),
+    help="Naming convention to identify scenario, variable, model and time period from filenames (default: cmip6)"
+)
+
+parser.add_argument(
+    "--listformat",
+    type=str,
+    default="yml",
+    choices=["yml", "txt"],
+    help="Format of generated lists of input, settings and output files, YML sequence or one path per line "
+         "(default: yml)"
+)
+
+parser.add_argument(
+    "--write-workers",
+    type=int,
+    default=1,
+    help="Number of threads writing settings files in batches (default: 1)"
+)
+
 # variants for execution
 parser.add_argument("--isimip", action="store_true", help="follow ISIMIP naming conventions to identify model")
+parser.add_argument(
+    "--incremental",
+    action="store_true",
+    help="only write settings files whose content changed, tracked by content hashes in settings/manifest.json",
+)
+parser.add_argument(
+    "--required",
+    nargs="*",
+    type=str,
+    help="search terms a combination of scenario, model and period needs to get a settings file, others are filled "
+         "in if found; without search terms any combination with files (default: all search terms)",
+)
+parser.add_argument(
+    "--skip-existing",
+    action="store_true",
+    help="leave combinations whose output file exists and is not empty out of the list of settings, "
+         "the output directory is listed once",
+)
+parser.add_argument(
+    "--verify-existing",
+    action="store_true",
+    help="with --skip-existing, only leave out combinations whose output has a readable, complete NetCDF header",
+)
+parser.add_argument(
+    "--validate",
+    action="store_true",
+    help="check NetCDF headers of all inputs for variables and time coverage, cached in settings/validation.sqlite",
+)
+
+parser.add_argument(
+    "--profile",
+    nargs="?",
+    const="profile.json",
+    type=str,
+    help="time hot paths and write them as Chrome trace to this file (default: profile.json) plus a summary table",
+)
+parser.add_argument(
+    "--cprofile",
+    action="store_true",
+    help="with --profile, also profile the whole run with cProfile, written next to the trace as *.prof",
+)
 
 args = parser.parse_args()
+if args.verify_existing and not args.skip_existing:
+    exit("--verify-existing requires --skip-existing")
+if args.cprofile and not args.profile:
+    exit("--cprofile requires --profile")
+if args.profile:
+    Instrumentation.enable(args.profile, profile=args.cprofile)
 
 # default root directory
 if not args.root:
-    args.root = os.getcwd()
+    args.root = [os.getcwd()]
 
-if not os.path.exists(args.root):
-    exit("root directory '{}' not found".format(args.root))
+for i_root in args.root:
+    if not os.path.exists(i_root):
+        exit("root directory '{}' not found".format(i_root))
 
 # default settings blueprint
 if not args.blueprint:
     args.blueprint = os.path.join(os.getcwd(), "blueprint.yml")
 
+# ISIMIP3b naming conventions
+if args.isimip:
+    args.convention = "isimip3b"
+
 # default file extension to look for
 if not args.fileextensions:
     args.fileextensions = ["nc"]
 
-# default -  search terms to look for TODO: generalize scenario default via blueprint.yml, make scenario search robust (ATM non-existing scenario results might be filled up with data from previous scenarios
+# default -  search terms to look for TODO: generalize scenario default via blueprint.yml
 if not args.scenarios:
     args.scenarios = (["historical", "ssp126", "ssp370" "ssp585"])
 
@@ -98,146 +198,133 @@ if not args.settingsdir:
 if not args.outputdir:
     args.outputdir = args.settingsdir
 
+# generated lists and settings files refer to absolute paths
+args.settingsdir = os.path.abspath(args.settingsdir)
+args.outputdir = os.path.abspath(args.outputdir)
+
+# default location of file catalog
+catalog = None
+if args.catalog is not None:
+    if not args.catalog:
+        args.catalog = os.path.join(args.settingsdir, "catalog.sqlite")
+    catalog = FileCatalog.FileCatalog(args.catalog)
+
 settingsdir = os.path.join(args.settingsdir, "settings")
 outputdir = os.path.join(args.outputdir, "output")
-# loop over all search terms and file extensions, TBD extension for multiple variants
-filenames = {}
-filecache = []
-for i_scenario in args.scenarios:
-    for i_searchterm in args.searchterms:
-        for filename in Path(args.root).rglob("*.nc"):
-            if filename.rglob(i_searchterm + "*.nc"):
-                if Path(args.root).rglob((i_scenario + "_" + "*.nc")):
-                    filecache.append(str(filename))
-            filenames[i_scenario, i_searchterm] = filecache
-# load settings file
-yaml = ruamel.yaml.YAML()
-with open(args.blueprint, 'r') as stream:
-    try:
-        settings = yaml.load(stream)
-    except yaml.YAMLError as exc:
-        print(exc)
-# define someobjects to store results
-timeperiods = set()
-models = set()
-searchresults = {}  # TODO implement completeness check for results, i.e. relax assumption that always all search variables can be found
-# find files for each scenario
-for i_scenario in args.scenarios:
-    # find files for each search term
-    scenariopattern = ('(?<=/).*' + i_scenario + '.*' + args.fileextensions[0])
-    # NB: reasonable assumption, that all data is unique with respect to scenariopattern
-    for i_searchterm in args.searchterms:
-        searchpattern = ('(?<=/).*' + i_searchterm + '(_+)' + '.*' + args.fileextensions[0])
-        for i_filenames in filenames[i_scenario, i_searchterm]:
-            filepath_scenario = re.search(scenariopattern, i_filenames)
-            if filepath_scenario:
-                scenario_string = filepath_scenario.string
-                filepath_searchterm = re.search(searchpattern, scenario_string)
-                if filepath_searchterm:
-                    searchterm_string = filepath_searchterm.string
-                    # regular expression to get model identifier from filename under ISIMIP3b conventions
-
-                    if (args.isimip == True):
-                        time_period = re.search('(\d{4})(_)(\d{4})(.nc)$', searchterm_string)
-                        if (time_period):
-                            start_year = int(time_period.group(1))
-                            final_year = int(time_period.group(3))
-                        model = re.search('(.*/)(.*)(_r)(.*_)(\d{4}.\d{4}.nc)$',
-                                          searchterm_string)
-                        if (model):
-                            model_string = model.group(2)
-                        else:
-                            model_string = "model_not_identified"
-
-                        # regular expression to get model identifier from filename under CMIP6 conventions
-                    else:
-                        time_period = re.search('(\d{4})(\d{4})(.)(\d{4})(\d{4})(.nc)$', searchterm_string)
-                        if (time_period):
-                            start_year = int(time_period.group(1))
-                            final_year = int(time_period.group(4))
-                        model = re.search(
-                            '(.*/)(\w*_\w*_)(.*' + i_scenario + ')(_\w*_\w*_)(\d{4}\d{4}-\d{4}\d{4}.nc)$',
-                            searchterm_string)
-                        if (model):
-                            model_string = model.group(3)
-                        else:
-                            model_string = "model_not_identified"
-
-                    models.add(model_string)
-                    timespan = (start_year, final_year)
-                    timeperiods.add(timespan)
-                    searchresults[i_scenario, start_year, final_year, i_searchterm, model_string] = {
-                        "file": searchterm_string}
-timeperiods_list = list(timeperiods)
-models_list = list(models)
-# create setting files for all timespans and searchterms, TODO: check for simplification, redundancy reduction
+# walk root directories once and index all files by scenario, searchterm, model and time period
+index, scanreport = DirectoryScanner.scan(
+    args.root,
+    args.fileextensions,
+    args.scenarios,
+    args.searchterms,
+    convention=args.convention,
+    catalog=catalog,
+    workers=args.scan_workers,
+)
+print(scanreport)
+# load settings file once as template with placeholders for values changing between settings files
+fields = [("input", i_searchterm) for i_searchterm in args.searchterms]
+fields += [("input", "model"), ("years", "from"), ("years", "to"), ("output", "file")]
+template = SettingsTemplate.SettingsTemplate(args.blueprint, fields)
+# completeness of scenario x searchterm x model x timespan, settings are only generated for combinations with all
+# required searchterms
+if args.required is not None:
+    for i_searchterm in args.required:
+        if i_searchterm not in args.searchterms:
+            exit("required search term '{}' not in search terms".format(i_searchterm))
+with Instrumentation.span("completeness"):
+    matrix = CompletenessMatrix.CompletenessMatrix(index, args.scenarios, args.searchterms)
+    print(matrix.report(args.required))
 timespan_iterator = 0
-settingspathcollection = []
-outputpathcollection = []
-inputfilecollection = []
 # create directory to put settingsfiles
 
 os.chdir(args.settingsdir)
 if (os.path.exists(settingsdir) == False):
     os.mkdir(settingsdir)
+# create directory to put list of outputfiles
+if (os.path.exists(outputdir) == False):
+    os.mkdir(outputdir)
 
-for i_model in models_list:
-    for i_scenario in args.scenarios:
-        for i_timespan in timeperiods_list:
-            timeindex = str(i_timespan[0]) + str(i_timespan[1])
-            start_year = i_timespan[0]
-            final_year = i_timespan[1]
-            for i_searchterm in args.searchterms:
-                # check if key exists
-                if (i_scenario, start_year, final_year, i_searchterm, i_model) in searchresults.keys():
-                    settings["input"]["model"] = i_model
-                    # write filenames for searchterm
-                    filename = searchresults[i_scenario, start_year, final_year, i_searchterm, i_model][
-                        "file"]
-                    settings["input"][i_searchterm] = filename
-                    inputfilecollection.append(filename)
-                    # modify years
-                    settings["years"]["from"] = start_year
-                    settings["years"]["to"] = final_year
-            # modify output file
-            outputfilename = str("output_" + i_model + "_" + timeindex + ".nc")
-            outputfilepath = os.path.join(args.outputdir, outputfilename)
-            # collect paths to outputfiles
-            outputpathcollection.append(outputfilepath)
-            settings["output"]["file"] = outputfilepath
-            # save new settings file
-            name_settings = "settings_" + i_scenario + "_" + i_model + "_" + timeindex + ".yml"
-            yaml = ruamel.yaml.YAML()
-            yaml.default_flow_style = None
-            os.chdir(settingsdir)
-            with open(name_settings, "w") as output:
-                yaml.dump(settings, output)
-            # collect paths to settings
-            settingspathcollection.append(os.path.join(os.getcwd(), name_settings))
-            timespan_iterator += 1
-
-# create *.yml file of inputfiles:
+# lists of inputfiles, settingsfiles and outputfiles are written while settings files are generated
+inputfilelist = PathListIO.ListWriter(os.path.join(settingsdir, "inputfiles." + args.listformat))
+settingslist = PathListIO.ListWriter(os.path.join(settingsdir, "list_of_settings." + args.listformat))
+outputlist = PathListIO.ListWriter(os.path.join(outputdir, "list_of_outputfiles." + args.listformat))
+settingswriter = SettingsTemplate.SettingsWriter(workers=args.write_workers)
+manifest = SettingsManifest.SettingsManifest(settingsdir) if args.incremental else None
+# outputs computed before, from a single listing of the output directory
+existing_outputs = set()
+if args.skip_existing:
+    output_index = OutputIndex.OutputIndex(verify=args.verify_existing)
+    existing_outputs = output_index.existing(
+        os.path.join(args.outputdir, name) for name in output_index.names(args.outputdir)
+        if name.startswith("output_") and name.endswith(".nc")
+    )
+skipped = 0
+
+for i_model, i_scenario, i_timespan in matrix.combinations(args.required):
+    # start from blueprint, no values carried over from the previous combination
+    settings = dict(template.defaults)
+    timeindex = str(i_timespan[0]) + str(i_timespan[1])
+    start_year = i_timespan[0]
+    final_year = i_timespan[1]
+    settings["input", "model"] = i_model
+    # modify years
+    settings["years", "from"] = start_year
+    settings["years", "to"] = final_year
+    for i_searchterm in args.searchterms:
+        # check if key exists
+        filename = index.get(i_scenario, i_searchterm, i_model, start_year, final_year)
+        if filename is not None:
+            # write filenames for searchterm
+            settings["input", i_searchterm] = filename
+            inputfilelist.append(filename)
+    # modify output file, the model identifier includes the scenario so members of different scenarios do not share it
+    outputfilename = str("output_" + NamingConventions.output_model(i_model, i_scenario) + "_" + timeindex + ".nc")
+    outputfilepath = os.path.join(args.outputdir, outputfilename)
+    # collect paths to outputfiles
+    outputlist.append(outputfilepath)
+    settings["output", "file"] = outputfilepath
+    # no settings file for members whose output exists, the output stays in the list of outputs
+    if outputfilepath in existing_outputs:
+        skipped += 1
+        continue
+    # save new settings file
+    name_settings = "settings_" + i_scenario + "_" + i_model + "_" + timeindex + ".yml"
+    with Instrumentation.span("render settings"):
+        settingstext = template.render(settings)
+    # in incremental mode only write settings files whose content changed
+    if manifest is None or manifest.update(name_settings, settingstext):
+        settingswriter.write(os.path.join(settingsdir, name_settings), settingstext)
+    # collect paths to settings
+    settingslist.append(os.path.join(settingsdir, name_settings))
+    timespan_iterator += 1
+
+settingswriter.close()
 print('settingsfiles generated')
-os.chdir(settingsdir)
-yaml = ruamel.yaml.YAML()
-yaml.default_flow_style = None
-with open("inputfiles.yml", "w") as output:
-    yaml.dump(inputfilecollection, output)
-
-# create *.yml file of settingsfiles:
-
-os.chdir(os.path.join(args.settingsdir, "settings"))
-yaml = ruamel.yaml.YAML()
-yaml.default_flow_style = None
-with open("list_of_settings.yml", "w") as output:
-    yaml.dump(settingspathcollection, output)
-
-# create *.yml file of outputfiles:
-os.chdir(args.outputdir)
-if (os.path.exists(outputdir) == False):
-    os.mkdir(os.path.join(args.outputdir, "output"))
-os.chdir(outputdir)
-yaml = ruamel.yaml.YAML()
-yaml.default_flow_style = None
-with open("list_of_outputfiles.yml", "w") as output:
-    yaml.dump(outputpathcollection, output)
+if args.skip_existing:
+    print("{} members with existing output skipped, {} pending".format(skipped, timespan_iterator))
+if manifest is not None:
+    manifest.save()
+    print(manifest)
+inputfilelist.close()
+settingslist.close()
+outputlist.close()
+
+# store lists in catalog for FileListFiltering.py and SimpleEnsembleSimulation.py
+if catalog is not None:
+    catalog.store_list("inputfiles", settingsdir, PathListIO.read_list(inputfilelist.path))
+    catalog.store_list("settings", settingsdir, PathListIO.read_list(settingslist.path))
+    catalog.store_list("outputfiles", outputdir, PathListIO.read_list(outputlist.path))
+    catalog.close()
+
+# check headers of inputs before runs are scheduled, see InputValidation.py
+if args.validate:
+    with InputValidation.HeaderCache(os.path.join(settingsdir, InputValidation.CACHE_DB)) as cache:
+        with Instrumentation.span("validate"):
+            problems = InputValidation.validate(PathListIO.read_list(settingslist.path), cache)
+        print("{} input files checked, {} from cache".format(cache.inspected + cache.cached, cache.cached))
+    for settings_file in sorted(problems):
+        print(settings_file)
+        for problem in problems[settings_file]:
+            print("    " + problem)
+    print("{} settings files with invalid inputs".format(len(problems)))
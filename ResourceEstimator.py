@@ -0,0 +1,113 @@
+# estimation of runtime and memory of runs from completed runs of the same model, period length and variable count
+#  imports
+import collections
+import os
+
+from ruamel.yaml import ruamel
+
+import SettingsManifest
+
+
+def features(text):
+    """(model, years, number of input variables) of a settings document."""
+    settings = ruamel.yaml.YAML(typ="safe").load(text) or {}
+    inputs = settings.get("input") or {}
+    years = settings.get("years") or {}
+    try:
+        span = int(years["to"]) - int(years["from"]) + 1
+    except (KeyError, TypeError, ValueError):
+        span = 0
+    variables = sum(1 for key, value in inputs.items() if key != "model" and value)
+    return inputs.get("model"), span, variables
+
+
+def fit_line(points):
+    """Least squares (intercept, slope) of points (x, y), None if x does not vary."""
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return None
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+    return mean_y - slope * mean_x, slope
+
+
+def runtime(points, years):
+    """Runtime at years of a line fitted to points (years, seconds) with a slope of at least zero, proportional to
+    the mean runtime per year if all points have the same period length."""
+    line = fit_line(points)
+    if line is None:
+        return sum(i_seconds / max(1, i_years) for i_years, i_seconds in points) / len(points) * years
+    if line[1] < 0:
+        # longer periods do not run faster, e.g. noisy samples of few period lengths
+        return sum(i_seconds for _, i_seconds in points) / len(points)
+    return line[0] + line[1] * years
+
+
+class ResourceEstimator:
+    """Runtime and memory of runs learned from completed runs, see RunState.samples.
+
+    Runtime is fitted linearly in the period length per model and variable count with a slope of at least zero,
+    falling back to a fit of the runtime per variable of the model, memory is the maximum of the group. Estimates are
+    scaled by safety, never below the largest runtime or memory observed for the same features and never above the
+    runtime given, e.g. --time or the time limit of the partition.
+    """
+
+    def __init__(self, safety=1.25, min_seconds=300, min_memory=500):
+        self.safety = safety
+        self.min_seconds = min_seconds
+        self.min_memory = min_memory
+        self.samples = collections.defaultdict(list)  # (model, variables) -> [(years, seconds, memory)]
+
+    def add(self, model, years, variables, seconds, memory):
+        self.samples[model, variables].append((years, seconds, memory))
+
+    def learn(self, state):
+        """Add samples of all completed runs of a RunState, recording features of runs not seen before."""
+        for run_label, settings_hash, model, years, variables, seconds, memory in state.samples():
+            if years is None:
+                path_settings = os.path.join(run_label, "settings.yml")
+                if not os.path.exists(path_settings):
+                    continue
+                with open(path_settings, "r") as f:
+                    text = f.read()
+                if SettingsManifest.content_hash(text) != settings_hash:
+                    continue
+                model, years, variables = features(text)
+                state.store_features(settings_hash, model, years, variables)
+            self.add(model, years, variables, seconds, memory)
+
+    def __len__(self):
+        return sum(len(samples) for samples in self.samples.values())
+
+    def estimate(self, model, years, variables, seconds=None, memory=None):
+        """Return (seconds, memory in MB) of a run, given seconds and memory if there are no similar runs.
+
+        seconds is also the upper limit of estimated runtimes.
+        """
+        group = self.samples.get((model, variables))
+        if group:
+            estimate = runtime([(i_years, i_seconds) for i_years, i_seconds, _ in group], years)
+            same = [i_seconds for i_years, i_seconds, _ in group if i_years == years]
+            estimated_seconds = max([estimate] + same) * self.safety
+            memories = [i_memory for _, _, i_memory in group if i_memory]
+            estimated_memory = max(memories) * self.safety if memories else memory
+        else:
+            # runtime per variable of other variable counts of the model
+            points = [
+                (i_years, i_seconds / max(1, i_variables))
+                for (i_model, i_variables), samples in self.samples.items() if i_model == model
+                for i_years, i_seconds, _ in samples
+            ]
+            if not points:
+                return seconds, memory
+            estimated_seconds = runtime(points, years) * max(1, variables) * self.safety
+            estimated_memory = memory
+        estimated_seconds = max(self.min_seconds, estimated_seconds)
+        if seconds:
+            estimated_seconds = min(seconds, estimated_seconds)
+        return (
+            int(estimated_seconds),
+            int(max(self.min_memory, estimated_memory)) if estimated_memory else memory,
+        )
@@ -0,0 +1,237 @@
+# persistent state of the runs of an ensemble, stored as SQLite database in the settings directory
+#  imports
+import collections
+import datetime
+import os
+import sqlite3
+import threading
+
+STATE_DB = "runs.sqlite"
+
+# states of a run, besides PREPARED and SUBMITTED as reported by Slurm
+#  runs in DONE_STATES are not scheduled again by --resume
+PREPARED = "PREPARED"
+SUBMITTED = "SUBMITTED"
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+DONE_STATES = (SUBMITTED, PENDING, RUNNING, COMPLETED, "CONFIGURING", "COMPLETING", "REQUEUED", "RESIZING",
+               "SUSPENDED")
+
+# fields of the telemetry of a run besides its run label, see RunTelemetry.py
+TELEMETRY_FIELDS = (
+    "job_id", "started", "host", "cpus", "wall", "user", "system", "maxrss", "read_bytes", "write_bytes", "exitcode"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_label TEXT PRIMARY KEY,
+    settings TEXT NOT NULL,
+    settings_hash TEXT,
+    job_id TEXT,
+    submitted TEXT,
+    state TEXT NOT NULL,
+    exitcode INTEGER,
+    updated TEXT NOT NULL,
+    telemetry INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_state ON runs (state);
+CREATE INDEX IF NOT EXISTS runs_job_id ON runs (job_id);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    elapsed INTEGER,
+    timelimit INTEGER,
+    exitcode TEXT,
+    maxrss INTEGER,
+    queried REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS telemetry (
+    run_label TEXT PRIMARY KEY,
+    job_id TEXT,
+    started TEXT,
+    host TEXT,
+    cpus INTEGER,
+    wall REAL NOT NULL,
+    user REAL,
+    system REAL,
+    maxrss INTEGER,
+    read_bytes INTEGER,
+    write_bytes INTEGER,
+    exitcode INTEGER
+);
+CREATE TABLE IF NOT EXISTS features (
+    settings_hash TEXT PRIMARY KEY,
+    model TEXT,
+    years INTEGER NOT NULL,
+    variables INTEGER NOT NULL
+);
+"""
+
+
+def now():
+    return datetime.datetime.now().replace(microsecond=0).isoformat()
+
+
+class RunState:
+    """Settings hash, run directory, job id, submission time and last known state of every run of a settings directory.
+
+    Safe to use from several threads, every change is committed immediately so a crash loses no submitted job ids.
+    """
+
+    def __init__(self, settingsdir):
+        self.path = os.path.join(settingsdir, STATE_DB)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _execute(self, sql, parameters=()):
+        with self._lock, self.connection:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def prepared(self, run_label, settings, settings_hash, telemetry=False):
+        """Record run directory prepared for settings, forgetting job id and state of an earlier run.
+
+        With telemetry the run records its resource usage, see without_telemetry.
+        """
+        self._execute(
+            "INSERT OR REPLACE INTO runs (run_label, settings, settings_hash, state, updated, telemetry) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (run_label, settings, settings_hash, PREPARED, now(), int(telemetry)),
+        )
+
+    def submitted(self, run_label, jobid):
+        self._execute(
+            "UPDATE runs SET job_id = ?, submitted = ?, state = ?, updated = ? WHERE run_label = ?",
+            (str(jobid), now(), SUBMITTED, now(), run_label),
+        )
+
+    def finished(self, run_label, exitcode):
+        """Record exit code of run executed locally or reported by Slurm."""
+        self._execute(
+            "UPDATE runs SET state = ?, exitcode = ?, updated = ? WHERE run_label = ?",
+            (COMPLETED if exitcode == 0 else FAILED, exitcode, now(), run_label),
+        )
+
+    def failed(self, run_label):
+        """Record failed submission of run."""
+        self._execute("UPDATE runs SET state = ?, updated = ? WHERE run_label = ?", (FAILED, now(), run_label))
+
+    def set_states(self, states):
+        """Record last known state of runs, given as {job id: state}."""
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "UPDATE runs SET state = ?, updated = ? WHERE job_id = ?",
+                [(state, now(), str(jobid)) for jobid, state in states.items()],
+            )
+
+    def state(self, run_label):
+        rows = self._execute("SELECT state FROM runs WHERE run_label = ?", (run_label,))
+        return rows[0][0] if rows else None
+
+    def jobs(self):
+        """{job id: (run label, state, submission time)} of all submitted runs."""
+        rows = self._execute("SELECT job_id, run_label, state, submitted FROM runs WHERE job_id IS NOT NULL")
+        return {jobid: (run_label, state, submitted) for jobid, run_label, state, submitted in rows}
+
+    def cached_jobs(self):
+        """{job id: job info} as last queried from Slurm, see JobStatus."""
+        rows = self._execute("SELECT job_id, state, elapsed, timelimit, exitcode, maxrss, queried FROM jobs")
+        return {
+            jobid: {
+                "state": state,
+                "elapsed": elapsed,
+                "timelimit": timelimit,
+                "exitcode": exitcode,
+                "maxrss": maxrss,
+                "queried": queried,
+            }
+            for jobid, state, elapsed, timelimit, exitcode, maxrss, queried in rows
+        }
+
+    def store_jobs(self, jobs, queried):
+        """Cache {job id: job info} queried from Slurm at time queried and record the states of their runs."""
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO jobs (job_id, state, elapsed, timelimit, exitcode, maxrss, queried) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (jobid, info["state"], info.get("elapsed"), info.get("timelimit"), info.get("exitcode"),
+                     info.get("maxrss"), queried)
+                    for jobid, info in jobs.items()
+                ],
+            )
+        self.set_states({jobid: info["state"] for jobid, info in jobs.items()})
+
+    def samples(self):
+        """(run label, settings hash, model, years, variables, elapsed, maxrss) of runs completed as single job.
+
+        Features are None if not yet recorded by store_features. Runs sharing a job, as packed runs, are left out
+        since their elapsed time is the one of the whole bundle.
+        """
+        return self._execute(
+            "SELECT runs.run_label, runs.settings_hash, features.model, features.years, features.variables, "
+            "jobs.elapsed, jobs.maxrss FROM runs "
+            "JOIN jobs ON jobs.job_id = runs.job_id "
+            "LEFT JOIN features ON features.settings_hash = runs.settings_hash "
+            "WHERE jobs.state = 'COMPLETED' AND jobs.elapsed > 0 "
+            "AND (SELECT COUNT(*) FROM runs AS shared WHERE shared.job_id = runs.job_id) = 1"
+        )
+
+    def store_features(self, settings_hash, model, years, variables):
+        self._execute(
+            "INSERT OR REPLACE INTO features (settings_hash, model, years, variables) VALUES (?, ?, ?, ?)",
+            (settings_hash, model, years, variables),
+        )
+
+    def without_telemetry(self):
+        """Run labels of runs finished or submitted with telemetry but without it recorded yet, see RunTelemetry.
+
+        Runs prepared without telemetry are never looked at, so their run directories are not touched.
+        """
+        return [
+            run_label for run_label, in self._execute(
+                "SELECT run_label FROM runs WHERE telemetry = 1 AND state != ? "
+                "AND run_label NOT IN (SELECT run_label FROM telemetry)",
+                (PREPARED,),
+            )
+        ]
+
+    def store_telemetry(self, records):
+        """Record {run label: telemetry record} as written by RunTelemetry.py."""
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO telemetry (run_label, {}) VALUES ({})".format(
+                    ", ".join(TELEMETRY_FIELDS), ", ".join("?" * (len(TELEMETRY_FIELDS) + 1))
+                ),
+                [
+                    (run_label,) + tuple(record.get(field) for field in TELEMETRY_FIELDS)
+                    for run_label, record in records.items()
+                ],
+            )
+
+    def telemetry(self):
+        """(run label, settings, {field: value}) of all runs with recorded telemetry."""
+        rows = self._execute(
+            "SELECT telemetry.run_label, runs.settings, {} FROM telemetry "
+            "JOIN runs ON runs.run_label = telemetry.run_label".format(
+                ", ".join("telemetry." + field for field in TELEMETRY_FIELDS)
+            )
+        )
+        return [(row[0], row[1], dict(zip(TELEMETRY_FIELDS, row[2:]))) for row in rows]
+
+    def counts(self):
+        return collections.Counter(dict(self._execute("SELECT state, COUNT(*) FROM runs GROUP BY state")))
+
+    def __len__(self):
+        return self._execute("SELECT COUNT(*) FROM runs")[0][0]
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# resource usage of a model run: wall time, CPU time, peak RSS and I/O bytes from wait4, with low frequency sampling of
+# /proc for I/O counters, written as telemetry.json next to the run and summarized per ensemble from runs.sqlite
+
+import argparse
+import datetime
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import JobStatus
+import NamingConventions
+
+# name of the telemetry file written into the run directory
+TELEMETRY_FILE = "telemetry.json"
+# filesystems whose I/O bypasses the block layer of the node, read_bytes and write_bytes of /proc stay 0
+NETWORK_FILESYSTEMS = ("nfs", "nfs4", "lustre", "gpfs", "beegfs", "ceph", "cifs", "smb3", "panfs", "fuse.glusterfs")
+
+
+def read_io(pid):
+    """{"read_bytes": ..., "write_bytes": ..., "rchar": ..., "wchar": ...} of a process, None if not readable."""
+    try:
+        with open(f"/proc/{pid}/io", "r") as f:
+            counters = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None
+    return {key: int(counters[key]) for key in ("read_bytes", "write_bytes", "rchar", "wchar") if key in counters}
+
+
+def filesystem(path):
+    """Type of the filesystem path is on according to /proc/self/mounts, None if unknown."""
+    path = os.path.realpath(path)
+    mountpoint, fstype = "", None
+    try:
+        with open("/proc/self/mounts", "r") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount = fields[1].replace("\\040", " ")
+                if (path == mount or path.startswith(mount.rstrip("/") + "/")) and len(mount) > len(mountpoint):
+                    mountpoint, fstype = mount, fields[2]
+    except OSError:
+        return None
+    return fstype
+
+
+class Sampler(threading.Thread):
+    """Samples the I/O counters of a process every interval seconds while it runs, keeping the last readable values.
+
+    The final counters are read by run after the process exited, these samples remain if that fails.
+    """
+
+    def __init__(self, pid, interval=10.0):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.io = {}
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while True:
+            io = read_io(self.pid)
+            if io is not None:
+                self.io = io
+                self.samples += 1
+            if self._done.wait(self.interval):
+                return
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def run(cmd, interval=10.0):
+    """Run cmd, return (exit code, telemetry record).
+
+    CPU times and peak RSS are those reported by wait4 for the process and its waited for children. I/O counters of
+    /proc are read once more after the process exited but before it is reaped, they then include its waited for
+    children as well. Read and write bytes are the larger of these counters and the block I/O of wait4, or rchar and
+    wchar if the working directory is on a network filesystem, whose I/O is not counted as block I/O.
+    """
+    started = datetime.datetime.now().replace(microsecond=0).isoformat()
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd)
+    # Slurm signals the batch shell before the time limit, pass signals on to the model
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGUSR1):
+        signal.signal(signum, lambda received, frame: process.send_signal(received))
+    sampler = Sampler(process.pid, interval)
+    sampler.start()
+    # wait for the exit without reaping, /proc of the exited process keeps its final counters until wait4
+    while True:
+        try:
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+            break
+        except InterruptedError:
+            continue
+    wall = time.perf_counter() - start
+    sampler.stop()
+    io = read_io(process.pid) or sampler.io
+    while True:
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+            break
+        except InterruptedError:
+            continue
+    exitcode = os.waitstatus_to_exitcode(status)
+    # process was waited for by wait4
+    process.returncode = exitcode
+    if filesystem(os.getcwd()) in NETWORK_FILESYSTEMS and "rchar" in io:
+        read_bytes, write_bytes = io["rchar"], io["wchar"]
+    else:
+        read_bytes = max(io.get("read_bytes", 0), usage.ru_inblock * 512)
+        write_bytes = max(io.get("write_bytes", 0), usage.ru_oublock * 512)
+    return exitcode, {
+        "started": started,
+        "host": socket.gethostname(),
+        "job_id": os.environ.get("SLURM_JOB_ID"),
+        "cpus": int(os.environ.get("OMP_NUM_THREADS") or cpus()),
+        "wall": round(wall, 3),
+        "user": round(usage.ru_utime, 3),
+        "system": round(usage.ru_stime, 3),
+        # kB on Linux
+        "maxrss": usage.ru_maxrss // 1024,
+        "read_bytes": read_bytes,
+        "write_bytes": write_bytes,
+        "rchar": io.get("rchar"),
+        "wchar": io.get("wchar"),
+        "exitcode": exitcode,
+    }
+
+
+def read(run_label):
+    """Telemetry record of a run directory, None if not written."""
+    try:
+        with open(os.path.join(run_label, TELEMETRY_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def collect(state):
+    """Store telemetry of run directories in a RunState that has none recorded yet, return number of new records."""
+    records = {}
+    for run_label in state.without_telemetry():
+        record = read(run_label)
+        if record is not None:
+            records[run_label] = record
+    state.store_telemetry(records)
+    return len(records)
+
+
+def report(rows, factor=2.0, limit=10):
+    """Text report of telemetry rows (run label, settings, record) per model and runs beyond factor times the median
+    wall time or peak RSS of their model, at most limit of them."""
+    groups = {}
+    for run_label, settings, record in rows:
+        filename = NamingConventions.parse(settings, "settings")
+        model = filename.model if filename is not None else "unknown"
+        period = "{}-{}".format(filename.start_year, filename.end_year) if filename is not None else ""
+        groups.setdefault(model, []).append((run_label, period, record))
+    lines = ["{:<30} {:>6} {:>10} {:>10} {:>10} {:>8} {:>10} {:>10}".format(
+        "model", "runs", "wall p50", "wall p90", "wall max", "cpu eff", "rss p50", "rss max"
+    )]
+    outliers = []
+    for model in sorted(groups):
+        records = [record for _, _, record in groups[model]]
+        walls = sorted(record["wall"] for record in records)
+        rss = sorted(record["maxrss"] for record in records)
+        efficiency = sorted(
+            (record["user"] + record["system"]) / (record["wall"] * record["cpus"])
+            for record in records if record["wall"] > 0 and record["cpus"]
+        )
+        lines.append("{:<30} {:>6} {:>10.0f} {:>10.0f} {:>10.0f} {:>8.2f} {:>10} {:>10}".format(
+            model, len(records), JobStatus.percentile(walls, 50), JobStatus.percentile(walls, 90), walls[-1],
+            JobStatus.percentile(efficiency, 50) or 0.0, JobStatus.percentile(rss, 50), rss[-1],
+        ))
+        median_wall, median_rss = JobStatus.percentile(walls, 50), JobStatus.percentile(rss, 50)
+        for run_label, period, record in groups[model]:
+            if record["wall"] > factor * median_wall or record["maxrss"] > factor * median_rss:
+                outliers.append((record["wall"], model, period, run_label, record))
+    lines.append("wall in s, cpu efficiency as (user + system) / (wall * cpus), rss in MB")
+    if outliers:
+        lines.append("{} runs beyond {} times the median wall time or RSS of their model:".format(
+            len(outliers), factor
+        ))
+        for wall, model, period, run_label, record in sorted(outliers, reverse=True)[:limit]:
+            lines.append("    {} {} wall {:.0f} s, rss {} MB, exit code {}: {}".format(
+                model, period, wall, record["maxrss"], record["exitcode"], run_label
+            ))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a command recording its wall time, CPU time, peak RSS and I/O")
+    parser.add_argument(
+        "--output", type=str, default=TELEMETRY_FILE, help="JSON file to write (default: telemetry.json)"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=10.0, help="Seconds between samples of /proc I/O counters (default: 10)"
+    )
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="Command to run, after --")
+    args = parser.parse_args()
+    if args.command and args.command[0] == "--":
+        args.command = args.command[1:]
+    if not args.command:
+        parser.error("no command given")
+
+    exitcode, record = run(args.command, args.interval)
+    record["command"] = args.command
+    with open(args.output, "w") as f:
+        json.dump(record, f)
+    sys.exit(exitcode if exitcode >= 0 else 128 - exitcode)
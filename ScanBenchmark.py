@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# benchmark serial vs. parallel directory walks on a synthetic tree of empty files
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import DirectoryScanner
+
+parser = argparse.ArgumentParser(description="Compare serial and parallel directory walks on a synthetic tree")
+parser.add_argument("--files", type=int, default=20000, help="Number of empty files to create (default: 20000)")
+parser.add_argument("--filesperdir", type=int, default=50, help="Number of files per leaf directory (default: 50)")
+parser.add_argument("--fanout", type=int, default=8, help="Number of subdirectories per directory (default: 8)")
+parser.add_argument(
+    "--workers", nargs="+", type=int, default=[1, 2, 4, 8, 16], help="Worker counts to compare (default: 1 2 4 8 16)"
+)
+parser.add_argument("--repeat", type=int, default=3, help="Repetitions per worker count, best is reported (default: 3)")
+parser.add_argument(
+    "--dir",
+    type=str,
+    help="Directory to create the synthetic tree in, e.g. on the parallel filesystem (default: temporary directory)",
+)
+parser.add_argument("--keep", action="store_true", help="keep synthetic tree after benchmark")
+args = parser.parse_args()
+
+
+def leaf_directories(root, count, fanout):
+    # spread leaf directories over a tree with given fanout
+    depth = 1
+    while fanout ** depth < count:
+        depth += 1
+    for i_leaf in range(count):
+        parts = []
+        number = i_leaf
+        for _ in range(depth):
+            parts.append("d{:02d}".format(number % fanout))
+            number //= fanout
+        yield os.path.join(root, *parts)
+
+
+def create_tree(root, files, filesperdir, fanout):
+    scenarios = ["historical", "ssp126", "ssp370", "ssp585"]
+    variables = ["pr", "prsn", "tas"]
+    created = 0
+    leaves = (files + filesperdir - 1) // filesperdir
+    for i_leaf, directory in enumerate(leaf_directories(root, leaves, fanout)):
+        os.makedirs(directory, exist_ok=True)
+        for i_file in range(min(filesperdir, files - created)):
+            number = i_leaf * filesperdir + i_file
+            filename = "model{}_r1i1p1f1_w5e5_{}_{}_global_daily_{}_{}.nc".format(
+                number // 1000,
+                scenarios[number % len(scenarios)],
+                variables[number % len(variables)],
+                1850 + 10 * (number % 25),
+                1859 + 10 * (number % 25),
+            )
+            open(os.path.join(directory, filename), "w").close()
+            created += 1
+    return created
+
+
+root = tempfile.mkdtemp(prefix="scanbenchmark_", dir=args.dir)
+try:
+    start = time.perf_counter()
+    created = create_tree(root, args.files, args.filesperdir, args.fanout)
+    print("created {} files below {} in {:.1f} s".format(created, root, time.perf_counter() - start))
+
+    reference = None
+    serial = None
+    print("{:>8} {:>10} {:>12} {:>8}".format("workers", "seconds", "files/s", "speedup"))
+    for i_workers in args.workers:
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            found = DirectoryScanner.walk([root], ["nc"], workers=i_workers)
+            best = min(best, time.perf_counter() - start)
+        # parallel walks have to give the same result as the serial one
+        if reference is None:
+            reference = found
+        elif found != reference:
+            exit("walk with {} workers differs from walk with {} workers".format(i_workers, args.workers[0]))
+        if serial is None:
+            serial = best
+        print("{:>8} {:>10.3f} {:>12.0f} {:>8.2f}".format(i_workers, best, len(found) / best, serial / best))
+finally:
+    if not args.keep:
+        shutil.rmtree(root)
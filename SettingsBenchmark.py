@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# benchmark of settings file generation, rendering a pre-parsed blueprint vs. dumping a ruamel object per file
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from ruamel.yaml import ruamel
+
+import SettingsTemplate
+
+parser = argparse.ArgumentParser(description="Compare settings generation by template rendering and ruamel dumps")
+parser.add_argument(
+    "--blueprint",
+    type=str,
+    default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "blueprint.yml"),
+    help="Path to settings blueprint (default: blueprint.yml next to this script)",
+)
+parser.add_argument("--files", type=int, default=10000, help="Number of settings files to generate (default: 10000)")
+parser.add_argument(
+    "--write-workers", type=int, default=4, help="Threads writing rendered settings files (default: 4)"
+)
+parser.add_argument(
+    "--dir", type=str, help="Directory to write settings files to (default: temporary directory)"
+)
+args = parser.parse_args()
+
+searchterms = ["pr", "prsn", "tas"]
+
+
+def combinations(count):
+    # synthetic model x timespan combinations, same values for both generators
+    for number in range(count):
+        model = "MODEL-{}_ssp126".format(number % 100)
+        start_year = 1850 + 10 * (number // 100 % 25)
+        values = {("input", i_searchterm): "/data/cmip6/{}_day_{}_r1i1p1f1_gr1_{}0101-{}1231.nc".format(
+            i_searchterm, model, start_year, start_year + 9) for i_searchterm in searchterms}
+        values["input", "model"] = model
+        values["years", "from"] = start_year
+        values["years", "to"] = start_year + 9
+        values["output", "file"] = "/data/output/output_{}_{}{}.nc".format(model, start_year, start_year + 9)
+        yield "settings_ssp126_{}_{}{}_{}.yml".format(model, start_year, start_year + 9, number), values
+
+
+root = tempfile.mkdtemp(prefix="settingsbenchmark_", dir=args.dir)
+try:
+    dumpdir = os.path.join(root, "dump")
+    renderdir = os.path.join(root, "render")
+    os.mkdir(dumpdir)
+    os.mkdir(renderdir)
+
+    # previous loop: mutate loaded blueprint and dump it with a new YAML instance per file
+    yaml = ruamel.yaml.YAML()
+    with open(args.blueprint, "r") as stream:
+        settings = yaml.load(stream)
+    start = time.perf_counter()
+    for name, values in combinations(args.files):
+        for field, value in values.items():
+            settings[field[0]][field[1]] = value
+        yaml = ruamel.yaml.YAML()
+        yaml.default_flow_style = None
+        with open(os.path.join(dumpdir, name), "w") as output:
+            yaml.dump(settings, output)
+    dump_seconds = time.perf_counter() - start
+
+    # template rendering, blueprint parsed once
+    start = time.perf_counter()
+    fields = [("input", i_searchterm) for i_searchterm in searchterms]
+    fields += [("input", "model"), ("years", "from"), ("years", "to"), ("output", "file")]
+    template = SettingsTemplate.SettingsTemplate(args.blueprint, fields)
+    with SettingsTemplate.SettingsWriter(workers=args.write_workers) as writer:
+        for name, values in combinations(args.files):
+            writer.write(os.path.join(renderdir, name), template.render(values))
+    render_seconds = time.perf_counter() - start
+
+    # rendered settings have to load to the same content as dumped ones
+    loader = ruamel.yaml.YAML(typ="safe")
+    identical = 0
+    differing = []
+    for name, _ in combinations(args.files):
+        with open(os.path.join(dumpdir, name)) as dumped, open(os.path.join(renderdir, name)) as rendered:
+            dumped_text = dumped.read()
+            rendered_text = rendered.read()
+        if dumped_text == rendered_text:
+            identical += 1
+        elif loader.load(io.StringIO(dumped_text)) != loader.load(io.StringIO(rendered_text)):
+            differing.append(name)
+
+    print("{:>10} {:>10} {:>12}".format("generator", "seconds", "files/s"))
+    print("{:>10} {:>10.3f} {:>12.0f}".format("ruamel", dump_seconds, args.files / dump_seconds))
+    print("{:>10} {:>10.3f} {:>12.0f}".format("template", render_seconds, args.files / render_seconds))
+    print("speedup {:.1f}, {} of {} files textually identical, {} semantically different".format(
+        dump_seconds / render_seconds, identical, args.files, len(differing)
+    ))
+    if differing:
+        exit("rendered settings differ from dumped settings, e.g. {}".format(differing[0]))
+finally:
+    shutil.rmtree(root)
@@ -0,0 +1,79 @@
+# manifest of content hashes of generated settings files, kept in the settings directory
+#  imports
+import hashlib
+import json
+import os
+
+MANIFEST = "manifest.json"
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+
+class SettingsManifest:
+    """Content hash of every settings file generated in a directory and the hash of its last submission.
+
+    While generating, update() tells whether a settings file has to be (re)written. Entries not updated during a
+    generation are reported as removed by save().
+    """
+
+    def __init__(self, settingsdir):
+        self.path = os.path.join(settingsdir, MANIFEST)
+        self.files = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as stream:
+                self.files = json.load(stream)["files"]
+        self.updated = set()
+        self.added = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.removed = 0
+
+    def update(self, name, text):
+        """Record content of settings file name, return whether it has to be written."""
+        digest = content_hash(text)
+        self.updated.add(name)
+        entry = self.files.get(name)
+        if entry is None:
+            self.files[name] = {"hash": digest, "submitted": None}
+            self.added += 1
+            return True
+        if entry["hash"] != digest:
+            entry["hash"] = digest
+            self.changed += 1
+            return True
+        self.unchanged += 1
+        # file might have been deleted since the last generation
+        return not os.path.exists(os.path.join(os.path.dirname(self.path), name))
+
+    def hash(self, name):
+        entry = self.files.get(name)
+        return entry["hash"] if entry else None
+
+    def changed_since_submission(self, name):
+        """Whether settings file name was never submitted or changed since its last submission."""
+        entry = self.files.get(name)
+        return entry is None or entry["submitted"] != entry["hash"]
+
+    def mark_submitted(self, name):
+        entry = self.files.get(name)
+        if entry is not None:
+            entry["submitted"] = entry["hash"]
+
+    def save(self, generated=True):
+        """Write manifest, after a generation dropping entries of settings files no longer generated."""
+        if generated:
+            removed = set(self.files) - self.updated
+            for name in removed:
+                del self.files[name]
+            self.removed = len(removed)
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as stream:
+            json.dump({"files": self.files}, stream, indent=0, sort_keys=True)
+        os.replace(temporary, self.path)
+
+    def __str__(self):
+        return "{} settings files added, {} changed, {} unchanged, {} removed".format(
+            self.added, self.changed, self.unchanged, self.removed
+        )
@@ -0,0 +1,106 @@
+# settings files rendered from a blueprint parsed once, instead of dumping a YAML object per settings file
+#  imports
+import concurrent.futures
+import io
+import os
+import re
+
+from ruamel.yaml import ruamel
+
+import Instrumentation
+import PathListIO
+
+
+def scalar(value):
+    """Return value as YAML scalar, None as empty value."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return PathListIO.quote(value)
+
+
+class SettingsTemplate:
+    """Blueprint with placeholders for the given fields, each field given as tuple of keys, e.g. ("years", "from").
+
+    Fields missing in the blueprint are appended to their mapping, as assigning them to the loaded blueprint would.
+    """
+
+    def __init__(self, blueprint, fields):
+        yaml = ruamel.yaml.YAML()
+        with open(blueprint, "r") as stream:
+            settings = yaml.load(stream)
+        self.fields = [tuple(field) for field in fields]
+        self.defaults = {}
+        for number, field in enumerate(self.fields):
+            mapping = settings
+            for key in field[:-1]:
+                mapping = mapping[key]
+            self.defaults[field] = mapping.get(field[-1])
+            mapping[field[-1]] = "PLACEHOLDER{:06d}".format(number)
+        yaml.default_flow_style = None
+        output = io.StringIO()
+        yaml.dump(settings, output)
+        # split rendered blueprint into constant text and fields, the space before a placeholder belongs to the field
+        parts = re.split(r" PLACEHOLDER(\d{6})", output.getvalue())
+        self._text = parts[0::2]
+        self._fields = [self.fields[int(number)] for number in parts[1::2]]
+
+    def render(self, values):
+        """Return settings document with values of fields, fields without value keep the blueprint value."""
+        rendered = [self._text[0]]
+        for field, text in zip(self._fields, self._text[1:]):
+            value = scalar(values.get(field, self.defaults[field]))
+            if value:
+                rendered.append(" ")
+                rendered.append(value)
+            rendered.append(text)
+        return "".join(rendered)
+
+
+def write_file(filepath, text):
+    with open(filepath, "w") as output:
+        output.write(text)
+    return len(text)
+
+
+class SettingsWriter:
+    """Collect rendered settings files and write them in batches, optionally by a pool of threads."""
+
+    def __init__(self, workers=1, batchsize=1000):
+        self.workers = workers
+        self.batchsize = batchsize
+        self.batch = []
+        self.written = 0
+        self.bytes = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def write(self, filepath, text):
+        self.batch.append((os.path.abspath(filepath), text))
+        if len(self.batch) >= self.batchsize:
+            self.flush()
+
+    def flush(self):
+        with Instrumentation.span("write settings", files=len(self.batch)):
+            if self._executor is None:
+                sizes = [write_file(filepath, text) for filepath, text in self.batch]
+            else:
+                sizes = list(self._executor.map(lambda item: write_file(*item), self.batch))
+        self.written += len(sizes)
+        self.bytes += sum(sizes)
+        Instrumentation.count("settings files written", len(sizes))
+        Instrumentation.count("settings bytes written", sum(sizes))
+        self.batch = []
+
+    def close(self):
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
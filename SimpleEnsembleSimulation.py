@@ -2,27 +2,43 @@
 # -*- coding: utf-8 -*-
 #  imports
 import argparse
+import collections
 import datetime
 import os
-import shutil
+import re
 import subprocess
 import sys
+import threading
 
 from pip._vendor.distlib.compat import raw_input
-from ruamel.yaml import ruamel
+
+import EnsemblePacking
+import FileCatalog
+import Instrumentation
+import JobStatus
+import LocalExecutor
+import OutputIndex
+import PathListIO
+import ResourceEstimator
+import RunState
+import RunTelemetry
+import SettingsManifest
+import SlurmJobs
 
 
 # Author: Sven Willner <sven.willner@pik-potsdam.de>
 
 
-def schedule_acclimate(
-        acclimate="./acclimate",
+def schedule_checkpointed(
+        command,
         account="acclimat",
         autorelease=True,
         checkpointdir=None,
         cpus=16,
-        jobname="acclimate",
+        jobname="model",
         logdir=None,
+        memory=None,
+        time=None,
         mintime="4:00:00",
         notify=True,
         partition="priority",
@@ -31,7 +47,17 @@ def schedule_acclimate(
         resumeid=None,
         settings=None,
         workdir=".",
+        dependency=None,
+        interval=None,
+        retries=5,
+        cleanup=True,
+        trap=True,
+        verbose=False,
 ):
+    """Submit command with checkpointing and requeue, see SlurmJobs.checkpoint_script, return job id or None.
+
+    The job is submitted on hold until the settings are written to its checkpoint directory.
+    """
     if resumeid is None and settings is None:
         raise RuntimeError("Specify resume id or settings")
 
@@ -40,18 +66,10 @@ def schedule_acclimate(
     if checkpointdir is None:
         checkpointdir = logdir
 
-    acclimate = os.path.abspath(acclimate)
-    print(acclimate)
     checkpointdir = os.path.abspath(checkpointdir)
     logdir = os.path.abspath(logdir)
     workdir = os.path.abspath(workdir)
 
-    if not os.path.exists(acclimate):
-        raise RuntimeError(f"Acclimate not found: {acclimate}")
-
-    if subprocess.call([acclimate, "--info"], stdout=subprocess.DEVNULL) != 0:
-        raise RuntimeError(f"Could not run acclimate: {acclimate}")
-
     os.makedirs(checkpointdir, exist_ok=True)
     os.makedirs(logdir, exist_ok=True)
     os.makedirs(workdir, exist_ok=True)
@@ -65,107 +83,39 @@ def schedule_acclimate(
     else:
         output = resumeid
 
-    batch = f"""#!/usr/bin/env bash
-#SBATCH --account={account}
-#SBATCH --acctg-freq=energy=0
-#SBATCH --constraint=haswell
-#SBATCH --cpus-per-task={cpus}
-#SBATCH --error="{logdir}/{output}.txt"
-#SBATCH --exclusive
-#SBATCH --export=ALL,OMP_PROC_BIND=FALSE,OMP_NUM_THREADS={cpus}
-#SBATCH --job-name="{jobname}"
-#SBATCH --nice=0
-#SBATCH --nodes=1
-#SBATCH --open-mode=append
-#SBATCH --output="{logdir}/{output}.txt"
-#SBATCH --partition={partition}
-#SBATCH --profile=none
-#SBATCH --qos={qos}
-#SBATCH --requeue
-#SBATCH --signal=SIGTERM@{prelimitseconds}
-#SBATCH --time-min={mintime}
-#SBATCH --workdir="{workdir}"
-{other_options}
-msg () {{
-    echo "$1 $SLURM_JOB_NAME $SLURM_JOB_ID #$RESTART_COUNT @ $(date +%FT%T)"
-}}
-fail () {{
-    msg "FAILED($1)"
-    exit $1
-}}
-if [ -z "$ORIGINAL_JOB_ID" ]
-then
-    export ORIGINAL_JOB_ID=$SLURM_JOB_ID
-fi
-export DMTCP_CHECKPOINT_DIR="{checkpointdir}/$ORIGINAL_JOB_ID"
-
-if [ ! -e "$DMTCP_CHECKPOINT_DIR" ]
-then
-    echo "Checkpoint directory missing"
-    fail 1
-fi
-if RESTART_FILE=$(ls "$DMTCP_CHECKPOINT_DIR"/*.dmtcp 2>/dev/null)
-then
-    msg "CONTINUING" 
-    cp -f "$RESTART_FILE" "$DMTCP_CHECKPOINT_DIR/backup"
-    try=0
-    while true
-    do
-        srun --disable-status dmtcp_restart "$RESTART_FILE"
-        retval=$?
-        try=$((try+1))
-        if [ $retval -eq 1 ]
-        then
-            if [ $try -eq 5 ]
-            then
-                break
-            fi
-            echo "Waiting for 2min..."
-            sleep 120
-        else
-            break
-        fi
-    done
-else
-    msg "STARTING"
-    srun dmtcp_launch "{acclimate}" "$DMTCP_CHECKPOINT_DIR/settings.yml"
-    retval=$?
-fi
-if [ $retval -eq 0 ]
-then
-    rm -rf "$DMTCP_CHECKPOINT_DIR"
-    msg "DONE"
-else
-    if [ $retval -eq 7 ]
-    then
-        msg "REQUEUING"
-        export RESTART_COUNT=$((RESTART_COUNT+1))
-        scontrol requeue "$SLURM_JOB_ID"
-    else
-        fail $retval
-    fi
-fi
-msg "LAST LINE"
-    """
-    print(batch)
+    batch = SlurmJobs.checkpoint_script(
+        command,
+        checkpointdir,
+        logdir,
+        workdir,
+        jobname=jobname,
+        account=account,
+        qos=qos,
+        partition=partition,
+        cpus=cpus,
+        memory=memory,
+        time=time,
+        mintime=mintime,
+        output=output,
+        prelimitseconds=prelimitseconds,
+        interval=interval,
+        retries=retries,
+        cleanup=cleanup,
+        trap=trap,
+        dependency=dependency,
+        other_options=other_options,
+    )
+    if verbose:
+        print(batch)
     env = os.environ.copy()
     if resumeid is None:
         env["ORIGINAL_JOB_ID"] = ""
     else:
         env["ORIGINAL_JOB_ID"] = str(resumeid)
         env["RESTART_COUNT"] = "0"
-    p = subprocess.Popen(
-        ["sbatch", "--hold", "--parsable"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        bufsize=4096,
-        env=env,
-    )
-    p.stdin.write(bytes(batch, "utf8"))
-    p.stdin.close()
-    jobid = int(p.stdout.read().decode("utf8"))
+    jobid = SlurmJobs.submit(batch, options=["--hold"], env=env)
     schedule_time = datetime.datetime.now().replace(microsecond=0).isoformat()
-    if p.wait() != 0:
+    if jobid is None:
         return
 
     try:
@@ -180,14 +130,36 @@ msg "LAST LINE"
             with open(os.path.join(finalcheckpointdir, "settings.yml"), "w") as f:
                 f.write(settings)
 
-        subprocess.check_call(["scontrol", "release", str(jobid)])
-    except e:
-        subprocess.check_call(["scontrol", "cancel", str(jobid)])
-        raise e
+        if autorelease:
+            subprocess.check_call(["scontrol", "release", str(jobid)])
+    except Exception:
+        subprocess.check_call(["scancel", str(jobid)])
+        raise
 
     return jobid
 
 
+def schedule_acclimate(acclimate="./acclimate", jobname="acclimate", **kwargs):
+    """Submit acclimate with checkpointing, acclimate checkpoints itself on SIGTERM and exits with 7 to requeue."""
+    acclimate = os.path.abspath(acclimate)
+    print(acclimate)
+
+    if not os.path.exists(acclimate):
+        raise RuntimeError(f"Acclimate not found: {acclimate}")
+
+    if subprocess.call([acclimate, "--info"], stdout=subprocess.DEVNULL) != 0:
+        raise RuntimeError(f"Could not run acclimate: {acclimate}")
+
+    return schedule_checkpointed(
+        f'"{acclimate}" "$DMTCP_CHECKPOINT_DIR/settings.yml"', jobname=jobname, trap=False, **kwargs
+    )
+
+
+# subcommand reporting the status of submitted jobs
+if len(sys.argv) > 1 and sys.argv[1] == "status":
+    JobStatus.main(sys.argv[2:])
+    exit()
+
 # defining parser & properties of ensemble run
 
 parser = argparse.ArgumentParser(description="Schedule an ensemble of model runs")
@@ -201,8 +173,7 @@ parser.add_argument("--memory", type=int, default=4000, help="RAM per job in MB
 parser.add_argument(
     "--time",
     type=str,
-    required=True,
-    help="Max runtime, please estimate as accurate as possible for efficient queuing",
+    help="Max runtime, please estimate as accurate as possible for efficient queuing (required unless --status)",
 )
 
 parser.add_argument("--queue", type=str, default="short", help="queue to be used on the cluster")
@@ -212,63 +183,358 @@ parser.add_argument("--qos", type=str, default="standard", help="qos to be used
 parser.add_argument("--partition", type=str, default="standard", help="partition to be used on the cluster")
 
 parser.add_argument(
-    "--settings", type=str, help="File containing paths to individual settings files"
+    "--settings", type=str, help="File containing paths to individual settings files (*.yml or *.txt)"
 )
 
 parser.add_argument(
-    "--dependency", type=int, help="JOB ID that needs to finish before Job starts"
+    "--catalog", type=str, help="File catalog written by PathnameCollectionHelper.py, used instead of --settings"
+)
+
+parser.add_argument(
+    "--dependency", type=int, help="JOB ID that needs to finish successfully before jobs start"
 )
 
 # variants for execution
 parser.add_argument("--local", action="store_true", help="run locally, not on cluster")
+parser.add_argument(
+    "--jobs",
+    type=int,
+    help="with --local, number of runs executed concurrently, each logging to <run directory>/local.txt",
+)
 parser.add_argument("--dry", action="store_true", help="dry run (do not run model)")
 parser.add_argument("--python", action="store_true", help="run model with python")
 parser.add_argument("--acclimate", action="store_true", help="run acclimate with restart option")
+parser.add_argument(
+    "--checkpoint",
+    action="store_true",
+    help="run any model under DMTCP, checkpointed before reaching --time and requeued to continue from there",
+)
+parser.add_argument(
+    "--checkpoint-interval", type=int, help="with --checkpoint or --acclimate, seconds between periodic checkpoints"
+)
+parser.add_argument(
+    "--checkpoint-retries",
+    type=int,
+    default=5,
+    help="with --checkpoint or --acclimate, attempts to restart from a checkpoint (default: 5)",
+)
+parser.add_argument(
+    "--keep-checkpoints", action="store_true", help="keep checkpoint directories of completed runs"
+)
+parser.add_argument(
+    "--time-min",
+    type=str,
+    help="with --checkpoint or --acclimate, minimum runtime allowing jobs to start in shorter backfill slots and "
+         "continue after requeue",
+)
+parser.add_argument("--array", action="store_true", help="submit all runs as one Slurm job array")
+parser.add_argument(
+    "--array-limit", type=int, help="maximum number of simultaneously running array tasks (default: no limit)"
+)
+parser.add_argument(
+    "--max-array-size",
+    type=int,
+    default=SlurmJobs.MAX_ARRAY_SIZE,
+    help="with --array, submit one array per this many runs, below MaxArraySize of Slurm (default: 1000)",
+)
+parser.add_argument(
+    "--pack",
+    action="store_true",
+    help="pack runs into bundles fitting on one node (--cpus, --node-memory) within --time, one job per bundle",
+)
+parser.add_argument("--node-memory", type=int, default=60000, help="RAM per node in MB for --pack (default: 60000)")
+parser.add_argument("--member-cpus", type=int, default=1, help="Number of cpus per run for --pack (default: 1)")
+parser.add_argument("--member-memory", type=int, help="RAM per run in MB for --pack (default: --memory)")
+parser.add_argument("--member-time", type=str, help="Estimated runtime per run for --pack (default: --time)")
+parser.add_argument(
+    "--submit-workers",
+    type=int,
+    help="prepare and submit runs as individual jobs by this many concurrent sbatch calls",
+)
+parser.add_argument(
+    "--max-pending", type=int, help="with --submit-workers, maximum number of own pending jobs (default: no limit)"
+)
+parser.add_argument(
+    "--retries",
+    type=int,
+    default=5,
+    help="with --submit-workers, retries of submissions failing transiently, with exponential backoff (default: 5)",
+)
 parser.add_argument("--verbose", action="store_true", help="be verbose")
+parser.add_argument(
+    "--changed-only",
+    action="store_true",
+    help="only schedule runs whose settings changed since their last submission according to settings/manifest.json",
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help="schedule runs never submitted or failed according to settings/runs.sqlite, reusing their directories",
+)
+parser.add_argument(
+    "--members",
+    type=SlurmJobs.array_indices,
+    help="only schedule the runs at these indices of the list of settings, e.g. 0-9,12, run labels keep the index "
+         "in the whole list (default: all)",
+)
+parser.add_argument(
+    "--skip-existing",
+    action="store_true",
+    help="skip runs whose output file exists and is not empty, output directories are listed once",
+)
+parser.add_argument(
+    "--verify-existing",
+    action="store_true",
+    help="with --skip-existing, only skip runs whose output has a readable, complete NetCDF header",
+)
+parser.add_argument(
+    "--estimate",
+    action="store_true",
+    help="estimate runtime and memory per run from completed runs in settings/runs.sqlite with the same model, "
+         "period length and variable count, at most --time, --time and --memory are used for runs without similar "
+         "completed runs",
+)
+parser.add_argument(
+    "--telemetry",
+    action="store_true",
+    help="record wall time, CPU time, peak RSS and I/O of each run in <run directory>/telemetry.json, summarized "
+         "per model by --status",
+)
+parser.add_argument(
+    "--stage",
+    type=str,
+    help="stage the inputs of each run in a cache in this node-local directory shared by the runs on a node, "
+         "environment variables are expanded on the node, e.g. '$TMPDIR/staging'",
+)
+parser.add_argument(
+    "--stage-capacity",
+    type=int,
+    default=50000,
+    help="with --stage, size of input copies kept in the cache per node in MB (default: 50000)",
+)
+parser.add_argument(
+    "--status",
+    action="store_true",
+    help="report number of runs per state according to settings/runs.sqlite and exit, see also subcommand status",
+)
+parser.add_argument(
+    "--profile",
+    nargs="?",
+    const="profile.json",
+    type=str,
+    help="time hot paths and write them as Chrome trace to this file (default: profile.json) plus a summary table",
+)
+parser.add_argument(
+    "--cprofile",
+    action="store_true",
+    help="with --profile, also profile the whole run with cProfile, written next to the trace as *.prof",
+)
 # initialize argument parser
 args = parser.parse_args()
+if args.cprofile and not args.profile:
+    exit("--cprofile requires --profile")
+if args.profile:
+    Instrumentation.enable(args.profile, profile=args.cprofile)
+if not args.time and not args.status:
+    parser.error("the following arguments are required: --time")
+if args.array and (args.local or args.acclimate):
+    exit("--array cannot be combined with --local or --acclimate")
+if args.pack and (args.array or args.acclimate):
+    exit("--pack cannot be combined with --array or --acclimate")
+if args.checkpoint and (args.local or args.array or args.pack or args.acclimate):
+    exit("--checkpoint cannot be combined with --local, --array, --pack or --acclimate")
+if args.time_min and not (args.checkpoint or args.acclimate):
+    exit("--time-min requires --checkpoint or --acclimate")
+if args.submit_workers and (args.local or args.array or args.pack):
+    exit("--submit-workers cannot be combined with --local, --array or --pack")
+if args.telemetry and (args.checkpoint or args.acclimate):
+    exit("--telemetry cannot be combined with --checkpoint or --acclimate")
+if args.stage and (args.checkpoint or args.acclimate):
+    exit("--stage cannot be combined with --checkpoint or --acclimate")
+if args.verify_existing and not args.skip_existing:
+    exit("--verify-existing requires --skip-existing")
 # default model location
 if not args.model:
     args.model = os.path.join(os.getcwd(), "model")
-if not os.path.exists(args.model):
+if not os.path.exists(args.model) and not args.status:
     exit("Model binary '{}' not found".format(args.model))
 
-# default location of settings collection
-if not args.settings:
-    args.settings = os.path.join(os.getcwd(), "/list_of_settings.yml")
-if not os.path.exists(args.settings):
-    exit("List of settings '{}' not found".format(args.settings))
-
-# open list of settings
-yaml = ruamel.yaml.YAML()
-with open(args.settings, 'r') as stream:
-    list_of_settings = yaml.load(stream)
+if args.catalog:
+    # take list of settings from file catalog
+    if not os.path.exists(args.catalog):
+        exit("File catalog '{}' not found".format(args.catalog))
+    with FileCatalog.FileCatalog(args.catalog) as catalog:
+        _, list_of_settings = catalog.load_list("settings")
+else:
+    # default location of settings collection
+    if not args.settings:
+        args.settings = os.path.join(os.getcwd(), "/list_of_settings.yml")
+    if not os.path.exists(args.settings):
+        exit("List of settings '{}' not found".format(args.settings))
+
+    # open list of settings, *.yml or *.txt
+    list_of_settings = list(PathListIO.read_list(args.settings))
 # determine number of runs for which settings are provided
 numberOfRuns = len(list_of_settings)
+# runs to schedule by index in list of settings
+if args.members is not None:
+    if args.members and max(args.members) >= numberOfRuns:
+        exit("--members index {} beyond the {} runs of the list of settings".format(max(args.members), numberOfRuns))
+    selected_runs = args.members
+else:
+    selected_runs = set(range(numberOfRuns))
+
+# manifests of content hashes written by PathnameCollectionHelper.py --incremental, per settings directory
+manifests = {}
+
+
+# states of runs, per settings directory
+run_states = {}
+
+
+def run_state(settings_file):
+    settings_dir = os.path.dirname(settings_file)
+    if settings_dir not in run_states:
+        run_states[settings_dir] = RunState.RunState(settings_dir)
+    return run_states[settings_dir]
+
+
+def report_status():
+    # counts per state from the state databases only, without looking at run directories
+    counts = collections.Counter()
+    recorded = 0
+    for settings_dir in sorted(set(os.path.dirname(i_settings) for i_settings in list_of_settings)):
+        if not os.path.exists(os.path.join(settings_dir, RunState.STATE_DB)):
+            continue
+        with RunState.RunState(settings_dir) as i_state:
+            counts.update(i_state.counts())
+            recorded += len(i_state)
+    print("Runs: %s, recorded: %s" % (numberOfRuns, recorded))
+    for state, count in sorted(counts.items()):
+        print("%s: %s" % (state, count))
+    # resource usage recorded by runs submitted with --telemetry, collected once from their run directories, other
+    # run directories are not looked at
+    telemetry = []
+    for settings_dir in sorted(set(os.path.dirname(i_settings) for i_settings in list_of_settings)):
+        if not os.path.exists(os.path.join(settings_dir, RunState.STATE_DB)):
+            continue
+        with RunState.RunState(settings_dir) as i_state:
+            RunTelemetry.collect(i_state)
+            telemetry += i_state.telemetry()
+    if telemetry:
+        print(RunTelemetry.report(telemetry))
+
+
+def telemetry_file(run_label):
+    # resource usage of run recorded by RunTelemetry.py, None without --telemetry
+    if not args.telemetry:
+        return None
+    return os.path.join(run_label, RunTelemetry.TELEMETRY_FILE)
+
+
+def telemetry_option(run_label):
+    # option of local-model and start-model
+    if not args.telemetry:
+        return ""
+    return " --telemetry {}".format(telemetry_file(run_label))
+
+
+def stage_option():
+    # options of local-model and start-model, quoted to expand environment variables of the cache directory on the node
+    if not args.stage:
+        return ""
+    return " --stage '{}' --stage-capacity {}".format(args.stage, args.stage_capacity)
+
+
+def record_submitted(settings_file, run_label, jobid):
+    mark_submitted(settings_file)
+    run_state(settings_file).submitted(run_label, jobid)
+
+
+def record_finished(settings_file, run_label, exitcode):
+    if exitcode == 0:
+        mark_submitted(settings_file)
+    run_state(settings_file).finished(run_label, exitcode)
+
+
+def settings_manifest(settings_file):
+    settings_dir = os.path.dirname(settings_file)
+    if settings_dir not in manifests:
+        manifests[settings_dir] = SettingsManifest.SettingsManifest(settings_dir)
+    return manifests[settings_dir]
+
+
+def changed_since_submission(settings_file):
+    return settings_manifest(settings_file).changed_since_submission(os.path.basename(settings_file))
+
+
+def mark_submitted(settings_file):
+    # submissions are only recorded for settings directories with manifest
+    settings_dir = os.path.dirname(settings_file)
+    if os.path.exists(os.path.join(settings_dir, SettingsManifest.MANIFEST)):
+        settings_manifest(settings_file).mark_submitted(os.path.basename(settings_file))
+
+
+def run_label_of(run_index):
+    run_settings_file = list_of_settings[run_index]
+    return os.path.join(os.path.dirname(run_settings_file), str(run_settings_file) + "_run_" + str(run_index))
 
 
 # prepare run
-def schedule_run():
-    global settings_yml
-    global run_cnt
+def prepare_run(run_index):
+    """Create run directory with copy of settings file, return (settings file, run label, settings copy).
+
+    Returns None if the run is skipped, since its directory already exists, its settings did not change, it was
+    submitted before according to its state database (--resume), its output exists (--skip-existing) or it is not
+    one of --members.
+    """
+    # skip runs whose output exists or not selected
+    if run_index in existing_runs or run_index not in selected_runs:
+        return None
     # load path of settingsfile
-    run_settings_file = list_of_settings[run_cnt]
-    run_settings_paths = os.path.dirname(run_settings_file)
+    run_settings_file = list_of_settings[run_index]
     # create run label
-
-    identifier = str(run_settings_file)
-    run_label = os.path.join(run_settings_paths, identifier + "_run_" + str(run_cnt))
-    # check if directory for run already exisits
-    if os.path.exists(run_label):
-        run_cnt += 1
-        return
-    # create directory for run
-    os.mkdir(run_label)
+    run_label = run_label_of(run_index)
+    if args.changed_only or args.resume:
+        # skip runs whose settings did not change since their last submission
+        if args.changed_only and not changed_since_submission(run_settings_file):
+            return None
+        # skip runs submitted or completed before
+        if args.resume and run_state(run_settings_file).state(run_label) in RunState.DONE_STATES:
+            return None
+        # reuse directory otherwise
+        os.makedirs(run_label, exist_ok=True)
+    else:
+        # check if directory for run already exisits
+        if os.path.exists(run_label):
+            return None
+        # create directory for run
+        os.mkdir(run_label)
     # copy settings file
 
     path_settings = os.path.join(run_label + "/settings.yml")
-    shutil.copy(run_settings_file, path_settings)
+    with Instrumentation.span("copy settings"):
+        with open(run_settings_file, "r") as f:
+            settings = f.read()
+        with open(path_settings, "w") as f:
+            f.write(settings)
+        run_state(run_settings_file).prepared(
+            run_label, run_settings_file, SettingsManifest.content_hash(settings), telemetry=args.telemetry
+        )
+    Instrumentation.count("runs prepared")
+    return run_settings_file, run_label, path_settings
+
+
+def schedule_run():
+    global settings_yml
+    global run_cnt
+    prepared = prepare_run(run_cnt)
+    if prepared is None:
+        run_cnt += 1
+        return
+    run_settings_file, run_label, path_settings = prepared
     if args.dry:
+        run_cnt += 1
         return
     if args.local:
         # shell script needs to be in same directory as this script
@@ -278,79 +544,138 @@ def schedule_run():
                + " --model {}".format(args.model)
                + " --logdir {}".format(run_label)
                + " --workdir {}".format(run_label)
+               + telemetry_option(run_label)
+               + stage_option()
                + " {}".format(path_settings))
         else:
             cmd = ("./local-model"
                    + " --model {}".format(args.model)
                    + " --logdir {}".format(run_label)
                    + " --workdir {}".format(run_label)
+                   + telemetry_option(run_label)
+                   + stage_option()
                    + " {}".format(path_settings))
         if args.verbose:
             print(cmd)
             print(os.getcwd())
-        os.system(cmd)
+        with Instrumentation.span("local run", run=run_label):
+            status = os.system(cmd)
+        record_finished(run_settings_file, run_label, os.waitstatus_to_exitcode(status))
         run_cnt += 1
 
     else:
         # shell script needs to be in same directory as this script
 
         # adjust default time for longer queues
-        if (args.acclimate):
+        if args.acclimate or args.checkpoint:
             with open(path_settings) as f:
-                jobid = schedule_acclimate(
-                    acclimate=args.model,
-                    checkpointdir=None,
-                    cpus=16,
-                    jobname="acclimate",
-                    logdir=run_label,
-                    mintime=args.time,
-                    partition=args.partition,
-                    qos=args.qos,
-                    settings=f.read(),
-                    workdir=run_label,
-                )
+                jobid = schedule_checkpointed_run(run_label, f.read(), *run_resources(path_settings))
             print(f"Job ID: {jobid}")
             print(args.model)
+            if jobid is not None:
+                record_submitted(run_settings_file, run_label, jobid)
+            else:
+                run_state(run_settings_file).failed(run_label)
+            run_cnt += 1
         else:
-
+            run_time, run_memory = run_resources(path_settings)
             if (args.python):
                 cmd = ("/p/tmp/quante/SimulationScripts/./start-model"
                        + " --model {}".format(args.model)
                        + " --python 1"
                        + " --cpus {}".format(args.cpus)
-                       + " --memory {}".format(args.memory)
+                       + " --memory {}".format(run_memory)
                        + " --jobname '{}'".format(run_label)
                        + " --logdir {}".format(run_label)
-                       + " --time {}".format(args.time)
+                       + " --time {}".format(run_time)
                        + " --queue {}".format(args.queue)
                        + " --qos {}".format(args.qos)
                        + " --partition {}".format(args.partition)
                        + " --workdir {}".format(run_label)
+                       + (" --dependency {}".format(args.dependency) if args.dependency else "")
+                       + telemetry_option(run_label)
+                       + stage_option()
                        + " {}".format(path_settings)
                        )
             else:
                 cmd = ("/p/tmp/quante/SimulationScripts/./start-model"
                        + " --model {}".format(args.model)
                        + " --cpus {}".format(args.cpus)
-                       + " --memory {}".format(args.memory)
+                       + " --memory {}".format(run_memory)
                        + " --jobname '{}'".format(run_label)
                        + " --logdir {}".format(run_label)
-                       + " --time {}".format(args.time)
+                       + " --time {}".format(run_time)
                        + " --queue {}".format(args.queue)
                        + " --qos {}".format(args.qos)
                        + " --partition {}".format(args.partition)
                        + " --workdir {}".format(run_label)
+                       + (" --dependency {}".format(args.dependency) if args.dependency else "")
+                       + telemetry_option(run_label)
+                       + stage_option()
                        + " {}".format(path_settings)
                        )
             if args.verbose:
                 print(cmd)
-            os.system(cmd)
+            # start-model prints the job id of sbatch
+            with Instrumentation.span("start-model"):
+                p = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
+            print(p.stdout, end="")
+            submission = re.search(r"Submitted batch job (\d+)", p.stdout)
+            if p.returncode == 0 and submission:
+                record_submitted(run_settings_file, run_label, submission.group(1))
+            else:
+                run_state(run_settings_file).failed(run_label)
             run_cnt += 1
 
 
+if args.status:
+    report_status()
+    exit()
+
+# estimator of runtime and memory per run, learned from completed runs
+estimator = None
+if args.estimate:
+    estimator = ResourceEstimator.ResourceEstimator()
+    for settings_dir in sorted(set(os.path.dirname(i_settings) for i_settings in list_of_settings)):
+        if not os.path.exists(os.path.join(settings_dir, RunState.STATE_DB)):
+            continue
+        with RunState.RunState(settings_dir) as i_state:
+            try:
+                JobStatus.poll(i_state)
+            except (OSError, RuntimeError) as e:
+                print("Could not query job states, using cached ones: {}".format(e))
+            estimator.learn(i_state)
+    print("Runtime and memory estimated from %s completed runs" % len(estimator))
+
 # execute runs
-if numberOfRuns >= 1:
-    print("Number of runs to be scheduled: %s" % numberOfRuns)
+if args.changed_only:
+    numberOfChangedRuns = sum(
+        1 for run_index in selected_runs if changed_since_submission(list_of_settings[run_index])
+    )
+    print("Settings unchanged since last submission: %s" % (len(selected_runs) - numberOfChangedRuns))
+    numberOfRunsToSchedule = numberOfChangedRuns
+else:
+    numberOfRunsToSchedule = len(selected_runs)
+if args.resume:
+    numberOfDoneRuns = sum(
+        1 for run_index in selected_runs
+        if run_state(list_of_settings[run_index]).state(run_label_of(run_index)) in RunState.DONE_STATES
+    )
+    print("Runs submitted or completed before: %s" % numberOfDoneRuns)
+    numberOfRunsToSchedule = min(numberOfRunsToSchedule, len(selected_runs) - numberOfDoneRuns)
+# runs whose output exists, by index in list of settings
+existing_runs = set()
+if args.skip_existing:
+    output_index = OutputIndex.OutputIndex(verify=args.verify_existing)
+    run_outputs = {run_index: OutputIndex.output_file(list_of_settings[run_index]) for run_index in selected_runs}
+    existing_outputs = output_index.existing(filepath for filepath in run_outputs.values() if filepath)
+    existing_runs = {run_index for run_index, filepath in run_outputs.items() if filepath in existing_outputs}
+    print("Runs with existing output skipped: %s, pending: %s (%s output directories listed)" % (
+        len(existing_runs), len(selected_runs) - len(existing_runs), output_index.listings
+    ))
+    numberOfRunsToSchedule = min(numberOfRunsToSchedule, len(selected_runs) - len(existing_runs))
+if numberOfRunsToSchedule >= 1:
+    print("Number of runs to be scheduled: %s" % numberOfRunsToSchedule)
     sys.stdout.write("Run? y/N : ")
     if sys.version_info >= (3, 0):
         if input() != "y":
@@ -358,7 +683,332 @@ if numberOfRuns >= 1:
     else:
         if raw_input() != "y":
             exit("Aborted")
+
+
+def schedule_array():
+    # prepare directories of all runs, then submit one job array with a task per prepared run
+    prepared = {}
+    for run_index in range(numberOfRuns):
+        prepared_run = prepare_run(run_index)
+        if prepared_run is not None:
+            prepared[run_index] = prepared_run
+    if not prepared:
+        return
+    # array tasks share time and memory, the largest of all runs
+    resources = [run_resources(path_settings) for _, _, path_settings in prepared.values()]
+    if args.settings:
+        listfile = args.settings
+    else:
+        # tasks need a list file to look up their settings, write current list of catalog next to the settings,
+        # replaced at once as tasks of arrays submitted before, e.g. of other models of a workflow, may be reading it
+        listfile = os.path.join(os.path.dirname(list_of_settings[0]), "list_of_settings_array.txt")
+        PathListIO.replace_list(listfile, list_of_settings)
+    # task indices are relative to the first run of each array, arrays stay below MaxArraySize
+    for offset, indices in SlurmJobs.array_chunks(prepared.keys(), args.max_array_size):
+        batch = SlurmJobs.array_script(
+            args.model,
+            listfile,
+            indices,
+            limit=args.array_limit,
+            offset=offset,
+            python=args.python,
+            jobname=os.path.basename(os.path.dirname(listfile)) or "model",
+            time=max((run_time for run_time, _ in resources), key=SlurmJobs.parse_time),
+            memory=max(run_memory for _, run_memory in resources),
+            dependency=args.dependency,
+            telemetry=RunTelemetry.TELEMETRY_FILE if args.telemetry else None,
+            stage=args.stage,
+            stage_capacity=args.stage_capacity,
+            **SlurmJobs.queue_options(args.queue, args.partition, args.cpus),
+        )
+        if args.verbose or args.dry:
+            print(batch)
+        if args.dry:
+            continue
+        jobid = SlurmJobs.submit(batch)
+        if jobid is None:
+            exit("Submission of job array failed")
+        print(f"Job ID: {jobid} with {len(indices)} array tasks")
+        for index in indices:
+            run_settings_file, run_label, _ = prepared[offset + index]
+            record_submitted(run_settings_file, run_label, f"{jobid}_{index}")
+
+
+def schedule_local_jobs():
+    # prepare directories of all runs, then run them concurrently within the core budget of --jobs
+    tasks = []
+    settings_files = {}
+    for run_index in range(numberOfRuns):
+        prepared_run = prepare_run(run_index)
+        if prepared_run is None:
+            continue
+        run_settings_file, run_label, path_settings = prepared_run
+        if args.dry:
+            continue
+        tasks.append(LocalExecutor.task(
+            run_label,
+            LocalExecutor.local_model_command(
+                args.model,
+                run_label,
+                path_settings,
+                python=args.python,
+                telemetry=telemetry_file(run_label),
+                stage=args.stage,
+                stage_capacity=args.stage_capacity,
+            ),
+            run_label,
+            os.path.join(run_label, "local.txt"),
+            cpus=LocalExecutor.omp_threads(),
+        ))
+        settings_files[run_label] = run_settings_file
+    if not tasks:
+        return 0
+    executor = LocalExecutor.LocalExecutor(LocalExecutor.jobs_budget(args.jobs), verbose=args.verbose)
+    exitcodes = executor.run(tasks)
+    failed = 0
+    for run_label, exitcode in exitcodes.items():
+        record_finished(settings_files[run_label], run_label, exitcode)
+        if exitcode != 0:
+            failed += 1
+            print(f"FAILED({exitcode}) {run_label}")
+    return failed
+
+
+def schedule_checkpointed_run(run_label, settings, run_time, run_memory):
+    # acclimate or, with --checkpoint, any model with checkpointing and requeue, return job id or None
+    options = dict(
+        checkpointdir=None,
+        logdir=run_label,
+        partition=args.partition,
+        qos=args.qos,
+        settings=settings,
+        workdir=run_label,
+        dependency=args.dependency,
+        interval=args.checkpoint_interval,
+        retries=args.checkpoint_retries,
+        cleanup=not args.keep_checkpoints,
+        verbose=args.verbose,
+    )
+    if args.acclimate:
+        # without --time-min, acclimate runs with --time as minimum time and the partition time limit
+        return schedule_acclimate(
+            acclimate=args.model,
+            cpus=16,
+            jobname="acclimate",
+            mintime=args.time_min if args.time_min else args.time,
+            time=args.time if args.time_min else None,
+            **options,
+        )
+    return schedule_checkpointed(
+        SlurmJobs.model_command(args.model, "$DMTCP_CHECKPOINT_DIR/settings.yml", python=args.python),
+        cpus=args.cpus,
+        jobname=run_label,
+        memory=run_memory,
+        time=run_time,
+        mintime=args.time_min if args.time_min else run_time,
+        **options,
+    )
+
+
+def schedule_pipelined():
+    # prepare run directories and batch scripts in a thread pool, submit each as soon as it is prepared
+    def prepare(run_index):
+        prepared_run = prepare_run(run_index)
+        if prepared_run is None:
+            return None
+        run_settings_file, run_label, path_settings = prepared_run
+        if args.acclimate or args.checkpoint:
+            with open(path_settings) as f:
+                return (run_label, f.read()) + run_resources(path_settings)
+        run_time, run_memory = run_resources(path_settings)
+        batch = SlurmJobs.start_model_script(
+            args.model,
+            path_settings,
+            python=args.python,
+            logdir=run_label,
+            workdir=run_label,
+            telemetry=telemetry_file(run_label),
+            stage=args.stage,
+            stage_capacity=args.stage_capacity,
+            jobname=run_label,
+            time=run_time,
+            memory=run_memory,
+            dependency=args.dependency,
+            **SlurmJobs.queue_options(args.queue, args.partition, args.cpus),
+        )
+        with open(os.path.join(run_label, "job.sh"), "w") as f:
+            f.write(batch)
+        if args.verbose or args.dry:
+            print(batch)
+        if args.dry:
+            return None
+        return batch
+
+    def submit_checkpointed(prepared_run):
+        jobid = schedule_checkpointed_run(*prepared_run)
+        return jobid, None if jobid is not None else "Submission failed"
+
+    # open state databases before preparing runs in threads
+    for i_settings in list_of_settings:
+        run_state(i_settings)
+    pipeline = SlurmJobs.SubmissionPipeline(
+        workers=args.submit_workers, retries=args.retries, max_pending=args.max_pending, verbose=args.verbose
+    )
+    submit = submit_checkpointed if args.acclimate or args.checkpoint else SlurmJobs.submit_with_error
+    record_lock = threading.Lock()
+
+    def record(run_index, jobid, error):
+        # recorded by the submitting thread as soon as sbatch returned, an interrupted pipeline loses no job ids
+        with record_lock:
+            if jobid is None:
+                print(f"FAILED {list_of_settings[run_index]}: {error}")
+                run_state(list_of_settings[run_index]).failed(run_label_of(run_index))
+            else:
+                if args.verbose:
+                    print(f"Job ID: {jobid} {list_of_settings[run_index]}")
+                record_submitted(list_of_settings[run_index], run_label_of(run_index), jobid)
+
+    results = pipeline.run(
+        ((run_index, lambda run_index=run_index: prepare(run_index), submit) for run_index in range(numberOfRuns)),
+        on_result=record,
+    )
+    failed = sum(1 for jobid, _ in results.values() if jobid is None)
+    print(f"Submitted {len(results) - failed} jobs in {pipeline.attempts} sbatch calls, {failed} failed")
+    return failed
+
+
+def estimate_run(run_settings_file):
+    # cpus, memory in MB and runtime in seconds of a run, estimated from completed runs with --estimate
+    member_memory = args.member_memory if args.member_memory else args.memory
+    member_time = args.member_time if args.member_time else args.time
+    if estimator is None:
+        return args.member_cpus, member_memory, SlurmJobs.parse_time(member_time)
+    with open(run_settings_file) as f:
+        seconds, memory = estimator.estimate(
+            *ResourceEstimator.features(f.read()), seconds=SlurmJobs.parse_time(member_time), memory=member_memory
+        )
+    return args.member_cpus, memory, seconds
+
+
+def run_resources(path_settings):
+    # time and memory of a job running one run, estimated from completed runs with --estimate
+    if estimator is None:
+        return args.time, args.memory
+    with open(path_settings) as f:
+        seconds, memory = estimator.estimate(
+            *ResourceEstimator.features(f.read()), seconds=SlurmJobs.parse_time(args.time), memory=args.memory
+        )
+    return SlurmJobs.format_time(seconds), memory
+
+
+def schedule_packed():
+    # prepare directories of all runs, pack them into node sized bundles and run or submit each bundle
+    members = []
+    settings_files = {}
+    for run_index in range(numberOfRuns):
+        prepared_run = prepare_run(run_index)
+        if prepared_run is None:
+            continue
+        run_settings_file, run_label, path_settings = prepared_run
+        cpus, memory, seconds = estimate_run(run_settings_file)
+        members.append(EnsemblePacking.member(run_label, path_settings, cpus, memory, seconds))
+        settings_files[run_label] = run_settings_file
+    if not members:
+        return 0
+    failed = 0
+    walltime = SlurmJobs.parse_time(args.time)
+    # bundles submitted to the cluster are packed for the cores of their queue, as start-model maps it
+    options = {"cpus": args.cpus} if args.local else SlurmJobs.queue_options(args.queue, args.partition, args.cpus)
+    bundles = EnsemblePacking.pack(members, options["cpus"], args.node_memory, walltime)
+    print(f"Packed {len(members)} runs into {len(bundles)} bundles")
+    bundledir = os.path.join(os.path.dirname(list_of_settings[0]), "bundles")
+    os.makedirs(bundledir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    for i_bundle, bundle in enumerate(bundles):
+        bundlefile = os.path.join(bundledir, f"bundle_{stamp}_{i_bundle}.json")
+        EnsemblePacking.write_bundle(
+            bundlefile,
+            bundle,
+            options["cpus"],
+            args.node_memory,
+            args.model,
+            python=args.python,
+            telemetry=args.telemetry,
+            stage=args.stage,
+            stage_capacity=args.stage_capacity,
+        )
+        bundletime = min(walltime, EnsemblePacking.makespan(bundle, options["cpus"], args.node_memory))
+        if args.verbose or args.dry:
+            print(f"{bundlefile}: {len(bundle)} runs, {SlurmJobs.format_time(bundletime)}")
+        if args.dry:
+            continue
+        if args.local:
+            exitcodes = EnsemblePacking.run_bundle(
+                bundle,
+                args.cpus,
+                args.node_memory,
+                args.model,
+                python=args.python,
+                verbose=args.verbose,
+                telemetry=args.telemetry,
+                stage=args.stage,
+                stage_capacity=args.stage_capacity,
+            )
+            for run_label, exitcode in exitcodes.items():
+                record_finished(settings_files[run_label], run_label, exitcode)
+                if exitcode != 0:
+                    failed += 1
+                    print(f"FAILED({exitcode}) {run_label}")
+        else:
+            header = SlurmJobs.slurm_header(
+                jobname=os.path.basename(bundlefile),
+                output=f"{bundledir}/%j.txt",
+                time=SlurmJobs.format_time(bundletime),
+                memory=args.node_memory,
+                dependency=args.dependency,
+                **options,
+            )
+            batch = f"""#!/usr/bin/env bash
+{header}"{sys.executable}" "{SlurmJobs.SCRIPTDIR}/EnsemblePacking.py" "{bundlefile}"
+"""
+            if args.verbose:
+                print(batch)
+            jobid = SlurmJobs.submit(batch)
+            if jobid is None:
+                failed += len(bundle)
+                print(f"Submission of {bundlefile} failed")
+                for i_member in bundle:
+                    run_state(settings_files[i_member["run_label"]]).failed(i_member["run_label"])
+                continue
+            print(f"Job ID: {jobid} with {len(bundle)} runs")
+            for i_member in bundle:
+                record_submitted(settings_files[i_member["run_label"]], i_member["run_label"], jobid)
+    return failed
+
+
 run_cnt = 0
-schedule_run()
-while run_cnt < numberOfRuns:
-    schedule_run()
+failed_runs = 0
+try:
+    with Instrumentation.span("schedule"):
+        if args.array:
+            schedule_array()
+        elif args.pack:
+            failed_runs = schedule_packed()
+        elif args.submit_workers:
+            failed_runs = schedule_pipelined()
+        elif args.local and args.jobs:
+            failed_runs = schedule_local_jobs()
+        else:
+            schedule_run()
+            while run_cnt < numberOfRuns:
+                schedule_run()
+finally:
+    # record submitted settings hashes
+    for i_manifest in manifests.values():
+        if os.path.exists(i_manifest.path):
+            i_manifest.save(generated=False)
+    for i_state in run_states.values():
+        i_state.close()
+# propagate failures of runs executed locally or submitted by the pipeline
+if failed_runs:
+    exit("{} runs failed".format(failed_runs))
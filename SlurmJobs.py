@@ -0,0 +1,546 @@
+# batch scripts and submission of ensemble members to Slurm
+#  imports
+import concurrent.futures
+import getpass
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import Instrumentation
+
+# directory of this script, containing start-model, local-model and PathListIO.py used by batch scripts
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+# array task indices must be below MaxArraySize of slurm.conf, 1001 by default
+MAX_ARRAY_SIZE = 1000
+
+
+def parse_time(time):
+    """Seconds of a Slurm time specification, e.g. 30, 1:30:00 or 1-12:00:00."""
+    time = str(time)
+    days = 0
+    if "-" in time:
+        days, time = time.split("-", 1)
+        days = int(days)
+        # days-hours[:minutes[:seconds]]
+        parts = [int(part) for part in time.split(":")]
+        parts += [0] * (3 - len(parts))
+        hours, minutes, seconds = parts
+    else:
+        # minutes, minutes:seconds or hours:minutes:seconds
+        parts = [int(part) for part in time.split(":")]
+        if len(parts) == 1:
+            hours, minutes, seconds = 0, parts[0], 0
+        elif len(parts) == 2:
+            hours, minutes, seconds = 0, parts[0], parts[1]
+        else:
+            hours, minutes, seconds = parts
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def format_time(seconds):
+    """Slurm time specification of seconds, rounded up to full minutes."""
+    minutes = -(-int(seconds) // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days}-{hours:02d}:{minutes:02d}:00"
+    return f"{hours:02d}:{minutes:02d}:00"
+
+
+def slurm_header(
+        jobname="model",
+        queue="short",
+        partition="standard",
+        constraint="haswell",
+        output="%j.txt",
+        time="1-00:00:00",
+        cpus=16,
+        memory=60000,
+        workdir=None,
+        dependency=None,
+        other_options="",
+):
+    """Slurm header as written by start-model, starting after successful completion of dependency job ids, cancelled
+    if one of them fails instead of pending forever."""
+    header = f"""#SBATCH --job-name="{jobname}"
+#SBATCH --qos={queue}
+#SBATCH --partition={partition}
+#SBATCH --constraint={constraint}
+#SBATCH --output={output}
+#SBATCH --error={output}
+#SBATCH --account=acclimat
+#SBATCH --nice=0
+#SBATCH --profile=none
+#SBATCH --acctg-freq=energy=0
+#SBATCH --time={time}
+#SBATCH --export=ALL,OMP_PROC_BIND=FALSE,OMP_NUM_THREADS={cpus}
+#SBATCH --mail-type=FAIL,TIME_LIMIT
+#SBATCH --nodes=1
+#SBATCH --ntasks=1
+#SBATCH --cpus-per-task={cpus}
+#SBATCH --mem={memory}
+"""
+    if workdir is not None:
+        header += f"#SBATCH --workdir={workdir}\n"
+    if dependency:
+        header += f"#SBATCH --dependency={afterok(dependency)}\n"
+        header += "#SBATCH --kill-on-invalid-dep=yes\n"
+    return header + other_options
+
+
+def afterok(jobids):
+    """Slurm dependency on successful completion of a job id or list of job ids."""
+    if isinstance(jobids, (int, str)):
+        jobids = [jobids]
+    return "afterok:" + ":".join(str(jobid) for jobid in jobids)
+
+
+def model_command(model, settings, python=False):
+    if python:
+        return f'"{model}" --settings "{settings}"'
+    return f'"{model}" "{settings}"'
+
+
+def telemetry_command(command, output):
+    """Command run as child of RunTelemetry.py recording its resource usage to output, see start-model."""
+    return f'"{sys.executable}" "{SCRIPTDIR}/RunTelemetry.py" --output "{output}" -- {command}'
+
+
+def staging_command(command, settings, cachedir, capacity=50000):
+    """Command run as child of StagingCache.py with the inputs of settings staged in cachedir, see start-model."""
+    return (
+        f'"{sys.executable}" "{SCRIPTDIR}/StagingCache.py" --cache "{cachedir}" --capacity {capacity} '
+        f'--settings "{settings}" -- {command}'
+    )
+
+
+def array_spec(indices, limit=None):
+    """Compress sorted task indices into Slurm array ranges, e.g. 0-3,5,7-9%4."""
+    ranges = []
+    for index in sorted(indices):
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    spec = ",".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+    if limit:
+        spec += f"%{limit}"
+    return spec
+
+
+def array_indices(spec):
+    """Set of task indices of a Slurm array specification, e.g. 0-3,5,7-9, inverse of array_spec."""
+    indices = set()
+    for part in spec.split("%")[0].split(","):
+        first, _, last = part.partition("-")
+        indices.update(range(int(first), int(last or first) + 1))
+    return indices
+
+
+def array_chunks(indices, size=MAX_ARRAY_SIZE):
+    """Split run indices into [(offset, [task indices])] of arrays with task indices below size, offset + task index
+    being the run index."""
+    chunks = []
+    for index in sorted(indices):
+        if not chunks or index - chunks[-1][0] >= size:
+            chunks.append((index, []))
+        chunks[-1][1].append(index - chunks[-1][0])
+    return chunks
+
+
+def array_script(
+        model,
+        listfile,
+        indices,
+        limit=None,
+        offset=0,
+        python=False,
+        logdir=None,
+        telemetry=None,
+        stage=None,
+        stage_capacity=50000,
+        **header,
+):
+    """Batch script running one ensemble member per array task.
+
+    Each task looks up its settings file by index SLURM_ARRAY_TASK_ID + offset in listfile and runs in the directory
+    <settings file>_run_<index> prepared before submission, logging to <run directory>/<job id>.txt. indices are
+    relative to offset and must stay below MaxArraySize of Slurm, see array_chunks. With telemetry
+    the resource usage of each task is recorded to the file of this name in its run directory, with stage its inputs
+    are staged in this node-local cache directory of at most stage_capacity MB copies.
+    """
+    listfile = os.path.abspath(listfile)
+    if logdir is None:
+        logdir = os.path.dirname(listfile)
+    header = slurm_header(output=f"{logdir}/%A_%a.txt", **header)
+    command = model_command(model, "$run_label/settings.yml", python=python)
+    if stage:
+        command = staging_command(command, "$run_label/settings.yml", stage, stage_capacity)
+    if telemetry:
+        command = telemetry_command(command, f"$run_label/{telemetry}")
+    return f"""#!/usr/bin/env bash
+{header}#SBATCH --array={array_spec(indices, limit)}
+run_index=$((SLURM_ARRAY_TASK_ID + {offset}))
+settings_file=$("{sys.executable}" "{SCRIPTDIR}/PathListIO.py" "{listfile}" "$run_index") || exit 1
+run_label="${{settings_file}}_run_${{run_index}}"
+exec >>"$run_label/$SLURM_JOB_ID.txt" 2>&1
+cd "$run_label" || exit 1
+{command}
+"""
+
+
+def start_model_script(
+        model,
+        settings,
+        python=False,
+        logdir=".",
+        workdir=".",
+        telemetry=None,
+        stage=None,
+        stage_capacity=50000,
+        **header,
+):
+    """Batch script as submitted by start-model, running model with settings in workdir, logging to logdir.
+
+    With telemetry, the resource usage of the model is recorded to this file, with stage its inputs are staged in this
+    node-local cache directory.
+    """
+    header = slurm_header(output=f"{logdir}/%j.txt", workdir=workdir, **header)
+    command = model_command(model, settings, python=python)
+    if stage:
+        command = staging_command(command, settings, stage, stage_capacity)
+    if telemetry:
+        command = telemetry_command(command, telemetry)
+    return f"""#!/usr/bin/env bash
+{header}{command}
+"""
+
+
+def checkpoint_script(
+        command,
+        checkpointdir,
+        logdir,
+        workdir,
+        jobname="model",
+        account="acclimat",
+        qos="priority",
+        partition="priority",
+        cpus=16,
+        memory=None,
+        time=None,
+        mintime="4:00:00",
+        output="%j",
+        prelimitseconds=60 * 60,
+        interval=None,
+        retries=5,
+        retrywait=120,
+        cleanup=True,
+        trap=True,
+        requeue_exitcode=7,
+        dependency=None,
+        other_options="",
+):
+    """Batch script running command under DMTCP, requeued with its checkpoint when reaching the time limit.
+
+    The settings are expected in <checkpointdir>/<original job id>/settings.yml, command may refer to the
+    checkpoint directory as $DMTCP_CHECKPOINT_DIR. With trap, the batch shell receives SIGTERM prelimitseconds
+    before the time limit, checkpoints the model via dmtcp_command and requeues the job; otherwise the model
+    itself receives SIGTERM and is expected to checkpoint and exit with requeue_exitcode, as acclimate does.
+    Restarts failing with exit code 1 are tried retries times, waiting retrywait seconds in between.
+    """
+    options = ""
+    if memory is not None:
+        options += f"#SBATCH --mem={memory}\n"
+    if time is not None:
+        options += f"#SBATCH --time={time}\n"
+    if dependency:
+        options += f"#SBATCH --dependency={afterok(dependency)}\n"
+    launch = f"--interval {interval} " if interval else ""
+    signal = "B:TERM" if trap else "SIGTERM"
+    if trap:
+        checkpoint = """checkpoint () {
+    msg "CHECKPOINTING"
+    dmtcp_command --bcheckpoint && checkpointed=1
+    kill "$step" 2>/dev/null
+}
+trap checkpoint TERM
+"""
+    else:
+        checkpoint = ""
+    if cleanup:
+        done = 'rm -rf "$DMTCP_CHECKPOINT_DIR"\n    '
+    else:
+        done = ""
+    return f"""#!/usr/bin/env bash
+#SBATCH --account={account}
+#SBATCH --acctg-freq=energy=0
+#SBATCH --constraint=haswell
+#SBATCH --cpus-per-task={cpus}
+#SBATCH --error="{logdir}/{output}.txt"
+#SBATCH --exclusive
+#SBATCH --export=ALL,OMP_PROC_BIND=FALSE,OMP_NUM_THREADS={cpus}
+#SBATCH --job-name="{jobname}"
+#SBATCH --nice=0
+#SBATCH --nodes=1
+#SBATCH --open-mode=append
+#SBATCH --output="{logdir}/{output}.txt"
+#SBATCH --partition={partition}
+#SBATCH --profile=none
+#SBATCH --qos={qos}
+#SBATCH --requeue
+#SBATCH --signal={signal}@{prelimitseconds}
+#SBATCH --time-min={mintime}
+#SBATCH --workdir="{workdir}"
+{options}{other_options}
+msg () {{
+    echo "$1 $SLURM_JOB_NAME $SLURM_JOB_ID #$RESTART_COUNT @ $(date +%FT%T)"
+}}
+fail () {{
+    msg "FAILED($1)"
+    exit $1
+}}
+checkpointed=
+# run job step in background for the batch shell to handle signals while waiting
+run () {{
+    "$@" &
+    step=$!
+    wait "$step"
+    retval=$?
+    if [ -n "$checkpointed" ]
+    then
+        wait "$step"
+        retval={requeue_exitcode}
+    fi
+}}
+{checkpoint}if [ -z "$ORIGINAL_JOB_ID" ]
+then
+    export ORIGINAL_JOB_ID=$SLURM_JOB_ID
+fi
+export DMTCP_CHECKPOINT_DIR="{checkpointdir}/$ORIGINAL_JOB_ID"
+
+if [ ! -e "$DMTCP_CHECKPOINT_DIR" ]
+then
+    echo "Checkpoint directory missing"
+    fail 1
+fi
+if RESTART_FILE=$(ls "$DMTCP_CHECKPOINT_DIR"/*.dmtcp 2>/dev/null)
+then
+    msg "CONTINUING"
+    cp -f "$RESTART_FILE" "$DMTCP_CHECKPOINT_DIR/backup"
+    try=0
+    while true
+    do
+        run srun --disable-status dmtcp_restart {launch}"$RESTART_FILE"
+        try=$((try+1))
+        if [ $retval -eq 1 ]
+        then
+            if [ $try -eq {retries} ]
+            then
+                break
+            fi
+            echo "Waiting for {retrywait}s..."
+            sleep {retrywait}
+        else
+            break
+        fi
+    done
+else
+    msg "STARTING"
+    run srun dmtcp_launch {launch}{command}
+fi
+if [ $retval -eq 0 ]
+then
+    {done}msg "DONE"
+else
+    if [ $retval -eq {requeue_exitcode} ]
+    then
+        msg "REQUEUING"
+        export RESTART_COUNT=$((RESTART_COUNT+1))
+        scontrol requeue "$SLURM_JOB_ID"
+    else
+        fail $retval
+    fi
+fi
+msg "LAST LINE"
+"""
+
+
+def queue_options(queue="short", partition="standard", cpus=16):
+    """Slurm qos, partition, constraint and cpus for a cluster queue, as start-model --queue QUEUE --partition."""
+    constraint = "haswell"
+    if queue == "ram_gpu":
+        queue = "short"
+    elif queue == "broadwell":
+        constraint = "broadwell"
+        queue = "short"
+    elif queue == "io":
+        cpus = 1
+    elif queue not in ("priority", "standby", "short", "medium", "long"):
+        raise ValueError(f"Unknown cluster queue '{queue}'")
+    return {"queue": queue, "partition": partition, "constraint": constraint, "cpus": cpus}
+
+
+def submit_with_error(script, options=(), env=None):
+    """Submit batch script via stdin of sbatch, return (job id, None) or (None, error message)."""
+    Instrumentation.count("sbatch calls")
+    try:
+        with Instrumentation.span("sbatch"):
+            p = subprocess.run(
+                ["sbatch", "--parsable"] + list(options),
+                input=script.encode("utf8"),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=env,
+            )
+    except OSError as e:
+        return None, str(e)
+    if p.returncode != 0:
+        return None, p.stderr.decode("utf8", "replace").strip() or f"sbatch exited with {p.returncode}"
+    # --parsable prints "jobid[;cluster]"
+    return int(p.stdout.decode("utf8").strip().split(";")[0]), None
+
+
+def submit(script, options=(), env=None):
+    """Submit batch script via stdin of sbatch, return job id or None if submission failed."""
+    jobid, error = submit_with_error(script, options=options, env=env)
+    if error is not None:
+        print(error, file=sys.stderr)
+    return jobid
+
+
+# sbatch errors worth retrying, e.g. overloaded slurmctld or submit limits
+TRANSIENT_ERRORS = re.compile(
+    r"timed out|temporarily|try again|Unable to contact|Socket|submit limit|MaxSubmit|Resource busy", re.IGNORECASE
+)
+
+
+def pending_jobs(user=None):
+    """Number of pending jobs of user according to squeue, None if squeue failed."""
+    try:
+        p = subprocess.run(
+            ["squeue", "--noheader", "--user", user or getpass.getuser(), "--states", "PENDING", "--format", "%i"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+    except OSError:
+        return None
+    if p.returncode != 0:
+        return None
+    return len(p.stdout.split())
+
+
+class SubmissionPipeline:
+    """Prepare and submit many jobs concurrently.
+
+    Items are (name, prepare, submit): prepare() runs in a pool of prepare_workers threads and returns a payload or
+    None to skip the item, submit(payload) runs in a pool of workers threads as soon as the payload is ready and
+    returns (job id, error). Submissions failing with a transient error are retried with exponential backoff.
+    With max_pending, submissions wait while the user has that many pending jobs in the queue. Errors raised by
+    prepare or submit are results of their item, on_result(name, job id, error) is called as each result is known, e.g. to
+    record job ids before the pipeline finishes.
+    """
+
+    def __init__(self, workers=4, prepare_workers=8, retries=5, backoff=2.0, max_pending=None, poll=30.0,
+                 verbose=False):
+        self.workers = workers
+        self.prepare_workers = prepare_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_pending = max_pending
+        self.poll = poll
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pending_time = None
+        self._querying = False
+        self.attempts = 0
+        self.retried = 0
+
+    def _wait_for_capacity(self):
+        if not self.max_pending:
+            return
+        while True:
+            with self._lock:
+                # squeue is only asked every poll seconds, own submissions in between count as pending
+                due = self._pending_time is None or time.time() - self._pending_time >= self.poll
+                query = due and not self._querying
+                if query:
+                    self._querying = True
+                elif not due and self._pending < self.max_pending:
+                    self._pending += 1
+                    return
+                # waiting workers share the next query, due poll seconds after the last one
+                wait = self._pending_time + self.poll - time.time() if not due else 0.1
+            if query:
+                # squeue runs outside the lock, other workers wait for its result
+                pending = None
+                try:
+                    pending = pending_jobs()
+                finally:
+                    with self._lock:
+                        if pending is not None:
+                            self._pending = pending
+                        self._pending_time = time.time()
+                        self._querying = False
+                continue
+            time.sleep(max(wait, 0.1))
+
+    def _submit(self, name, submit, payload, on_result):
+        jobid, error = self._submit_with_retries(name, submit, payload)
+        if on_result is not None:
+            on_result(name, jobid, error)
+        return jobid, error
+
+    def _submit_with_retries(self, name, submit, payload):
+        for attempt in range(self.retries + 1):
+            self._wait_for_capacity()
+            with self._lock:
+                self.attempts += 1
+            try:
+                jobid, error = submit(payload)
+            except Exception as e:
+                # one failing submit, e.g. of a batch script not written, does not stop the pipeline
+                with self._lock:
+                    self._pending -= 1
+                return None, repr(e)
+            if error is None:
+                return jobid, None
+            with self._lock:
+                # failed submission is not pending
+                self._pending -= 1
+            if attempt == self.retries or not TRANSIENT_ERRORS.search(error):
+                return None, error
+            with self._lock:
+                self.retried += 1
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            if self.verbose:
+                print(f"Submission of {name} failed ({error}), retrying in {delay:.1f} s")
+            time.sleep(delay)
+
+    def run(self, items, on_result=None):
+        """Run pipeline, return {name: (job id, error)} of all items not skipped."""
+        results = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.prepare_workers) as preparer, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as submitter:
+            prepared = {preparer.submit(prepare): (name, submit) for name, prepare, submit in items}
+            submitted = {}
+            for future in concurrent.futures.as_completed(prepared):
+                name, submit = prepared[future]
+                try:
+                    payload = future.result()
+                except Exception as e:
+                    # one failing preparation does not stop the submission of the others
+                    results[name] = (None, f"preparation failed: {e!r}")
+                    if on_result is not None:
+                        on_result(name, None, results[name][1])
+                    continue
+                if payload is None:
+                    continue
+                submitted[submitter.submit(self._submit, name, submit, payload, on_result)] = name
+            for future in concurrent.futures.as_completed(submitted):
+                results[submitted[future]] = future.result()
+        return results
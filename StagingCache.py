@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# node-local staging of the inputs of ensemble members, shared by the members on a node in a size bounded LRU cache
+
+import argparse
+import fcntl
+import hashlib
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+
+from ruamel.yaml import ruamel
+
+INDEX_DB = "staging.sqlite"
+LOCK_FILE = "staging.lock"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    source TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    linked INTEGER NOT NULL,
+    nlink INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+"""
+
+
+class StagingCache:
+    """Copies of input files in a node-local directory, shared by all members staging from it.
+
+    The cache is protected by a lock file, copies are made and evicted while holding it. Members do not use cache
+    entries directly but hard links of them in their own member directory, so an entry with more links than it had
+    when staged is in use and never evicted. Least recently used entries are evicted to keep the size of the copies
+    below capacity bytes. Sources on the same filesystem as the cache are hard-linked instead of copied and not
+    counted. Entries are staged again if size or mtime of their source changed.
+    """
+
+    def __init__(self, cachedir, capacity):
+        self.cachedir = os.path.abspath(cachedir)
+        self.capacity = capacity
+        os.makedirs(os.path.join(self.cachedir, "files"), exist_ok=True)
+        os.makedirs(os.path.join(self.cachedir, "members"), exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.cachedir, INDEX_DB), timeout=60)
+        self.connection.executescript(SCHEMA)
+        self.hits = 0
+        self.staged = 0
+        self.evicted = 0
+        self.skipped = 0
+        self.bytes = 0
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _lock(self):
+        lock = open(os.path.join(self.cachedir, LOCK_FILE), "a")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _in_use(self, path, nlink):
+        try:
+            return os.stat(path).st_nlink > nlink
+        except FileNotFoundError:
+            return False
+
+    def _evict(self, needed):
+        """Evict least recently used entries not in use until needed bytes fit, return whether they fit."""
+        used = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries WHERE linked = 0").fetchone()[0]
+        if used + needed <= self.capacity:
+            return True
+        for source, path, size, nlink in self.connection.execute(
+                "SELECT source, path, size, nlink FROM entries WHERE linked = 0 ORDER BY used").fetchall():
+            if self._in_use(path, nlink):
+                continue
+            self._remove(source, path)
+            self.evicted += 1
+            used -= size
+            if used + needed <= self.capacity:
+                return True
+        return False
+
+    def _remove(self, source, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        with self.connection:
+            self.connection.execute("DELETE FROM entries WHERE source = ?", (source,))
+
+    def _entry(self, source, stat):
+        """Path of the cache entry of source, staged if missing or outdated, None if it does not fit."""
+        row = self.connection.execute(
+            "SELECT path, size, mtime_ns FROM entries WHERE source = ?", (source,)
+        ).fetchone()
+        if row is not None:
+            path, size, mtime_ns = row
+            if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns) and os.path.exists(path):
+                self.hits += 1
+                return path
+            self._remove(source, path)
+        key = hashlib.sha1(source.encode("utf8")).hexdigest()[:16]
+        path = os.path.join(self.cachedir, "files", key + "_" + os.path.basename(source))
+        partial = path + ".partial"
+        # left behind by a member killed while staging
+        if os.path.lexists(partial):
+            os.remove(partial)
+        try:
+            os.link(source, partial)
+            linked = True
+        except OSError:
+            # other filesystem, copy
+            if not self._evict(stat.st_size):
+                self.skipped += 1
+                return None
+            shutil.copyfile(source, partial)
+            linked = False
+            self.bytes += stat.st_size
+        os.replace(partial, path)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (source, path, size, mtime_ns, linked, nlink, used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, path, stat.st_size, stat.st_mtime_ns, int(linked), os.stat(path).st_nlink, time.time()),
+            )
+        self.staged += 1
+        return path
+
+    def member_directory(self, name):
+        return os.path.join(self.cachedir, "members", name)
+
+    def stage(self, sources, name):
+        """Stage sources for member name, return {source: staged path} of the sources staged.
+
+        Sources not fitting into the cache, missing or unreadable are left out and read from their original path.
+        """
+        memberdir = self.member_directory(name)
+        os.makedirs(memberdir, exist_ok=True)
+        staged = {}
+        with self._lock():
+            for source in sources:
+                source = os.path.abspath(source)
+                try:
+                    stat = os.stat(source)
+                    path = self._entry(source, stat)
+                except OSError as e:
+                    print("Staging {} failed, reading it from its original path: {}".format(source, e))
+                    self.skipped += 1
+                    continue
+                if path is None:
+                    continue
+                with self.connection:
+                    self.connection.execute("UPDATE entries SET used = ? WHERE source = ?", (time.time(), source))
+                # named like the entry, sources of the same name in different directories get their own link
+                link = os.path.join(memberdir, os.path.basename(path))
+                if os.path.lexists(link):
+                    os.remove(link)
+                os.link(path, link)
+                staged[source] = link
+        return staged
+
+    def release(self, name):
+        """Remove the member directory of name, its entries can be evicted again."""
+        shutil.rmtree(self.member_directory(name), ignore_errors=True)
+
+    def release_stale(self):
+        """Remove member directories of processes no longer running, left behind by killed members."""
+        membersdir = os.path.join(self.cachedir, "members")
+        for name in os.listdir(membersdir):
+            pid = name.rpartition("_")[2]
+            if not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                self.release(name)
+            except PermissionError:
+                pass
+
+
+def stage_settings(settings_file, cache, name):
+    """Stage the inputs of a settings file, return path of a copy in the member directory referring to the staged
+    inputs. Relative paths are taken from the directory of the settings file, the output file of the copy is made
+    absolute to still be written there, see OutputIndex.output_file."""
+    yaml = ruamel.yaml.YAML()
+    with open(settings_file, "r") as stream:
+        settings = yaml.load(stream)
+    inputs = settings.get("input") or {}
+    settingsdir = os.path.dirname(os.path.abspath(settings_file))
+    sources = {
+        variable: os.path.join(settingsdir, filepath) for variable, filepath in inputs.items()
+        if variable != "model" and isinstance(filepath, str) and filepath
+    }
+    staged = cache.stage(sources.values(), name)
+    for variable, source in sources.items():
+        if os.path.abspath(source) in staged:
+            inputs[variable] = staged[os.path.abspath(source)]
+    output = settings.get("output") or {}
+    if isinstance(output.get("file"), str) and output["file"]:
+        output["file"] = os.path.join(settingsdir, output["file"])
+    staged_settings = os.path.join(cache.member_directory(name), "settings.yml")
+    with open(staged_settings, "w") as stream:
+        yaml.dump(settings, stream)
+    return staged_settings
+
+
+if __name__ == "__main__":
+    # wrapper of a model run, e.g. by local-model or start-model, running command with the staged settings
+    parser = argparse.ArgumentParser(description="Run a command with the inputs of its settings staged node-locally")
+    parser.add_argument(
+        "--cache",
+        type=str,
+        required=True,
+        help="Node-local cache directory, environment variables are expanded, e.g. '$TMPDIR/staging'",
+    )
+    parser.add_argument(
+        "--capacity", type=int, default=50000, help="Size of copies kept in the cache in MB (default: 50000)"
+    )
+    parser.add_argument(
+        "--settings", type=str, required=True, help="Settings file of the run, replaced in command by its staged copy"
+    )
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="Command to run, after --")
+    args = parser.parse_args()
+    if args.command and args.command[0] == "--":
+        args.command = args.command[1:]
+    if not args.command:
+        parser.error("no command given")
+
+    # one member directory per process, pid identifies stale ones
+    member = "{}_{}".format(os.environ.get("SLURM_JOB_ID", "local"), os.getpid())
+    with StagingCache(os.path.expandvars(args.cache), args.capacity * 1024 * 1024) as cache:
+        cache.release_stale()
+        start = time.time()
+        staged_settings = stage_settings(args.settings, cache, member)
+        print("Staged inputs in {:.1f} s: {} from cache, {} staged ({:.0f} MB copied), {} evicted, {} not staged"
+              .format(time.time() - start, cache.hits, cache.staged, cache.bytes / 1024 / 1024, cache.evicted,
+                      cache.skipped))
+        command = [staged_settings if part == args.settings else part for part in args.command]
+        try:
+            exitcode = subprocess.call(command)
+        finally:
+            cache.release(member)
+    sys.exit(exitcode if exitcode >= 0 else 128 - exitcode)
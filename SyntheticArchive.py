@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#  imports
+
+# synthetic climate archive of empty files following ISIMIP3b or CMIP6 naming, for benchmarks without real data
+
+import argparse
+import itertools
+import os
+import time
+
+# filename templates, recognized by the conventions of the same name in NamingConventions.py
+FILENAMES = {
+    "isimip3b": "{model}_r1i1p1f1_w5e5_{scenario}_{variable}_global_daily_{start_year}_{end_year}.nc",
+    "cmip6": "{variable}_day_{model}_{scenario}_r1i1p1f1_gn_{start_year}0101-{end_year}1231.nc",
+}
+
+# directory levels of the archive, the first depth levels are used
+LEVELS = ("scenario", "model", "variable")
+
+SCENARIOS = ["historical", "ssp126", "ssp370", "ssp585"]
+VARIABLES = ["pr", "prsn", "tas"]
+
+
+def model_names(count, convention="isimip3b"):
+    # ISIMIP3b uses lower case model names
+    if convention == "isimip3b":
+        return ["model{:03d}-esm".format(number) for number in range(count)]
+    return ["MODEL{:03d}-ESM".format(number) for number in range(count)]
+
+
+def periods(first_year, last_year, length):
+    """Consecutive (start year, end year) of length years from first_year, the last one cut at last_year."""
+    return [
+        (start_year, min(start_year + length - 1, last_year)) for start_year in range(first_year, last_year + 1, length)
+    ]
+
+
+def files(convention, models, scenarios, variables, timeperiods, depth=2):
+    """Yield (directory relative to root, filename) of all combinations."""
+    template = FILENAMES[convention]
+    for model, scenario, variable, (start_year, end_year) in itertools.product(
+            models, scenarios, variables, timeperiods):
+        fields = {"model": model, "scenario": scenario, "variable": variable}
+        directory = os.path.join(*[fields[level] for level in LEVELS[:depth]]) if depth else ""
+        yield directory, template.format(start_year=start_year, end_year=end_year, **fields)
+
+
+def generate(
+        root,
+        convention="isimip3b",
+        models=10,
+        scenarios=SCENARIOS,
+        variables=VARIABLES,
+        first_year=1850,
+        last_year=2099,
+        period=10,
+        depth=2,
+        limit=None,
+):
+    """Create empty files of all combinations of models, scenarios, variables and periods below root.
+
+    Models may be given as number or list of names. Returns the number of files created, at most limit.
+    """
+    if isinstance(models, int):
+        models = model_names(models, convention)
+    created = 0
+    directories = set()
+    for directory, filename in files(
+            convention, models, scenarios, variables, periods(first_year, last_year, period), depth):
+        if limit is not None and created >= limit:
+            break
+        path = os.path.join(root, directory)
+        if directory not in directories:
+            os.makedirs(path, exist_ok=True)
+            directories.add(directory)
+        open(os.path.join(path, filename), "w").close()
+        created += 1
+    return created
+
+
+def models_for(files_wanted, scenarios=SCENARIOS, variables=VARIABLES, first_year=1850, last_year=2099, period=10):
+    """Number of models giving at least files_wanted files for the other axes."""
+    per_model = len(scenarios) * len(variables) * len(periods(first_year, last_year, period))
+    return max(1, -(-files_wanted // per_model))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic archive of empty climate data files")
+    parser.add_argument("root", type=str, help="Directory to create the archive in")
+    parser.add_argument(
+        "--convention", type=str, default="isimip3b", choices=sorted(FILENAMES), help="Naming (default: isimip3b)"
+    )
+    parser.add_argument("--models", type=int, default=10, help="Number of models (default: 10)")
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        type=str,
+        default=SCENARIOS,
+        help="Scenarios (default: historical ssp126 ssp370 ssp585)",
+    )
+    parser.add_argument("--variables", nargs="+", type=str, default=VARIABLES, help="Variables (default: pr prsn tas)")
+    parser.add_argument("--first-year", type=int, default=1850, help="First year of the first period (default: 1850)")
+    parser.add_argument("--last-year", type=int, default=2099, help="Last year of the last period (default: 2099)")
+    parser.add_argument("--period", type=int, default=10, help="Years per file (default: 10)")
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=2,
+        choices=range(len(LEVELS) + 1),
+        help="Directory levels scenario/model/variable above the files (default: 2)",
+    )
+    parser.add_argument(
+        "--files", type=int, help="Number of files to create, models are added as needed (default: all combinations)"
+    )
+    args = parser.parse_args()
+
+    if args.files:
+        args.models = models_for(
+            args.files, args.scenarios, args.variables, args.first_year, args.last_year, args.period
+        )
+    start = time.perf_counter()
+    created = generate(
+        args.root,
+        convention=args.convention,
+        models=args.models,
+        scenarios=args.scenarios,
+        variables=args.variables,
+        first_year=args.first_year,
+        last_year=args.last_year,
+        period=args.period,
+        depth=args.depth,
+        limit=args.files,
+    )
+    print("created {} files below {} in {:.1f} s".format(created, args.root, time.perf_counter() - start))
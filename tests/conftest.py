@@ -0,0 +1,5 @@
+# scripts of the repository are plain modules in its root directory
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,148 @@
+# header reading of NetCDFHeader.py and byte-wise merging of OutputMerge.py on synthetic classic NetCDF files
+
+import os
+import struct
+
+import pytest
+
+import NetCDFHeader
+import OutputMerge
+
+NC_CHAR, NC_FLOAT, NC_DOUBLE = 2, 5, 6
+
+
+def _padded(data):
+    return data + b"\0" * (-len(data) % 4)
+
+
+def _name(name):
+    return struct.pack(">i", len(name)) + _padded(name.encode())
+
+
+def _attributes(attributes):
+    if not attributes:
+        return struct.pack(">ii", 0, 0)
+    data = struct.pack(">ii", 12, len(attributes))
+    for name, value in attributes.items():
+        data += _name(name) + struct.pack(">ii", NC_CHAR, len(value)) + _padded(value.encode())
+    return data
+
+
+def write_classic(path, times, lat=3, record=True, units="days since 2000-01-01", calendar="noleap"):
+    """Write a CDF-1 file with variables lat(lat), time(time) and pr(time, lat), pr being time + lat / 10.
+
+    With record time is the unlimited dimension and time and pr are record variables, otherwise time is a fixed
+    dimension as written by xarray by default.
+    """
+    steps = len(times)
+    dimensions = [("time", 0 if record else steps), ("lat", lat)]
+    time_attributes = {"units": units, "calendar": calendar}
+    # (name, dimension ids, attributes, type, vsize), vsize of record variables is the size of one record
+    variables = [
+        ("lat", [1], {}, NC_DOUBLE, lat * 8),
+        ("time", [0], time_attributes, NC_DOUBLE, 8 if record else steps * 8),
+        ("pr", [0, 1], {}, NC_FLOAT, lat * 4 if record else steps * lat * 4),
+    ]
+
+    def header(begins):
+        data = b"CDF\x01" + struct.pack(">i", steps if record else 0)
+        data += struct.pack(">ii", 10, len(dimensions))
+        for name, length in dimensions:
+            data += _name(name) + struct.pack(">i", length)
+        data += _attributes({})
+        data += struct.pack(">ii", 11, len(variables))
+        for (name, dimids, attributes, nc_type, vsize), begin in zip(variables, begins):
+            data += _name(name) + struct.pack(">i", len(dimids)) + b"".join(struct.pack(">i", i) for i in dimids)
+            data += _attributes(attributes) + struct.pack(">iii", nc_type, vsize, begin)
+        return data
+
+    size = len(header([0] * len(variables)))
+    begins = []
+    for variable in variables:
+        begins.append(size)
+        size += variable[4]
+    lats = b"".join(struct.pack(">d", i) for i in range(lat))
+    if record:
+        data = lats + b"".join(
+            struct.pack(">d", t) + b"".join(struct.pack(">f", t + i / 10) for i in range(lat)) for t in times
+        )
+    else:
+        data = lats + b"".join(struct.pack(">d", t) for t in times)
+        data += b"".join(struct.pack(">f", t + i / 10) for t in times for i in range(lat))
+    with open(path, "wb") as stream:
+        stream.write(header(begins) + data)
+
+
+def record_values(path, name):
+    """Values of record variable name in path, read via its offset and the record size of NetCDFHeader."""
+    layout = NetCDFHeader.layout(path)
+    with open(path, "rb") as stream:
+        data = stream.read()
+    recsize = layout["recsize"]
+    offset = 0 if name == "time" else 8
+    fmt = ">d" if name == "time" else ">3f"
+    return [
+        struct.unpack_from(fmt, data, layout["records"] + record * recsize + offset)
+        for record in range(layout["numrecs"])
+    ]
+
+
+@pytest.mark.parametrize("record", [True, False])
+def test_read(tmp_path, record):
+    path = str(tmp_path / "output_model_20002001.nc")
+    write_classic(path, [10.0, 11.0, 12.0], record=record)
+    summary = NetCDFHeader.read(path)
+    assert summary["variables"] == ["lat", "pr", "time"]
+    assert summary["time"] == (10.0, 12.0)
+    assert summary["steps"] == 3
+    assert (summary["units"], summary["calendar"]) == ("days since 2000-01-01", "noleap")
+
+
+def test_read_truncated(tmp_path):
+    path = str(tmp_path / "output.nc")
+    write_classic(path, [0.0, 1.0])
+    with open(path, "r+b") as stream:
+        stream.truncate(os.path.getsize(path) - 4)
+    with pytest.raises(NetCDFHeader.HeaderError, match="truncated"):
+        NetCDFHeader.read(path)
+
+
+def test_merge_classic(tmp_path):
+    paths = []
+    # given out of order, merged by first time value
+    for first in (3, 0, 6):
+        paths.append(str(tmp_path / "output_model_{}.nc".format(first)))
+        write_classic(paths[-1], [first, first + 1.0, first + 2.0])
+    output = str(tmp_path / "merged.nc")
+    result = OutputMerge.merge(paths, output)
+    assert (result["files"], result["steps"], result["method"]) == (3, 9, "classic")
+    assert NetCDFHeader.read(output)["time"] == (0.0, 8.0)
+    assert [time for time, in record_values(output, "time")] == list(range(9))
+    assert record_values(output, "pr")[4] == pytest.approx((4.0, 4.1, 4.2))
+    assert os.path.getsize(output) == NetCDFHeader.layout(output)["end"]
+    assert not os.path.exists(output + ".partial")
+
+
+def test_merge_classic_fixed_time(tmp_path):
+    # equal headers of files with time as fixed dimension must not be concatenated as records
+    paths = []
+    for first in (0, 3):
+        paths.append(str(tmp_path / "output_model_{}.nc".format(first)))
+        write_classic(paths[-1], [first, first + 1.0, first + 2.0], record=False)
+    output = str(tmp_path / "merged.nc")
+    assert OutputMerge._merge_classic(paths, output, OutputMerge.CHUNK_BYTES) is None
+    if OutputMerge.netCDF4 is None:
+        with pytest.raises(OutputMerge.MergeError, match="netCDF4 not installed"):
+            OutputMerge.merge(paths, output)
+        assert not os.path.exists(output)
+    else:
+        assert OutputMerge.merge(paths, output)["method"] == "netCDF4"
+        assert NetCDFHeader.read(output)["steps"] == 6
+
+
+def test_merge_gap(tmp_path):
+    paths = [str(tmp_path / "a.nc"), str(tmp_path / "b.nc")]
+    write_classic(paths[0], [0.0, 1.0, 2.0])
+    write_classic(paths[1], [6.0, 7.0, 8.0])
+    with pytest.raises(OutputMerge.MergeError, match="gap"):
+        OutputMerge.merge(paths, str(tmp_path / "merged.nc"))